@@ -1,16 +1,16 @@
 import requests
 import re
 
-def get_apple_artist_image(artist_id, region="us", width=3000, height=3000):
-    url = f"https://music.apple.com/{region}/artist/{artist_id}"
-    response = requests.get(url)
-    html = response.text
+from page_extract import fetch_tag
 
-    match = re.search(r'<meta property="og:image" content="(https://[^"]+)"', html)
-    if not match:
+def get_apple_artist_image(artist_id, region="us", width=3000, height=3000, session=requests):
+    url = f"https://music.apple.com/{region}/artist/{artist_id}"
+    # The og:image tag is in <head>, so only the first chunk or two of the page is read
+    meta, _ = fetch_tag(session, url, "meta", {"property": "og:image"})
+    og_image = meta.get("content") if meta else None
+    if not og_image or not og_image.startswith("https://"):
         raise Exception("og:image tag not found")
 
-    og_image = match.group(1)
     # Replace size pattern with desired dimensions and style
     high_res = re.sub(r'[\d]+x[\d]+[a-z]*', f"{width}x{height}cc", og_image)
     return high_res
@@ -22,4 +22,4 @@ if __name__ == "__main__":
         print("Usage: python script.py <artist_id>")
         sys.exit(1)
     artist_id_input = sys.argv[1]
-    print(get_apple_artist_image(artist_id_input))
\ No newline at end of file
+    print(f"ArtistArt:{get_apple_artist_image(artist_id_input)}")
\ No newline at end of file
@@ -1,52 +1,35 @@
 import requests
-import re
-from bs4 import BeautifulSoup
 import argparse
 import json
 
-def get_album_video_urls(album_id):
+from hls import best_variant, parse_master_playlist
+from page_extract import TIMEOUT, fetch_tag
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0"
+}
+
+def get_album_video_playlist(album_id, session=requests):
+    """All variants of the album's animated artwork master playlist, [] if it has none."""
     url = f"https://music.apple.com/de/album/{album_id}"
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
-    resp = requests.get(url, headers=headers)
-    soup = BeautifulSoup(resp.text, "html.parser")
-    video_tag = soup.find("amp-ambient-video")
-    if not video_tag or "src" not in video_tag.attrs:
-        m3u8_url = None
-    else:
-        m3u8_url = video_tag["src"]
-
-    avc_url = None
-    hevc_url = None
-
-    if m3u8_url:
-        m3u8_content = requests.get(m3u8_url, headers=headers).text
-
-        max_avc_bw = 0
-        max_hevc_bw = 0
-
-        stream_pattern = re.compile(r'#EXT-X-STREAM-INF:(.*?)\n(https://[^\s]+)')
-        matches = stream_pattern.findall(m3u8_content)
-
-        for attributes, stream_url in matches:
-            resolution_match = re.search(r'RESOLUTION=(\d+x\d+)', attributes)
-            codec_match = re.search(r'CODECS="([^"]+)"', attributes)
-            bandwidth_match = re.search(r'BANDWIDTH=(\d+)', attributes)
-            if resolution_match and codec_match and bandwidth_match:
-                resolution = resolution_match.group(1)
-                codec = codec_match.group(1)
-                bandwidth = int(bandwidth_match.group(1))
-                if resolution == "1080x1080" and "avc1" in codec and bandwidth > max_avc_bw:
-                    max_avc_bw = bandwidth
-                    avc_url = stream_url
-                elif resolution == "2160x2160" and "hvc1" in codec and bandwidth > max_hevc_bw:
-                    max_hevc_bw = bandwidth
-                    hevc_url = stream_url
-
-    # Replaced artwork logic: Bendodson API with dynamic best uncompressed selection
+    # Stops reading the page as soon as the video tag has gone by
+    video_tag, _ = fetch_tag(session, url, "amp-ambient-video", headers=HEADERS, timeout=TIMEOUT)
+    m3u8_url = video_tag.get("src") if video_tag else None
+    if not m3u8_url:
+        return []
+
+    resp = session.get(m3u8_url, headers=HEADERS, timeout=TIMEOUT)
+    return parse_master_playlist(resp.text, resp.url or m3u8_url)
+
+def get_album_video_variants(album_id, session=requests, max_height=None):
+    variants = get_album_video_playlist(album_id, session)
+    # Highest resolution, then bandwidth, of each codec up to max_height (AVC tops out at 1080², HEVC at 2160²)
+    return best_variant(variants, "avc", max_height), best_variant(variants, "hevc", max_height)
+
+def get_uncompressed_artwork(album_id, session=None):
+    # Bendodson API with dynamic best uncompressed selection
     artwork_url = None
-    session = requests.Session()
+    session = session or requests.Session()
     bendodson_url = "https://itunesartwork.bendodson.com/api.php"
     params = {
         "query": album_id,
@@ -56,11 +39,11 @@ def get_album_video_urls(album_id):
     }
 
     try:
-        response1 = session.get(bendodson_url, params=params, headers=headers)
+        response1 = session.get(bendodson_url, params=params, headers=HEADERS, timeout=TIMEOUT)
         response1.raise_for_status()
         url2 = response1.json()["url"]
 
-        response2 = session.get(url2, headers=headers)
+        response2 = session.get(url2, headers=HEADERS, timeout=TIMEOUT)
         response2.raise_for_status()
 
         text = response2.text
@@ -73,7 +56,7 @@ def get_album_video_urls(album_id):
             "type": "data",
             "entity": "album"
         }
-        response3 = session.post(bendodson_url, data=post_data, headers=headers)
+        response3 = session.post(bendodson_url, data=post_data, headers=HEADERS, timeout=TIMEOUT)
         response3.raise_for_status()
         final_data = response3.json()
 
@@ -90,6 +73,50 @@ def get_album_video_urls(album_id):
     except Exception as e:
         print(f"Failed to fetch uncompressed artwork: {e}")
 
+    return artwork_url
+
+def lookup_album_id(track_id, session=requests):
+    track_lookup = session.get(f"https://itunes.apple.com/lookup?id={track_id}", timeout=TIMEOUT)
+    if not track_lookup.ok:
+        return None
+    results = track_lookup.json().get("results", [])
+    if not results:
+        return None
+    return results[0].get("collectionId")
+
+def search_track(name, artist, album=None, session=requests):
+    # Used when only name/artist/album are known (e.g. the upcoming track from AppleScript)
+    term = f"{artist} {name}"
+    resp = session.get(
+        "https://itunes.apple.com/search",
+        params={"term": term, "entity": "song", "limit": 10},
+        timeout=TIMEOUT
+    )
+    if not resp.ok:
+        return None
+    results = resp.json().get("results", [])
+    best = None
+    for result in results:
+        if result.get("trackName", "").lower() != name.lower():
+            continue
+        if result.get("artistName", "").lower() != artist.lower():
+            continue
+        if album and result.get("collectionName", "").lower() == album.lower():
+            best = result
+            break
+        best = best or result
+    if best is None:
+        return None
+    return {
+        "track_id": best.get("trackId"),
+        "album_id": best.get("collectionId"),
+        "artist_id": best.get("artistId"),
+    }
+
+def get_album_video_urls(album_id, session=None):
+    session = session or requests.Session()
+    avc_url, hevc_url = get_album_video_variants(album_id, session)
+    artwork_url = get_uncompressed_artwork(album_id, session)
     return avc_url, hevc_url, artwork_url
 
 if __name__ == "__main__":
@@ -102,17 +129,11 @@ if __name__ == "__main__":
         parser.error("Either --album-id or --track-id must be provided.")
 
     if args.track_id:
-        track_lookup = requests.get(f"https://itunes.apple.com/lookup?id={args.track_id}")
-        if track_lookup.ok:
-            results = track_lookup.json().get("results", [])
-            if results:
-                args.album_id = results[0].get("collectionId")
-                print(f"Resolved track ID {args.track_id} to album ID {args.album_id}")
-            else:
-                print("No album found for given track ID.")
-                exit(1)
+        args.album_id = lookup_album_id(args.track_id)
+        if args.album_id:
+            print(f"Resolved track ID {args.track_id} to album ID {args.album_id}")
         else:
-            print("Failed to fetch album for track ID.")
+            print("No album found for given track ID.")
             exit(1)
 
     album_id = args.album_id
@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_FILE = "artwork_cache.sqlite3"
+
+# Default lifetimes in seconds per kind of entry
+DEFAULT_TTLS = {
+    "album": 30 * 24 * 3600,
+    "artist": 7 * 24 * 3600,
+    "track": 90 * 24 * 3600,
+    "search": 30 * 24 * 3600,
+    "lyrics": 30 * 24 * 3600,
+}
+# Albums without animated artwork are re-checked sooner, Apple adds them over time
+NEGATIVE_TTL = 24 * 3600
+
+
+class ArtworkCache:
+    """On-disk cache for resolved artwork URLs, keyed by (kind, id).
+
+    kind is "album" (album ID -> AVC/HEVC/artwork URLs), "artist"
+    (artist ID -> artist art URL), "track" (track ID -> collectionId),
+    "search" (name/artist/album -> store IDs) or "lyrics" (track -> LRC text).
+    A stored value of None is a negative entry. Entries expire per TTL and
+    the least recently used ones are evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_entries=5000, ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        # Access times are kept in memory and flushed with the next write, so hits never touch the disk
+        self._touched = {}
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT,"
+            " expires REAL NOT NULL, accessed REAL NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, kind, key):
+        """Returns (hit, value). A hit with value None is a cached negative result."""
+        key = str(key)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is None or row[1] < now:
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return False, None
+            self._touched[(kind, key)] = now
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def put(self, kind, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttls.get(kind, DEFAULT_TTLS["album"])
+        now = time.time()
+        encoded = json.dumps(value) if value is not None else None
+        # The connection commits on success and rolls back if any statement fails, so it never stays mid-transaction
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._flush_touched()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (kind, str(key), encoded, now + ttl, now)
+            )
+            self._evict(now)
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?",
+                [(t, kind, key) for (kind, key), t in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM entries WHERE expires < ?", (now,))
+        count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": entries, "hits": dict(self.hits), "misses": dict(self.misses)}
+
+    def close(self):
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._flush_touched()
+            self._db.close()
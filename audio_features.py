@@ -0,0 +1,323 @@
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from events import TooManyClients
+
+# Frame: sequence (uint32), rms (float16), onset strength (float16), flags (uint8, bit 0 = onset), padding,
+# then one float16 per band. Bands, rms and strength are scaled to roughly 0..1.
+FRAME_HEADER = struct.Struct("<Ieeb3x")
+FLAG_ONSET = 1
+
+DEFAULT_AUDIO_FEATURES = {
+    "enabled": False,
+    # "sounddevice" captures from `device` (an input, or a loopback device such as BlackHole); "synthetic" is a test signal
+    "source": "sounddevice",
+    "device": None,
+    "bands": 32,
+    "fps": 60,
+    # Open /audio/features streams allowed at once, each holds a server thread
+    "max_clients": 4,
+}
+
+
+def audio_feature_settings(settings):
+    return {**DEFAULT_AUDIO_FEATURES, **settings.get("audio_features", {})}
+
+
+class SyntheticSource:
+    """Test signal: a decaying kick on every beat over a quiet chord.
+
+    With realtime=False blocks are produced as fast as they are consumed,
+    for benchmarks.
+    """
+
+    def __init__(self, samplerate=48000, blocksize=512, bpm=120, realtime=True):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.bpm = bpm
+        self.realtime = realtime
+        self._closed = threading.Event()
+
+    def block(self, start):
+        t = (start + np.arange(self.blocksize)) / self.samplerate
+        beat = 60.0 / self.bpm
+        since_beat = t % beat
+        kick = np.sin(2 * np.pi * (55 + 90 * np.exp(-since_beat * 30)) * since_beat) * np.exp(-since_beat * 12)
+        chord = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.18, 329.63, 3520.0)) * 0.05
+        return (0.8 * kick + chord).astype(np.float32)
+
+    def blocks(self):
+        position = 0
+        next_time = time.monotonic()
+        while not self._closed.is_set():
+            yield self.block(position)
+            position += self.blocksize
+            if self.realtime:
+                next_time += self.blocksize / self.samplerate
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def close(self):
+        self._closed.set()
+
+
+class SoundDeviceSource:
+    """Mono blocks from a sounddevice input. `device` is a name or index, None for the default input."""
+
+    def __init__(self, device=None, samplerate=None, blocksize=512):
+        import sounddevice as sd
+        self._sd = sd
+        self.device = device
+        info = sd.query_devices(device, kind="input")
+        self.samplerate = int(samplerate or info["default_samplerate"])
+        self.blocksize = blocksize
+        self._queue = queue.Queue(maxsize=64)
+        self._closed = threading.Event()
+
+    def _callback(self, data, frames, time_info, status):
+        try:
+            self._queue.put_nowait(data.mean(axis=1).astype(np.float32))
+        except queue.Full:
+            pass
+
+    def blocks(self):
+        with self._sd.InputStream(device=self.device, channels=1, samplerate=self.samplerate,
+                                  blocksize=self.blocksize, callback=self._callback):
+            while not self._closed.is_set():
+                try:
+                    yield self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+
+    def close(self):
+        self._closed.set()
+
+
+def make_source(prefs):
+    if prefs["source"] == "synthetic":
+        return SyntheticSource()
+    return SoundDeviceSource(prefs["device"])
+
+
+def band_edges(fft_size, samplerate, bands, low=30.0, high=16000.0):
+    """FFT bin index where each of `bands` log-spaced bands starts, plus the end bin."""
+    nyquist = samplerate / 2
+    high = min(high, nyquist)
+    freqs = np.geomspace(low, high, bands + 1)
+    edges = np.round(freqs / nyquist * (fft_size // 2)).astype(int)
+    # Low bands are narrower than one bin at small FFT sizes; give each at least one
+    edges = np.maximum(edges, np.arange(bands + 1) + 1)
+    for i in range(1, len(edges)):
+        edges[i] = max(edges[i], edges[i - 1] + 1)
+    return edges
+
+
+class AudioAnalyzer:
+    """Band energies, RMS and onsets from an audio source, pushed to clients as binary frames.
+
+    A reader thread copies source blocks into a ring buffer; an analysis
+    thread runs at `fps` while anyone is subscribed, windows the newest
+    fft_size samples, and computes everything in a few NumPy passes:
+    log-spaced band means via one reduceat, RMS, and spectral flux against
+    an adaptive median threshold for onsets. Each frame is packed once and
+    handed to every client queue; slow clients lose old frames, not new ones.
+    At most max_clients streams are served; stop() ends them, and so does
+    a source that delivers nothing for `timeout` seconds.
+    """
+
+    def __init__(self, source, bands=32, fps=60, fft_size=2048, client_queue_size=8, max_clients=4, timeout=5.0):
+        self.source = source
+        self.samplerate = source.samplerate
+        self.bands = bands
+        self.fps = fps
+        self.fft_size = fft_size
+        self.client_queue_size = client_queue_size
+        self.max_clients = max_clients
+        self.timeout = timeout
+        self.frame_size = FRAME_HEADER.size + 2 * bands
+
+        self._ring = np.zeros(fft_size * 4, dtype=np.float32)
+        self._write = 0
+        self._ring_lock = threading.Lock()
+        self._window = np.hanning(fft_size).astype(np.float32)
+        edges = band_edges(fft_size, self.samplerate, bands)
+        self._band_starts = edges[:-1]
+        self._band_widths = np.diff(edges).astype(np.float32)
+        self._band_stop = edges[-1]
+        self._previous = np.zeros(bands, dtype=np.float32)
+        self._flux_history = np.zeros(fps, dtype=np.float32)
+        self._last_onset = 0.0
+        self.sequence = 0
+
+        self._clients = set()
+        self._clients_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._reader = None
+        # monotonic() of the last block from the source; analysing without new blocks would repeat stale audio
+        self._last_feed = None
+
+    def feed(self, block):
+        self._last_feed = time.monotonic()
+        with self._ring_lock:
+            n = len(block)
+            size = len(self._ring)
+            if n >= size:
+                self._ring[:] = block[-size:]
+                self._write = 0
+                return
+            end = self._write + n
+            if end <= size:
+                self._ring[self._write:end] = block
+            else:
+                split = size - self._write
+                self._ring[self._write:] = block[:split]
+                self._ring[:n - split] = block[split:]
+            self._write = end % size
+
+    def _latest(self):
+        with self._ring_lock:
+            return np.roll(self._ring, -self._write)[-self.fft_size:]
+
+    def analyze(self, now=None):
+        """Compute one frame from the newest samples. Returns (bands, rms, flux, onset)."""
+        now = time.monotonic() if now is None else now
+        samples = self._latest()
+        rms = float(np.sqrt(np.mean(samples * samples)))
+        spectrum = np.abs(np.fft.rfft(samples * self._window))
+        power = spectrum[:self._band_stop] ** 2
+        energy = np.add.reduceat(power, self._band_starts) / self._band_widths
+        # dB relative to a full-scale sine through the Hann window, mapped from -80..0 dB onto 0..1
+        db = 10 * np.log10(energy / (self.fft_size * 0.25) ** 2 + 1e-12)
+        bands = np.clip((db + 80) / 80, 0, 1).astype(np.float32)
+
+        flux = float(np.maximum(bands - self._previous, 0).sum())
+        self._previous = bands
+        threshold = float(np.median(self._flux_history)) * 1.5 + 0.3
+        self._flux_history = np.roll(self._flux_history, -1)
+        self._flux_history[-1] = flux
+        onset = flux > threshold and now - self._last_onset > 0.1
+        if onset:
+            self._last_onset = now
+        return bands, rms, flux, onset
+
+    def pack(self, bands, rms, flux, onset):
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        header = FRAME_HEADER.pack(self.sequence, min(rms, 1.0), min(flux / self.bands * 4, 1.0), FLAG_ONSET if onset else 0)
+        return header + bands.astype("<f2").tobytes()
+
+    def publish(self, frame):
+        with self._clients_lock:
+            for client in list(self._clients):
+                try:
+                    client.put_nowait(frame)
+                except queue.Full:
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        pass
+                    client.put_nowait(frame)
+
+    def subscribe(self):
+        """New client queue; raises TooManyClients when max_clients streams are open or after stop()."""
+        client = queue.Queue(maxsize=self.client_queue_size)
+        with self._clients_lock:
+            if self._stopped.is_set() or len(self._clients) >= self.max_clients:
+                raise TooManyClients(f"{len(self._clients)} audio feature streams open")
+            self._clients.add(client)
+        self._wake.set()
+        return client
+
+    def unsubscribe(self, client):
+        with self._clients_lock:
+            self._clients.discard(client)
+
+    def stream(self, client=None):
+        client = client or self.subscribe()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    frame = client.get(timeout=self.timeout)
+                except queue.Empty:
+                    print(f"⚠️ No audio frames for {self.timeout:g} s, closing stream")
+                    return
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(client)
+
+    def _read(self):
+        try:
+            for block in self.source.blocks():
+                self.feed(block)
+                if self._stopped.is_set():
+                    break
+        except Exception as e:
+            print(f"❌ Audio capture stopped: {e}")
+
+    def stalled(self, now=None):
+        """True once the reader thread has exited or the source has delivered nothing for `timeout` seconds."""
+        now = time.monotonic() if now is None else now
+        if self._reader is None or not self._reader.is_alive():
+            return True
+        return self._last_feed is None or now - self._last_feed > self.timeout
+
+    def run(self):
+        interval = 1.0 / self.fps
+        next_time = time.monotonic()
+        while not self._stopped.is_set():
+            if not self._clients:
+                # Nothing to do until someone listens
+                self._wake.wait()
+                self._wake.clear()
+                next_time = time.monotonic()
+                continue
+            if self.stalled():
+                # End the open streams instead of repeating the last audio forever
+                print(f"⚠️ No audio from {type(self.source).__name__} for {self.timeout:g} s, closing streams")
+                self.publish(None)
+            else:
+                try:
+                    self.publish(self.pack(*self.analyze()))
+                except Exception as e:
+                    print(f"❌ Audio analysis failed: {e}")
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+
+    def start(self):
+        # Counts as fed at start, so the source gets `timeout` seconds to deliver its first block
+        self._last_feed = time.monotonic()
+        self._reader = threading.Thread(target=self._read, name="audio-reader", daemon=True)
+        self._reader.start()
+        threading.Thread(target=self.run, daemon=True).start()
+        print(f"🎚️ Audio features: {self.bands} bands at {self.fps} fps from {type(self.source).__name__}")
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self.source.close()
+        # None ends each open stream right away
+        self.publish(None)
+
+
+if __name__ == "__main__":
+    analyzer = AudioAnalyzer(SyntheticSource())
+    analyzer.start()
+    client = analyzer.subscribe()
+    for _ in range(120):
+        frame = client.get()
+        sequence, rms, strength, flags = FRAME_HEADER.unpack_from(frame)
+        bands = np.frombuffer(frame, dtype="<f2", offset=FRAME_HEADER.size)
+        meter = "".join(" ▁▂▃▄▅▆▇█"[min(8, int(b * 9))] for b in bands)
+        print(f"{sequence:5d} rms={rms:.2f} {'●' if flags & FLAG_ONSET else ' '} {meter}")
+    analyzer.stop()
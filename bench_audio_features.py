@@ -0,0 +1,63 @@
+import argparse
+import sys
+import time
+
+from audio_features import AudioAnalyzer, SyntheticSource
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audio feature analyzer on the synthetic source.")
+    parser.add_argument("--seconds", type=float, default=30, help="Length of synthetic audio to analyse.")
+    parser.add_argument("--bands", type=int, default=32)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--fft-size", type=int, default=2048)
+    parser.add_argument("--bpm", type=int, default=120)
+    parser.add_argument("--max-frame-us", type=float, default=0,
+                        help="Exit with status 1 if p99 frame time is above this (for CI).")
+    args = parser.parse_args()
+
+    source = SyntheticSource(bpm=args.bpm, realtime=False)
+    analyzer = AudioAnalyzer(source, bands=args.bands, fps=args.fps, fft_size=args.fft_size)
+    samples_per_frame = source.samplerate / args.fps
+    frames = int(args.seconds * args.fps)
+
+    blocks = source.blocks()
+    buffered = 0.0
+    timings = []
+    onsets = 0
+    for i in range(frames):
+        # Feed exactly the audio that arrives between two frames in real time
+        buffered += samples_per_frame
+        while buffered >= source.blocksize:
+            analyzer.feed(next(blocks))
+            buffered -= source.blocksize
+        start = time.perf_counter_ns()
+        bands, rms, flux, onset = analyzer.analyze(now=i / args.fps)
+        analyzer.pack(bands, rms, flux, onset)
+        timings.append(time.perf_counter_ns() - start)
+        onsets += onset
+    source.close()
+
+    timings.sort()
+    budget_us = 1e6 / args.fps
+    p50 = percentile(timings, 50) / 1000
+    p99 = percentile(timings, 99) / 1000
+    expected = int(args.seconds * args.bpm / 60)
+    print(f"{frames} frames, {args.bands} bands, FFT {args.fft_size}, {analyzer.frame_size} bytes/frame "
+          f"({analyzer.frame_size * args.fps / 1024:.1f} KiB/s per client)")
+    print(f"frame time: p50 {p50:.1f} us, p99 {p99:.1f} us ({p99 / budget_us * 100:.2f}% of the {budget_us:.0f} us budget)")
+    print(f"onsets: {onsets} detected, {expected} beats in the signal")
+
+    if args.max_frame_us and p99 > args.max_frame_us:
+        print(f"❌ p99 frame time above {args.max_frame_us:.0f} us")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import random
+import re
+import sys
+import time
+
+from logparser import iter_events, parse_line, file_lines
+
+NOISE = [
+    "{ts}  localhost Music[812]: (MediaToolbox) [com.apple.coremedia:fig] <<<< FigAudioQueue >>>> fpaq_Prime: primed queue 0x{addr:x} frames {n}",
+    "{ts}  localhost Music[812]: (AudioToolbox) [com.apple.coreaudio:AQ] AQMEIO.cpp:{n} aqmeio@0x{addr:x} IO proc start",
+    "{ts}  localhost Music[812]: (CFNetwork) [com.apple.CFNetwork:Default] Task <{addr:X}>.<{n}> finished successfully",
+    "{ts}  localhost Music[812]: (MediaPlayer) [com.apple.amp.mediaplayer:Playback] Queue item changed to index {n}",
+    "{ts}  localhost Music[812]: (MediaToolbox) [com.apple.coremedia:fig] <<<< FigStreamPlayer >>>> fpfs_ItemProgress: buffered {n} ms",
+]
+STREAM_FORMAT = "{ts}  localhost Music[812]: (MediaToolbox) [com.apple.coremedia:fig] <<<< FigStreamPlayer >>>> fpfs_ReportAudioFormat: [Rendition {rendition}] [BitDepth {bitdepth}] [SampleRate {rate}]"
+NEXT_FORMAT = "{ts}  localhost Music[812]: (MediaToolbox) [com.apple.coremedia:fig] mediaFormatinfo: {{ asbdSampleRate = {rate}.0, channels = 2 }}"
+RATES = [44100, 48000, 88200, 96000, 176400, 192000]
+
+
+def synthetic_corpus(megabytes, match_ratio=0.02, seed=1):
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    target = megabytes * 1024 * 1024
+    while size < target:
+        ts = f"2025-05-01 12:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(10**6):06d}+0200"
+        roll = rng.random()
+        if roll < match_ratio / 2:
+            line = STREAM_FORMAT.format(ts=ts, rendition=rng.choice(["Lossless", "HiResLossless"]),
+                                        bitdepth=rng.choice([16, 24]), rate=rng.choice(RATES))
+        elif roll < match_ratio:
+            line = NEXT_FORMAT.format(ts=ts, rate=rng.choice(RATES))
+        else:
+            line = rng.choice(NOISE).format(ts=ts, addr=rng.getrandbits(48), n=rng.randrange(10000))
+        line += "\n"
+        lines.append(line)
+        size += len(line)
+    return lines, size
+
+
+def legacy_parse(line):
+    # The pre-parser logic from monitor_sample_rate, kept as the comparison baseline
+    if "FigStreamPlayer" in line and "SampleRate" in line:
+        re.search(r'\[Rendition ([^\]]+)\]', line)
+        re.search(r'\[BitDepth (\d+)\]', line)
+        return re.search(r'\[SampleRate\s+(\d+(?:\.\d+)?)\]', line)
+    elif "mediaFormatinfo" in line and "asbdSampleRate" in line:
+        return re.search(r'asbdSampleRate\s*=\s*([\d.]+)', line)
+    return None
+
+
+def throughput(fn, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            fn(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def event_latencies(lines):
+    matching = [line for line in lines if parse_line(line) is not None]
+    samples = []
+    for line in matching:
+        start = time.perf_counter_ns()
+        parse_line(line)
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    return len(matching), samples
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sample-rate log parser.")
+    parser.add_argument("--file", help="Replay a recorded syslog capture instead of the synthetic corpus.")
+    parser.add_argument("--megabytes", type=int, default=8, help="Size of the synthetic corpus.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-lines-per-sec", type=float, default=0,
+                        help="Exit with status 1 if the parser is slower than this (for CI).")
+    args = parser.parse_args()
+
+    if args.file:
+        lines = list(file_lines(args.file))
+        size = sum(len(line) for line in lines)
+    else:
+        lines, size = synthetic_corpus(args.megabytes)
+
+    events = sum(1 for _ in iter_events(lines))
+    parser_rate = throughput(parse_line, lines, args.repeat)
+    legacy_rate = throughput(legacy_parse, lines, args.repeat)
+    count, samples = event_latencies(lines)
+
+    print(f"Corpus: {len(lines)} lines, {size / 1024 / 1024:.1f} MB, {events} events")
+    print(f"parser: {parser_rate:,.0f} lines/s ({parser_rate * size / len(lines) / 1024 / 1024:.1f} MB/s)")
+    print(f"legacy: {legacy_rate:,.0f} lines/s ({parser_rate / legacy_rate:.2f}x speedup)")
+    print(f"per-event latency over {count} events: "
+          f"p50 {percentile(samples, 50) / 1000:.2f} us, p99 {percentile(samples, 99) / 1000:.2f} us")
+
+    if args.min_lines_per_sec and parser_rate < args.min_lines_per_sec:
+        print(f"❌ Parser below threshold of {args.min_lines_per_sec:,.0f} lines/s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import codecs
+import json
+import random
+import re
+import sys
+import time
+
+from hls import best_variant, parse_master_playlist
+from page_extract import CHUNK_SIZE, TagScanner
+
+MASTER = (
+    "#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-INDEPENDENT-SEGMENTS\n"
+    '#EXT-X-STREAM-INF:AVERAGE-BANDWIDTH=1402000,BANDWIDTH=1823000,CODECS="avc1.640020",RESOLUTION=720x720,FRAME-RATE=29.970\n'
+    "avc_720/prog_index.m3u8\n"
+    '#EXT-X-STREAM-INF:AVERAGE-BANDWIDTH=3904000,BANDWIDTH=4901000,CODECS="avc1.640028",RESOLUTION=1080x1080,FRAME-RATE=29.970\n'
+    "https://mvod.itunes.apple.com/itunes-assets/fixture/avc_1080/prog_index.m3u8\n"
+    '#EXT-X-STREAM-INF:AVERAGE-BANDWIDTH=2201000,BANDWIDTH=2950000,CODECS="hvc1.2.4.L123.B0",RESOLUTION=1080x1080,FRAME-RATE=29.970\n'
+    "hevc_1080/prog_index.m3u8\n"
+    '#EXT-X-STREAM-INF:AVERAGE-BANDWIDTH=7102000,BANDWIDTH=9512000,CODECS="hvc1.2.4.L153.B0",RESOLUTION=2160x2160,FRAME-RATE=29.970\n'
+    "hevc_2160/prog_index.m3u8\n"
+    '#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=310000,CODECS="avc1.640028",RESOLUTION=1080x1080,URI="avc_1080/iframe_index.m3u8"\n'
+)
+
+
+def fixture_album_page(tracks=18, seed=1):
+    """Roughly the shape of a music.apple.com album page: head, hero with the video, track list, serialized data."""
+    rng = random.Random(seed)
+    head = "".join(f'<link rel="preload" href="/assets/chunk-{rng.getrandbits(64):x}.js" as="script">' for _ in range(120))
+    head += '<meta property="og:image" content="https://is1-ssl.mzstatic.com/image/thumb/Music/fixture/1200x630wp-60.jpg">'
+    head += "<style>" + "".join(f".c{i}{{margin:{i}px;padding:{i % 7}px}}" for i in range(1500)) + "</style>"
+    hero = ('<div class="container-detail-header"><amp-ambient-video autoplay loop muted playsinline '
+            'src="https://mvod.itunes.apple.com/itunes-assets/fixture/P1234_default.m3u8" '
+            'poster="https://is1-ssl.mzstatic.com/image/thumb/Video/fixture/1200x1200.jpg"></amp-ambient-video></div>')
+    rows = "".join(
+        f'<div class="songs-list-row" data-index="{i}"><div class="songs-list-row__song-name">Track {i}</div>'
+        + "".join(f'<span class="svelte-{rng.getrandbits(32):x}">{rng.getrandbits(40):x}</span>' for _ in range(40))
+        + "</div>" for i in range(tracks))
+    data = json.dumps({"data": [{"id": rng.getrandbits(40), "attributes": {
+        "name": f"Item {i}", "text": "".join(rng.choice("abcdefghij ") for _ in range(400))}} for i in range(1000)]})
+    return (f"<!DOCTYPE html><html><head>{head}</head><body><div class=\"app\">{hero}{rows}</div>"
+            f'<script type="application/json" id="serialized-server-data">{data}</script></body></html>')
+
+
+def fixture_artist_page(seed=2):
+    page = fixture_album_page(seed=seed)
+    return page.replace("<amp-ambient-video", "<div").replace("</amp-ambient-video>", "</div>")
+
+
+def legacy_find(html, tag, attrs):
+    # The BeautifulSoup approach used before, kept as the comparison baseline
+    from bs4 import BeautifulSoup
+    found = BeautifulSoup(html, "html.parser").find(tag, attrs=attrs or {})
+    return dict(found.attrs) if found else None
+
+
+def legacy_variants(text):
+    stream_pattern = re.compile(r'#EXT-X-STREAM-INF:(.*?)\n(https://[^\s]+)')
+    avc_url = hevc_url = None
+    max_avc_bw = max_hevc_bw = 0
+    for attributes, stream_url in stream_pattern.findall(text):
+        resolution = re.search(r'RESOLUTION=(\d+x\d+)', attributes)
+        codec = re.search(r'CODECS="([^"]+)"', attributes)
+        bandwidth = re.search(r'BANDWIDTH=(\d+)', attributes)
+        if resolution and codec and bandwidth:
+            bw = int(bandwidth.group(1))
+            if resolution.group(1) == "1080x1080" and "avc1" in codec.group(1) and bw > max_avc_bw:
+                max_avc_bw, avc_url = bw, stream_url
+            elif resolution.group(1) == "2160x2160" and "hvc1" in codec.group(1) and bw > max_hevc_bw:
+                max_hevc_bw, hevc_url = bw, stream_url
+    return avc_url, hevc_url
+
+
+def streaming_find(page_bytes, tag, attrs, chunk_size):
+    # Same decoding as iter_text, minus the socket
+    scanner = TagScanner(tag, attrs)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for start in range(0, len(page_bytes), chunk_size):
+        chunk = page_bytes[start:start + chunk_size]
+        if scanner.feed(decoder.decode(chunk), len(chunk)) is not None:
+            break
+    return scanner.result, scanner.bytes_seen
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare(name, page, tag, attrs, repeat, chunk_size):
+    page_bytes = page.encode("utf-8")
+    legacy_seconds, legacy = best_time(lambda: legacy_find(page_bytes.decode("utf-8"), tag, attrs), repeat)
+    stream_seconds, (found, read) = best_time(lambda: streaming_find(page_bytes, tag, attrs, chunk_size), repeat)
+    key = "content" if tag == "meta" else "src"
+    same = (legacy or {}).get(key) == (found or {}).get(key)
+    print(f"{name}: <{tag}> {'found' if found else 'not found'}{'' if same else ' (MISMATCH with BeautifulSoup)'}")
+    print(f"  BeautifulSoup: {len(page_bytes) / 1024:7.0f} KB read, {legacy_seconds * 1000:8.2f} ms")
+    print(f"  streaming:     {read / 1024:7.0f} KB read, {stream_seconds * 1000:8.2f} ms "
+          f"({legacy_seconds / stream_seconds:.0f}x faster, {100 * read / len(page_bytes):.0f}% of the page)")
+    return same
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming page extractor and HLS master parser.")
+    parser.add_argument("--album-page", help="Saved music.apple.com album page to use instead of the fixture.")
+    parser.add_argument("--artist-page", help="Saved music.apple.com artist page to use instead of the fixture.")
+    parser.add_argument("--master", help="Saved master playlist to use instead of the fixture.")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    def load(path, fallback):
+        if not path:
+            return fallback()
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    ok = compare("album page", load(args.album_page, fixture_album_page), "amp-ambient-video", None,
+                 args.repeat, args.chunk_size)
+    ok &= compare("artist page", load(args.artist_page, fixture_artist_page), "meta", {"property": "og:image"},
+                  args.repeat, args.chunk_size)
+
+    master = load(args.master, lambda: MASTER)
+    base = "https://mvod.itunes.apple.com/itunes-assets/fixture/P1234_default.m3u8"
+    legacy_seconds, legacy = best_time(lambda: legacy_variants(master), args.repeat * 200)
+    parse_seconds, variants = best_time(lambda: parse_master_playlist(master, base), args.repeat * 200)
+    print(f"master playlist: {len(variants)} variants, parse {parse_seconds * 1e6:.1f} us (regex {legacy_seconds * 1e6:.1f} us)")
+    print(f"  regex:  AVC {legacy[0]}\n          HEVC {legacy[1]}")
+    print(f"  parser: AVC {best_variant(variants, 'avc')}\n          HEVC {best_variant(variants, 'hevc')}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
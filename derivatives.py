@@ -0,0 +1,141 @@
+import base64
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+import requests
+from PIL import Image, features
+
+DERIVATIVE_DIR = "artwork_derivatives"
+SIZES = (64, 128, 256, 512, 1024, 2048, 3000)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 82, "method": 4}),
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+PLACEHOLDER_SIZE = 16
+
+
+class DerivativeError(Exception):
+    pass
+
+
+def supported_formats():
+    return [fmt for fmt in FORMATS if fmt != "avif" or features.check("avif")]
+
+
+def downscale(image, size, resample):
+    """RGB copy of image fitted into size x size, converted after resizing.
+
+    Converting first would touch every pixel of a 3000px+ original; a
+    freshly opened JPEG is also decoded at 1/2-1/8 scale when that is
+    still at least size. The image passed in is not resized in place.
+    """
+    if image.mode in ("1", "P"):
+        # Paletted images would otherwise be resized with NEAREST
+        image = image.convert("RGBA")
+    image.draft(None, (size, size))
+    width, height = image.size
+    scale = size / max(width, height)
+    if scale < 1:
+        image = image.resize((max(round(width * scale), 1), max(round(height * scale), 1)), resample, reducing_gap=2.0)
+    return image.convert("RGB")
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ArtworkDerivatives:
+    """Downscaled, re-encoded variants of album artwork, built once and kept on disk.
+
+    Originals are downloaded once and stored under their SHA-256; variants
+    are stored as <hash>-<size>.<fmt>, so the same image reached through
+    different album IDs is only processed once and the hash doubles as a
+    strong ETag. source_fn(album_id) returns the original's URL or a local
+    path (e.g. static/images/cover.png).
+    """
+
+    def __init__(self, source_fn, cache_dir=DERIVATIVE_DIR, session=None):
+        self.source_fn = source_fn
+        self.cache_dir = cache_dir
+        self.session = session or requests.Session()
+        self._originals = {}
+        self._placeholders = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, "originals"), exist_ok=True)
+
+    def _lock_for(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fetch_original(self, source):
+        if source.startswith("http://") or source.startswith("https://"):
+            resp = self.session.get(source, timeout=30)
+            resp.raise_for_status()
+            return resp.content
+        with open(source, "rb") as f:
+            return f.read()
+
+    def original(self, album_id):
+        """Returns (sha256 hex, path) of the stored original for an album, downloading it the first time."""
+        source = self.source_fn(album_id)
+        if not source:
+            raise DerivativeError(f"No artwork known for album {album_id}")
+        cached = self._originals.get(source)
+        if cached and os.path.exists(cached[1]):
+            return cached
+        with self._lock_for(("original", source)):
+            cached = self._originals.get(source)
+            if cached and os.path.exists(cached[1]):
+                return cached
+            data = self._fetch_original(source)
+            digest = hashlib.sha256(data).hexdigest()
+            path = os.path.join(self.cache_dir, "originals", digest)
+            if not os.path.exists(path):
+                _write_atomic(path, data)
+            # Local files (cover.png) change in place, only remember remote sources
+            if source.startswith("http"):
+                self._originals[source] = (digest, path)
+            return digest, path
+
+    def variant(self, album_id, size, fmt):
+        """Returns (path, mimetype, etag) for one size/format, building it if needed."""
+        if size not in SIZES:
+            raise DerivativeError(f"Unsupported size {size}")
+        if fmt not in supported_formats():
+            raise DerivativeError(f"Unsupported format {fmt}")
+        digest, original_path = self.original(album_id)
+        pil_format, mimetype, options = FORMATS[fmt]
+        name = f"{digest}-{size}.{fmt}"
+        path = os.path.join(self.cache_dir, digest[:2], name)
+        if not os.path.exists(path):
+            with self._lock_for(name):
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with Image.open(original_path) as image:
+                        image = downscale(image, size, Image.LANCZOS)
+                        out = io.BytesIO()
+                        image.save(out, pil_format, **options)
+                    _write_atomic(path, out.getvalue())
+        return path, mimetype, name
+
+    def placeholder(self, album_id):
+        """A tiny inline data: URI of the artwork to paint before any variant has loaded."""
+        digest, original_path = self.original(album_id)
+        cached = self._placeholders.get(digest)
+        if cached:
+            return cached
+        with Image.open(original_path) as image:
+            image = downscale(image, PLACEHOLDER_SIZE, Image.BILINEAR)
+            out = io.BytesIO()
+            image.save(out, "WEBP", quality=40)
+        uri = "data:image/webp;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+        self._placeholders[digest] = uri
+        return uri
@@ -1,9 +1,17 @@
+import argparse
 import json
 import os
-import CoreAudio
+import sys
 import ctypes
+import threading
 import time
-import sounddevice as sd
+
+try:
+    import CoreAudio
+except ImportError:
+    # Off macOS only the polling/mock backends below are usable
+    CoreAudio = None
+
 
 class AudioObjectPropertyAddress(ctypes.Structure):
     _fields_ = [
@@ -12,17 +20,55 @@ class AudioObjectPropertyAddress(ctypes.Structure):
         ('mElement', ctypes.c_uint32)
     ]
 
-core_audio = ctypes.CDLL('/System/Library/Frameworks/CoreAudio.framework/CoreAudio')
-core_audio.AudioObjectGetPropertyData.argtypes = [
+try:
+    core_audio = ctypes.CDLL('/System/Library/Frameworks/CoreAudio.framework/CoreAudio')
+except OSError:
+    core_audio = None
+
+# OSStatus (*)(AudioObjectID, UInt32, const AudioObjectPropertyAddress*, void*)
+AudioObjectPropertyListenerProc = ctypes.CFUNCTYPE(
+    ctypes.c_int32,
     ctypes.c_uint32,
-    ctypes.POINTER(AudioObjectPropertyAddress),
     ctypes.c_uint32,
-    ctypes.c_void_p,
-    ctypes.POINTER(ctypes.c_uint32),
+    ctypes.POINTER(AudioObjectPropertyAddress),
     ctypes.c_void_p
-]
-core_audio.AudioObjectGetPropertyData.restype = ctypes.c_int32
+)
+
 
+def _bind_core_audio():
+    if core_audio is None:
+        return
+    core_audio.AudioObjectGetPropertyData.argtypes = [
+        ctypes.c_uint32,
+        ctypes.POINTER(AudioObjectPropertyAddress),
+        ctypes.c_uint32,
+        ctypes.c_void_p,
+        ctypes.POINTER(ctypes.c_uint32),
+        ctypes.c_void_p
+    ]
+    core_audio.AudioObjectGetPropertyData.restype = ctypes.c_int32
+    core_audio.AudioObjectSetPropertyData.argtypes = [
+        ctypes.c_uint32,
+        ctypes.POINTER(AudioObjectPropertyAddress),
+        ctypes.c_uint32,
+        ctypes.c_void_p,
+        ctypes.c_uint32,
+        ctypes.c_void_p
+    ]
+    core_audio.AudioObjectSetPropertyData.restype = ctypes.c_int32
+
+    for name in ("AudioObjectAddPropertyListener", "AudioObjectRemovePropertyListener"):
+        fn = getattr(core_audio, name)
+        fn.argtypes = [
+            ctypes.c_uint32,
+            ctypes.POINTER(AudioObjectPropertyAddress),
+            AudioObjectPropertyListenerProc,
+            ctypes.c_void_p
+        ]
+        fn.restype = ctypes.c_int32
+
+
+_bind_core_audio()
 
 class AudioStreamBasicDescription(ctypes.Structure):
     _fields_ = [
@@ -38,60 +84,249 @@ class AudioStreamBasicDescription(ctypes.Structure):
     ]
 
 
-def stream_default_output_device_info():
-    while True:
-        info = {
-            "name": None,
-            "sample_rate": None
-        }
+def get_default_output_device_id():
+    address = AudioObjectPropertyAddress(
+        mSelector=CoreAudio.kAudioHardwarePropertyDefaultOutputDevice,
+        mScope=CoreAudio.kAudioObjectPropertyScopeGlobal,
+        mElement=CoreAudio.kAudioObjectPropertyElementMaster
+    )
+    device_id = ctypes.c_uint32()
+    size = ctypes.c_uint32(ctypes.sizeof(ctypes.c_uint32))
+    core_audio.AudioObjectGetPropertyData(
+        CoreAudio.kAudioObjectSystemObject,
+        ctypes.byref(address),
+        0,
+        None,
+        ctypes.byref(size),
+        ctypes.byref(device_id)
+    )
+    return device_id.value
+
+
+def _nominal_sample_rate_address():
+    return AudioObjectPropertyAddress(
+        mSelector=CoreAudio.kAudioDevicePropertyNominalSampleRate,
+        mScope=CoreAudio.kAudioObjectPropertyScopeGlobal,
+        mElement=CoreAudio.kAudioObjectPropertyElementMaster
+    )
+
+
+def get_nominal_sample_rate(device_id):
+    rate = ctypes.c_double()
+    size = ctypes.c_uint32(ctypes.sizeof(rate))
+    status = core_audio.AudioObjectGetPropertyData(
+        device_id,
+        ctypes.byref(_nominal_sample_rate_address()),
+        0,
+        None,
+        ctypes.byref(size),
+        ctypes.byref(rate)
+    )
+    return rate.value if status == 0 else None
+
+
+def set_nominal_sample_rate(device_id, sample_rate):
+    rate = ctypes.c_double(sample_rate)
+    status = core_audio.AudioObjectSetPropertyData(
+        device_id,
+        ctypes.byref(_nominal_sample_rate_address()),
+        0,
+        None,
+        ctypes.sizeof(rate),
+        ctypes.byref(rate)
+    )
+    return status == 0
+
+
+def read_device_info():
+    info = {
+        "name": None,
+        "sample_rate": None
+    }
+
+    device_id_value = get_default_output_device_id()
+
+    try:
+        import sounddevice as sd
+        device = sd.query_devices(kind='output')
+        info["name"] = device["name"]
+    except Exception:
+        info["name"] = None
+
+    stream_address = AudioObjectPropertyAddress(
+        mSelector=CoreAudio.kAudioDevicePropertyStreamFormat,
+        mScope=CoreAudio.kAudioDevicePropertyScopeOutput,
+        mElement=0
+    )
+
+    fmt = AudioStreamBasicDescription()
+    size = ctypes.c_uint32(ctypes.sizeof(fmt))
+    core_audio.AudioObjectGetPropertyData(
+        device_id_value,
+        stream_address,
+        0,
+        None,
+        ctypes.byref(size),
+        ctypes.byref(fmt)
+    )
 
-        address = AudioObjectPropertyAddress(
+    info["bit_depth"] = fmt.mBitsPerChannel
+    info["sample_rate"] = int(fmt.mSampleRate)
+    return info
+
+
+class PollingBackend:
+    """Reads the device every `interval` seconds; the publisher drops unchanged states."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._wake = threading.Event()
+
+    def read(self):
+        return read_device_info()
+
+    def wait_for_change(self, timeout):
+        self._wake.wait(min(timeout, self.interval))
+        self._wake.clear()
+
+    def close(self):
+        pass
+
+
+class CoreAudioListenerBackend:
+    """Sleeps until CoreAudio reports a change of default device, nominal rate or stream format."""
+
+    def __init__(self):
+        if core_audio is None or CoreAudio is None:
+            raise RuntimeError("CoreAudio is not available")
+        self._wake = threading.Event()
+        # Keep a reference, ctypes callbacks must outlive their registration
+        self._proc = AudioObjectPropertyListenerProc(self._on_property_changed)
+        self._device_id = None
+        self._default_address = AudioObjectPropertyAddress(
             mSelector=CoreAudio.kAudioHardwarePropertyDefaultOutputDevice,
             mScope=CoreAudio.kAudioObjectPropertyScopeGlobal,
             mElement=CoreAudio.kAudioObjectPropertyElementMaster
         )
-        device_id = ctypes.c_uint32()
-        size = ctypes.c_uint32(ctypes.sizeof(ctypes.c_uint32))
-        core_audio.AudioObjectGetPropertyData(
-            CoreAudio.kAudioObjectSystemObject,
-            ctypes.byref(address),
-            0,
-            None,
-            ctypes.byref(size),
-            ctypes.byref(device_id)
-        )
-        device_id_value = device_id.value
-
-        try:
-            device = sd.query_devices(kind='output')
-            info["name"] = device["name"]
-        except Exception:
-            info["name"] = None
-
-        stream_address = AudioObjectPropertyAddress(
-            mSelector=CoreAudio.kAudioDevicePropertyStreamFormat,
-            mScope=CoreAudio.kAudioDevicePropertyScopeOutput,
-            mElement=0
+        self._device_addresses = [
+            AudioObjectPropertyAddress(
+                mSelector=CoreAudio.kAudioDevicePropertyNominalSampleRate,
+                mScope=CoreAudio.kAudioObjectPropertyScopeGlobal,
+                mElement=CoreAudio.kAudioObjectPropertyElementMaster
+            ),
+            AudioObjectPropertyAddress(
+                mSelector=CoreAudio.kAudioDevicePropertyStreamFormat,
+                mScope=CoreAudio.kAudioDevicePropertyScopeOutput,
+                mElement=0
+            ),
+        ]
+        core_audio.AudioObjectAddPropertyListener(
+            CoreAudio.kAudioObjectSystemObject, ctypes.byref(self._default_address), self._proc, None
         )
+        self._watch_device(get_default_output_device_id())
+
+    def _on_property_changed(self, object_id, count, addresses, client_data):
+        # Runs on a CoreAudio thread: only flag the change, reading happens in the publisher loop
+        self._wake.set()
+        return 0
+
+    def _watch_device(self, device_id):
+        if device_id == self._device_id:
+            return
+        if self._device_id is not None:
+            for address in self._device_addresses:
+                core_audio.AudioObjectRemovePropertyListener(self._device_id, ctypes.byref(address), self._proc, None)
+        for address in self._device_addresses:
+            core_audio.AudioObjectAddPropertyListener(device_id, ctypes.byref(address), self._proc, None)
+        self._device_id = device_id
 
-        fmt = AudioStreamBasicDescription()
-        size = ctypes.c_uint32(ctypes.sizeof(fmt))
-        core_audio.AudioObjectGetPropertyData(
-            device_id_value,
-            stream_address,
-            0,
-            None,
-            ctypes.byref(size),
-            ctypes.byref(fmt)
+    def read(self):
+        info = read_device_info()
+        # The default device may have changed; move the device listeners along with it
+        self._watch_device(get_default_output_device_id())
+        return info
+
+    def wait_for_change(self, timeout):
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def close(self):
+        core_audio.AudioObjectRemovePropertyListener(
+            CoreAudio.kAudioObjectSystemObject, ctypes.byref(self._default_address), self._proc, None
         )
+        if self._device_id is not None:
+            for address in self._device_addresses:
+                core_audio.AudioObjectRemovePropertyListener(self._device_id, ctypes.byref(address), self._proc, None)
+
+
+class MockBackend:
+    """Scripted device for Linux. Call set() to change it, or pass states to step through one per wait."""
+
+    def __init__(self, states=None, interval=2.0):
+        self.states = list(states or [{"name": "Mock DAC", "sample_rate": 44100, "bit_depth": 24}])
+        self.interval = interval
+        self.info = dict(self.states.pop(0))
+        self._wake = threading.Event()
+
+    def set(self, **changes):
+        self.info = {**self.info, **changes}
+        self._wake.set()
+
+    def read(self):
+        return dict(self.info)
+
+    def wait_for_change(self, timeout):
+        if self.states:
+            time.sleep(min(timeout, self.interval))
+            self.info = dict(self.states.pop(0))
+            return
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def close(self):
+        pass
+
+
+def make_backend(name="coreaudio"):
+    if name == "mock":
+        return MockBackend([
+            {"name": "Mock DAC", "sample_rate": 44100, "bit_depth": 24},
+            {"name": "Mock DAC", "sample_rate": 96000, "bit_depth": 24},
+            {"name": "Mock Speakers", "sample_rate": 48000, "bit_depth": 16},
+        ])
+    if name == "poll":
+        return PollingBackend()
+    try:
+        return CoreAudioListenerBackend()
+    except Exception as e:
+        print(f"⚠️ CoreAudio listeners unavailable ({e}), polling instead", file=sys.stderr)
+        return PollingBackend()
 
-        info["bit_depth"] = fmt.mBitsPerChannel
-        info["sample_rate"] = int(fmt.mSampleRate)
-        with open("device.json", "w") as f:
-            json.dump(info, f, indent=2)
 
-        time.sleep(1)
+def stream_default_output_device_info(backend, out=sys.stdout, safety_interval=30.0):
+    """Writes one JSON line to `out` whenever the default output device, rate or bit depth changes."""
+    last = None
+    try:
+        while True:
+            try:
+                info = backend.read()
+            except Exception as e:
+                print(f"❌ Failed to read device info: {e}", file=sys.stderr)
+                info = last
+            if info is not None and info != last:
+                out.write(json.dumps(info) + "\n")
+                out.flush()
+                last = info
+            # Listeners wake us on change; the timeout is only a safety net for missed notifications
+            backend.wait_for_change(safety_interval)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        backend.close()
 
 
 if __name__ == "__main__":
-    stream_default_output_device_info()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Publish default output device changes as JSON lines on stdout.")
+    parser.add_argument("--backend", choices=["coreaudio", "poll", "mock"], default="coreaudio")
+    args = parser.parse_args()
+    stream_default_output_device_info(make_backend(args.backend))
@@ -0,0 +1,186 @@
+import json
+import queue
+from collections.abc import Mapping
+import threading
+import time
+
+_MISSING = object()
+
+
+class TooManyClients(Exception):
+    pass
+
+
+def diff_sections(old, new):
+    """Per-section key diff between two /data payloads.
+
+    Returns (changed, removed) where changed maps section -> {key: value} and
+    removed maps section -> [keys]. Non-dict sections are compared as a whole.
+    """
+    changed = {}
+    removed = {}
+    for section, value in new.items():
+        before = old.get(section)
+        if isinstance(value, dict) and isinstance(before, dict):
+            delta = {k: v for k, v in value.items() if before.get(k, _MISSING) != v}
+            gone = [k for k in before if k not in value]
+            if delta:
+                changed[section] = delta
+            if gone:
+                removed[section] = gone
+        elif before != value or section not in old:
+            changed[section] = value
+    for section in old:
+        if section not in new:
+            removed[section] = None
+    return changed, removed
+
+
+class EventBroadcaster:
+    """Fans /data changes out to Server-Sent Events clients.
+
+    A single watcher thread builds the payload, diffs it against the last one
+    and serialises each delta once; every client just pulls ready-made strings
+    off its own queue. Versions increase monotonically.
+
+    Every stream holds a server thread, so at most max_clients are served
+    at once. A keepalive comment every `keepalive` seconds finds clients
+    that went away, streams end after max_age seconds (EventSource
+    reconnects by itself), and close() ends them all on shutdown.
+    """
+
+    def __init__(self, snapshot_fn, interval=0.1, keepalive=15.0, client_queue_size=64, version_fn=None,
+                 max_clients=16, max_age=600.0):
+        self.snapshot_fn = snapshot_fn
+        # Optional cheap change check (e.g. a state store version) to skip building and diffing
+        self.version_fn = version_fn
+        self._source_version = None
+        self.interval = interval
+        self.keepalive = keepalive
+        self.client_queue_size = client_queue_size
+        self.max_clients = max_clients
+        self.max_age = max_age
+        self.version = 0
+        self._last = {}
+        self._clients = set()
+        self._lock = threading.Lock()
+        # publish() runs on the watcher and on request threads; one at a time, so an older
+        # snapshot can never be committed after a newer one
+        self._publish_lock = threading.Lock()
+        self._thread = None
+        self._closed = threading.Event()
+
+    @property
+    def client_count(self):
+        return len(self._clients)
+
+    def _copy(self, payload):
+        # Detach from the live dicts so later in-place mutation still shows up as a change
+        return {k: dict(v) if isinstance(v, Mapping) else v for k, v in payload.items()}
+
+    def publish(self):
+        """Diff the current payload against the last one and push the delta. Returns True if anything changed."""
+        with self._publish_lock:
+            return self._publish()
+
+    def _publish(self):
+        if self.version_fn is not None:
+            source_version = self.version_fn()
+            if source_version == self._source_version:
+                return False
+            self._source_version = source_version
+        current = self._copy(self.snapshot_fn())
+        changed, removed = diff_sections(self._last, current)
+        if not changed and not removed:
+            return False
+        with self._lock:
+            self.version += 1
+            self._last = current
+            message = {"version": self.version, "changes": changed}
+            if removed:
+                message["removed"] = removed
+            frame = f"id: {self.version}\nevent: delta\ndata: {json.dumps(message)}\n\n"
+            for client in list(self._clients):
+                try:
+                    client.put_nowait(frame)
+                except queue.Full:
+                    # Slow client: drop its backlog and make it resync from a fresh snapshot
+                    self._resync(client)
+        return True
+
+    def _snapshot_frame(self):
+        message = {"version": self.version, "snapshot": self._last}
+        return f"id: {self.version}\nevent: snapshot\ndata: {json.dumps(message)}\n\n"
+
+    def _resync(self, client):
+        while True:
+            try:
+                client.get_nowait()
+            except queue.Empty:
+                break
+        client.put_nowait(self._snapshot_frame())
+
+    def subscribe(self):
+        """New client queue; raises TooManyClients when max_clients streams are open or after close()."""
+        client = queue.Queue(maxsize=self.client_queue_size)
+        # Bring _last up to date first, the watcher thread idles while nobody listens
+        self.publish()
+        with self._lock:
+            if self._closed.is_set() or len(self._clients) >= self.max_clients:
+                raise TooManyClients(f"{len(self._clients)} event streams open")
+            client.put_nowait("retry: 2000\n\n")
+            client.put_nowait(self._snapshot_frame())
+            self._clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def stream(self, client=None):
+        client = client or self.subscribe()
+        deadline = time.monotonic() + self.max_age
+        try:
+            while not self._closed.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    frame = client.get(timeout=min(self.keepalive, remaining))
+                except queue.Empty:
+                    frame = ": keepalive\n\n"
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(client)
+
+    def close(self):
+        """End every open stream and refuse new ones."""
+        self._closed.set()
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            while True:
+                try:
+                    client.put_nowait(None)
+                    break
+                except queue.Full:
+                    try:
+                        client.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def run(self):
+        while not self._closed.is_set():
+            try:
+                if self._clients:
+                    self.publish()
+            except Exception as e:
+                print(f"❌ Event broadcast failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
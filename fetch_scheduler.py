@@ -0,0 +1,120 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import ARTWORK_FETCHES_DEDUPLICATED_TOTAL, ARTWORK_FETCHES_DROPPED_TOTAL, ARTWORK_FETCH_QUEUE_DEPTH
+
+
+class _Job:
+    __slots__ = ("future", "generation", "on_result")
+
+    def __init__(self, generation, on_result):
+        self.future = None
+        self.generation = generation
+        self.on_result = on_result
+
+
+class FetchScheduler:
+    """Runs the current track's artwork fetches on a bounded pool.
+
+    Each kind ("album", "artist") has one slot: request() hands out a new
+    generation token and makes that key the current one. A key that is
+    already queued or running is not fetched again, the waiting job just
+    adopts the newer generation. Jobs for keys that were superseded before
+    they started are cancelled; results that arrive after their generation
+    was superseded are dropped instead of overwriting what is on screen.
+    on_result runs outside the scheduler's lock, so a slow callback doesn't
+    hold up request() and claim(); results are still delivered one at a time
+    and re-checked against the current generation right before delivery.
+    """
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        self._lock = threading.Lock()
+        # Held while a result is delivered; taken before _lock, never inside it
+        self._deliver_lock = threading.Lock()
+        self._generations = {}
+        self._current = {}
+        self._jobs = {}
+        self._queued = 0
+        self.stats = {"submitted": 0, "deduplicated": 0, "cancelled": 0, "dropped": 0, "failed": 0}
+
+    def claim(self, kind, key):
+        """Make `key` current for `kind` without fetching (e.g. a prefetched result was applied). Returns the generation."""
+        with self._lock:
+            return self._claim(kind, key)
+
+    def adopt(self, kind, key, result, on_result):
+        """claim() `key` and pass an already fetched result (e.g. a prefetch) to on_result, in turn with running fetches."""
+        with self._deliver_lock:
+            generation = self.claim(kind, key)
+            on_result(result)
+        return generation
+
+    def _claim(self, kind, key):
+        generation = self._generations.get(kind, 0) + 1
+        self._generations[kind] = generation
+        self._current[kind] = key
+        for (job_kind, job_key), job in list(self._jobs.items()):
+            if job_kind == kind and job_key != key and job.future.cancel():
+                del self._jobs[(job_kind, job_key)]
+                self._queued -= 1
+                self.stats["cancelled"] += 1
+                ARTWORK_FETCHES_DROPPED_TOTAL.inc(kind=kind, reason="cancelled")
+        ARTWORK_FETCH_QUEUE_DEPTH.set(self._queued)
+        return generation
+
+    def request(self, kind, key, fn, on_result):
+        """Fetch fn() for `key` and pass the result to on_result if `key` is still current by then."""
+        with self._lock:
+            generation = self._claim(kind, key)
+            job = self._jobs.get((kind, key))
+            if job is not None:
+                job.generation = generation
+                job.on_result = on_result
+                self.stats["deduplicated"] += 1
+                ARTWORK_FETCHES_DEDUPLICATED_TOTAL.inc(kind=kind)
+                return generation
+            job = _Job(generation, on_result)
+            self._jobs[(kind, key)] = job
+            self._queued += 1
+            self.stats["submitted"] += 1
+            job.future = self._executor.submit(self._run, kind, key, job, fn)
+            ARTWORK_FETCH_QUEUE_DEPTH.set(self._queued)
+        return generation
+
+    def is_current(self, kind, generation):
+        return self._generations.get(kind) == generation
+
+    def _run(self, kind, key, job, fn):
+        with self._lock:
+            self._queued -= 1
+            ARTWORK_FETCH_QUEUE_DEPTH.set(self._queued)
+        try:
+            result = fn()
+        except Exception as e:
+            print(f"❌ {kind} fetch for {key} failed: {e}")
+            with self._lock:
+                self._jobs.pop((kind, key), None)
+                self.stats["failed"] += 1
+            return
+        with self._deliver_lock:
+            with self._lock:
+                self._jobs.pop((kind, key), None)
+                if not self.is_current(kind, job.generation):
+                    self.stats["dropped"] += 1
+                    ARTWORK_FETCHES_DROPPED_TOTAL.inc(kind=kind, reason="stale")
+                    return
+                on_result = job.on_result
+            # A claim() from here on is applied after this result, in adopt() or by its own fetch
+            on_result(result)
+
+    @property
+    def queue_depth(self):
+        return self._queued
+
+    @property
+    def in_flight(self):
+        return len(self._jobs) - self._queued
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
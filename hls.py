@@ -0,0 +1,121 @@
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urljoin
+
+# NAME=value pairs; quoted values may contain commas (CODECS="avc1.640028,mp4a.40.2")
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+# Most preferred first; anything else ranks below these
+CODEC_FAMILIES = {
+    "hevc": ("hvc1", "hev1"),
+    "avc": ("avc1", "avc3"),
+}
+
+
+def parse_attributes(text):
+    """Attribute list of an EXT-X tag as a dict of strings, quotes removed."""
+    return {name: value[1:-1] if value.startswith('"') else value for name, value in ATTRIBUTE_RE.findall(text)}
+
+
+@dataclass(frozen=True)
+class Variant:
+    uri: str
+    bandwidth: int = 0
+    average_bandwidth: Optional[int] = None
+    codecs: tuple = ()
+    resolution: Optional[tuple] = None
+    frame_rate: Optional[float] = None
+    attributes: dict = field(default_factory=dict, compare=False)
+
+    @property
+    def codec(self):
+        """"hevc", "avc" or None, from the video codec in CODECS."""
+        for family, prefixes in CODEC_FAMILIES.items():
+            if any(c.split(".")[0] in prefixes for c in self.codecs):
+                return family
+        return None
+
+    @property
+    def pixels(self):
+        return self.resolution[0] * self.resolution[1] if self.resolution else 0
+
+    @property
+    def height(self):
+        return self.resolution[1] if self.resolution else 0
+
+    def to_dict(self):
+        """JSON-safe form; variant_from_dict() turns it back into an equal Variant."""
+        return {"uri": self.uri, "attributes": self.attributes}
+
+
+def variant_from_dict(data):
+    return _variant(data["attributes"], data["uri"])
+
+
+def _variant(attributes, uri):
+    resolution = None
+    if "RESOLUTION" in attributes:
+        try:
+            width, height = attributes["RESOLUTION"].lower().split("x")
+            resolution = (int(width), int(height))
+        except ValueError:
+            pass
+    try:
+        frame_rate = float(attributes["FRAME-RATE"]) if "FRAME-RATE" in attributes else None
+    except ValueError:
+        frame_rate = None
+    average = attributes.get("AVERAGE-BANDWIDTH", "")
+    bandwidth = attributes.get("BANDWIDTH", "")
+    return Variant(
+        uri=uri,
+        bandwidth=int(bandwidth) if bandwidth.isdigit() else 0,
+        average_bandwidth=int(average) if average.isdigit() else None,
+        codecs=tuple(c.strip() for c in attributes.get("CODECS", "").split(",") if c.strip()),
+        resolution=resolution,
+        frame_rate=frame_rate,
+        attributes=attributes,
+    )
+
+
+def parse_master_playlist(text, base_url=""):
+    """Variants of an HLS master playlist, URIs resolved against base_url.
+
+    Each #EXT-X-STREAM-INF applies to the next URI line; blank lines and
+    other tags in between are skipped. I-frame-only streams are left out.
+    """
+    variants = []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            pending = parse_attributes(line[len("#EXT-X-STREAM-INF:"):])
+        elif line.startswith("#"):
+            continue
+        elif pending is not None:
+            variants.append(_variant(pending, urljoin(base_url, line)))
+            pending = None
+    return variants
+
+
+def rank_variants(variants, codecs=("hevc", "avc"), max_height=None):
+    """Best first: preferred codec, then resolution, then bandwidth. Variants over max_height are dropped."""
+    order = {codec: i for i, codec in enumerate(codecs)}
+
+    def key(variant):
+        return (
+            order.get(variant.codec, len(order)),
+            -variant.pixels,
+            -(variant.average_bandwidth or variant.bandwidth),
+            -variant.bandwidth,
+        )
+
+    eligible = [v for v in variants if max_height is None or v.height <= max_height]
+    return sorted(eligible, key=key)
+
+
+def best_variant(variants, codec, max_height=None):
+    """URI of the best variant of one codec family ("avc" or "hevc"), or None."""
+    ranked = [v for v in rank_variants(variants, (codec,), max_height) if v.codec == codec]
+    return ranked[0].uri if ranked else None
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urljoin
+
+import requests
+
+from hls import rank_variants
+
+HLS_CACHE_DIR = "hls_cache"
+MAP_URI_RE = re.compile(r'(#EXT-X-MAP:.*?URI=")([^"]+)(")')
+SEGMENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".m4v": "video/mp4",
+    ".ts": "video/mp2t",
+}
+
+DEFAULT_ANIMATED_ARTWORK = {
+    # "auto" keeps the previous behaviour (HEVC when available), "avc" forces the cheaper stream
+    "codec": "auto",
+    # Tallest variant that may be picked; Apple ships AVC up to 1080x1080 and HEVC up to 2160x2160
+    "max_resolution": 2160,
+    "proxy": True,
+    "cache_megabytes": 1024,
+}
+
+
+# Codec families each animated_artwork.codec setting may play, most preferred first
+ANIMATED_CODEC_ORDER = {
+    "auto": ("hevc", "avc"),
+    "hevc": ("hevc",),
+    "avc": ("avc",),
+}
+
+
+def animated_artwork_settings(settings):
+    return {**DEFAULT_ANIMATED_ARTWORK, **settings.get("animated_artwork", {})}
+
+
+def select_animated_variant(variants, prefs):
+    """URI of the variant to play: the best allowed codec at or under max_resolution, or None."""
+    codecs = ANIMATED_CODEC_ORDER[prefs["codec"]]
+    ranked = [v for v in rank_variants(variants, codecs, prefs["max_resolution"]) if v.codec in codecs]
+    return ranked[0].uri if ranked else None
+
+
+def _write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class HlsProxy:
+    """Local cache for animated-artwork HLS streams.
+
+    A remote variant playlist is fetched once, its segment and init-map URIs
+    are rewritten to /hls/<stream>/seg/<n>, and all segments are fetched in
+    the background so playback never waits on the network. Everything stays
+    on disk under cache_dir for the next play of the same album; the least
+    recently used streams are evicted once max_bytes is exceeded. The cache
+    size is kept as a running total, so the directory is only walked when
+    there is something to evict, and streams still being written are never
+    evicted.
+    """
+
+    def __init__(self, cache_dir=HLS_CACHE_DIR, max_bytes=1024 * 1024 * 1024, session=None, prefetch_workers=4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.session = session or requests.Session()
+        self._executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="hls")
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        # Bytes on disk, counted on first write; stream ID -> number of writes in progress
+        self._total = None
+        self._writers = Counter()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _lock_for(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def stream_id(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+    def _stream_dir(self, stream_id):
+        if not re.fullmatch(r"[0-9a-f]{16}", stream_id):
+            raise KeyError(stream_id)
+        return os.path.join(self.cache_dir, stream_id)
+
+    @contextmanager
+    def _writing(self, stream_id):
+        with self._evict_lock:
+            self._writers[stream_id] += 1
+        try:
+            yield
+        finally:
+            with self._evict_lock:
+                self._writers[stream_id] -= 1
+                if not self._writers[stream_id]:
+                    del self._writers[stream_id]
+
+    def _write(self, path, data):
+        _write_atomic(path, data)
+        with self._evict_lock:
+            if self._total is None:
+                self._total = self._scan()[1]
+            else:
+                self._total += len(data)
+            over = self._total > self.max_bytes
+        if over:
+            self._evict()
+
+    def register(self, url):
+        """Returns the local playlist path for a remote variant playlist URL."""
+        stream_id = self.stream_id(url)
+        stream_dir = self._stream_dir(stream_id)
+        with self._writing(stream_id):
+            os.makedirs(stream_dir, exist_ok=True)
+            source = os.path.join(stream_dir, "source")
+            if not os.path.exists(source):
+                self._write(source, url.encode("utf-8"))
+        return f"/hls/{stream_id}/index.m3u8"
+
+    def warm(self, url):
+        """Register a stream and start fetching its playlist and segments before anyone plays it."""
+        path = self.register(url)
+        self._executor.submit(self._warm_one, self.stream_id(url))
+        return path
+
+    def _warm_one(self, stream_id):
+        try:
+            self.playlist(stream_id)
+        except Exception as e:
+            print(f"⚠️ HLS warm-up for {stream_id} failed: {e}")
+
+    def _source(self, stream_id):
+        with open(os.path.join(self._stream_dir(stream_id), "source"), "r") as f:
+            return f.read()
+
+    def _segments(self, stream_id):
+        with open(os.path.join(self._stream_dir(stream_id), "segments.json"), "r") as f:
+            return json.load(f)
+
+    def playlist(self, stream_id):
+        """Rewritten playlist text, fetching and caching it on first use."""
+        stream_dir = self._stream_dir(stream_id)
+        path = os.path.join(stream_dir, "index.m3u8")
+        with self._writing(stream_id), self._lock_for(("playlist", stream_id)):
+            if not os.path.exists(path):
+                url = self._source(stream_id)
+                resp = self.session.get(url, timeout=15)
+                resp.raise_for_status()
+                text, segments = self._rewrite(stream_id, url, resp.text)
+                self._write(os.path.join(stream_dir, "segments.json"), json.dumps(segments).encode("utf-8"))
+                self._write(path, text.encode("utf-8"))
+            else:
+                os.utime(stream_dir)
+                segments = self._segments(stream_id)
+            with open(path, "r") as f:
+                text = f.read()
+        self.prefetch(stream_id, segments)
+        return text
+
+    def _rewrite(self, stream_id, base_url, text):
+        segments = []
+
+        def local(uri):
+            segments.append(urljoin(base_url, uri))
+            ext = os.path.splitext(uri.split("?")[0])[1] or ".mp4"
+            return f"/hls/{stream_id}/seg/{len(segments) - 1}{ext}"
+
+        lines = []
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("#EXT-X-MAP"):
+                line = MAP_URI_RE.sub(lambda m: m.group(1) + local(m.group(2)) + m.group(3), line)
+            elif stripped and not stripped.startswith("#"):
+                line = local(stripped)
+            lines.append(line)
+        return "\n".join(lines) + "\n", segments
+
+    def prefetch(self, stream_id, segments):
+        for index in range(len(segments)):
+            self._executor.submit(self._prefetch_one, stream_id, index)
+
+    def _prefetch_one(self, stream_id, index):
+        try:
+            self.segment(stream_id, index)
+        except FileNotFoundError:
+            # The stream was evicted before its segments came up
+            pass
+        except Exception as e:
+            print(f"⚠️ HLS prefetch of segment {index} for {stream_id} failed: {e}")
+
+    def segment(self, stream_id, index):
+        """Returns (path, mimetype) of a cached segment, fetching it if needed."""
+        with self._writing(stream_id):
+            segments = self._segments(stream_id)
+            url = segments[index]
+            ext = os.path.splitext(url.split("?")[0])[1] or ".mp4"
+            path = os.path.join(self._stream_dir(stream_id), f"seg{index}{ext}")
+            if not os.path.exists(path):
+                with self._lock_for(("segment", stream_id, index)):
+                    if not os.path.exists(path):
+                        resp = self.session.get(url, timeout=30)
+                        resp.raise_for_status()
+                        self._write(path, resp.content)
+        return path, SEGMENT_TYPES.get(ext, "application/octet-stream")
+
+    def _scan(self):
+        """([(mtime, size, stream ID)], total bytes) of everything in cache_dir."""
+        streams = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            stream_dir = os.path.join(self.cache_dir, name)
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(stream_dir) if entry.is_file())
+                streams.append((os.stat(stream_dir).st_mtime, size, name))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            total += size
+        return streams, total
+
+    def _evict(self):
+        with self._evict_lock:
+            # Walking the cache also corrects any drift in the running total
+            streams, self._total = self._scan()
+            # Oldest played first; a stream's mtime is bumped every time its playlist is served
+            for _, size, name in sorted(streams):
+                if self._total <= self.max_bytes:
+                    break
+                if name in self._writers:
+                    continue
+                stream_dir = os.path.join(self.cache_dir, name)
+                for entry in os.scandir(stream_dir):
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+                try:
+                    os.rmdir(stream_dir)
+                except OSError as e:
+                    print(f"⚠️ Could not evict HLS stream {name}: {e}")
+                self._total -= size
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,85 @@
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def worker(host, port, path, deadline, revalidate, results, errors):
+    # One keep-alive connection per worker, like a browser tab
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    etag = None
+    latencies = []
+    failed = 0
+    while time.perf_counter() < deadline:
+        headers = {"If-None-Match": etag} if revalidate and etag else {}
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status not in (200, 304):
+            failed += 1
+        etag = response.getheader("ETag") or etag
+    conn.close()
+    results.extend(latencies)
+    errors.append(failed)
+
+
+def run(base_url, path, concurrency, duration, revalidate):
+    parsed = urlparse(base_url)
+    results = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(parsed.hostname, parsed.port or 80, path, deadline, revalidate, results, errors))
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "path": path,
+        "requests": len(results),
+        "errors": sum(errors),
+        "rps": len(results) / elapsed,
+        "p50": percentile(results, 50),
+        "p99": percentile(results, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running spezi server.")
+    parser.add_argument("--url", default="http://localhost:22441")
+    parser.add_argument("--paths", nargs="+", default=["/data", "/"])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per path.")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Send If-None-Match with the last ETag, like the page does.")
+    args = parser.parse_args()
+
+    print(f"{args.url}: {args.concurrency} connections, {args.duration:.0f} s per path")
+    for path in args.paths:
+        r = run(args.url, path, args.concurrency, args.duration, args.revalidate)
+        print(f"{r['path']:<8} {r['rps']:>9.1f} req/s  p50 {r['p50'] * 1000:6.2f} ms  "
+              f"p99 {r['p99'] * 1000:6.2f} ms  ({r['requests']} requests, {r['errors']} errors)")
+
+
+if __name__ == "__main__":
+    main()
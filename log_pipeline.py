@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+from logparser import NextFormat, StreamFormat, parse_line
+from metrics import (LOG_EVENTS_COALESCED_TOTAL, LOG_EVENTS_DROPPED_TOTAL, LOG_LINES_TOTAL, LOG_QUEUE_DEPTH,
+                     LOG_QUEUE_LAG_SECONDS, LOG_STREAM_RESTARTS_TOTAL)
+
+
+def now_timestamp():
+    """The current time in the syslog timestamp format events carry, so the two compare as strings."""
+    return datetime.now().astimezone().strftime("%Y-%m-%d %H:%M:%S.%f%z")
+
+
+def coalesce(batch):
+    """Collapse queued (event, enqueued) pairs to the ones that still matter, in order.
+
+    Only the latest StreamFormat counts (each one supersedes whatever was
+    playing before), and only the latest NextFormat after it (an
+    announcement made before the current format took over is stale).
+    Returns (kept, merged count).
+    """
+    current = nxt = None
+    for item in batch:
+        event = item[0]
+        if isinstance(event, StreamFormat):
+            current, nxt = item, None
+        elif isinstance(event, NextFormat):
+            nxt = item
+    kept = [item for item in (current, nxt) if item is not None]
+    return kept, len(batch) - len(kept)
+
+
+class LogPipeline:
+    """`log stream` -> reader thread -> bounded queue -> coalescing -> handler.
+
+    The reader only reads and parses, so the pipe keeps draining while the
+    handler is busy with a pause -> switch -> resume. Events that pile up in
+    the meantime are merged by coalesce() before the handler sees them; if
+    the queue ever fills, the oldest events go first. When the stream
+    process exits it is restarted with backoff, and whatever Music logged
+    in between is replayed from `log show` starting at the last event seen.
+    """
+
+    def __init__(self, source_fn, handler, catch_up_fn=None, maxsize=256,
+                 backoff=0.5, max_backoff=30.0, stable_after=30.0):
+        self.source_fn = source_fn
+        self.handler = handler
+        self.catch_up_fn = catch_up_fn
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.process = None
+        self.last_timestamp = None
+        self.restarts = 0
+        self._last_event = None
+        self._stopping = threading.Event()
+        LOG_QUEUE_DEPTH.function = self.queue.qsize
+
+    def _enqueue(self, event):
+        # Replayed and re-streamed lines overlap; anything not newer than the last event was already seen
+        if event.timestamp and self.last_timestamp:
+            if event.timestamp < self.last_timestamp or (event.timestamp, event) == self._last_event:
+                return
+        if event.timestamp:
+            self.last_timestamp = event.timestamp
+            self._last_event = (event.timestamp, event)
+        item = (event, time.monotonic())
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    LOG_EVENTS_DROPPED_TOTAL.inc()
+                except queue.Empty:
+                    pass
+
+    def _feed(self, lines):
+        for line in lines:
+            LOG_LINES_TOTAL.inc()
+            event = parse_line(line)
+            if event is not None:
+                self._enqueue(event)
+            if self._stopping.is_set():
+                return
+
+    def _catch_up(self):
+        if self.catch_up_fn is None or self.last_timestamp is None:
+            return
+        try:
+            self._feed(self.catch_up_fn(self.last_timestamp))
+        except Exception as e:
+            print(f"⚠️ Could not replay missed log lines: {e}")
+
+    def _read(self):
+        failures = 0
+        first = True
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            if first:
+                # Nothing before this point is interesting, but a restart catches up from here
+                self.last_timestamp = self.last_timestamp or now_timestamp()
+            try:
+                self.process = self.source_fn()
+            except Exception as e:
+                print(f"❌ Could not start log stream: {e}")
+                self.process = None
+            if self.process is not None:
+                if not first:
+                    # The new stream is already buffering; fill the gap before reading it
+                    self._catch_up()
+                first = False
+                self._feed(self.process.stdout)
+                self.process.wait()
+            if self._stopping.is_set():
+                return
+            if time.monotonic() - started >= self.stable_after:
+                failures = 0
+            delay = min(self.backoff * 2 ** failures, self.max_backoff)
+            failures += 1
+            self.restarts += 1
+            LOG_STREAM_RESTARTS_TOTAL.inc()
+            print(f"⚠️ Log stream stopped, restarting in {delay:g} s")
+            self._stopping.wait(delay)
+
+    def _drain(self, timeout):
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def run(self, stop_event=None):
+        """Start the reader and handle events on this thread until stop() or stop_event."""
+        threading.Thread(target=self._read, name="log-reader", daemon=True).start()
+        while not self._stopping.is_set() and not (stop_event is not None and stop_event.is_set()):
+            kept, merged = coalesce(self._drain(0.5))
+            if merged:
+                LOG_EVENTS_COALESCED_TOTAL.inc(merged)
+            for event, enqueued in kept:
+                LOG_QUEUE_LAG_SECONDS.observe(time.monotonic() - enqueued)
+                try:
+                    self.handler(event)
+                except Exception as e:
+                    print(f"❌ Handling {type(event).__name__} failed: {e}")
+        self.stop()
+
+    def stop(self):
+        self._stopping.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    # Demo: a slow switch handler, a burst of announcements and a stream that dies once
+    from replay import ScriptedLogStream
+    from bench_logparser import NEXT_FORMAT, STREAM_FORMAT
+
+    streams = []
+
+    def source():
+        stream = ScriptedLogStream()
+        streams.append(stream)
+        return stream
+
+    handled = []
+
+    def handler(event):
+        handled.append((type(event).__name__, event.sample_rate))
+        if isinstance(event, StreamFormat):
+            time.sleep(0.3)  # a pause -> switch -> resume
+
+    missed = []
+    pipeline = LogPipeline(source, handler, catch_up_fn=lambda since: list(missed), backoff=0.1)
+    threading.Thread(target=pipeline.run, daemon=True).start()
+    time.sleep(0.1)
+    line = lambda template, rate: template.format(ts=now_timestamp()[:31], rendition="Lossless", bitdepth=24, rate=rate)
+
+    start = time.perf_counter()
+    streams[0].emit(line(STREAM_FORMAT, 44100))
+    time.sleep(0.05)
+    for rate in [96000] * 20 + [48000] * 20:
+        streams[0].emit(line(NEXT_FORMAT, rate))
+    streams[0].emit(line(STREAM_FORMAT, 48000))
+    print(f"emitted 42 lines in {(time.perf_counter() - start) * 1000:.1f} ms while the handler was switching")
+    time.sleep(0.8)
+
+    # The stream dies; Music logs a format change before the new stream is up
+    streams[0].terminate()
+    missed.append(line(STREAM_FORMAT, 192000))
+    time.sleep(0.6)
+    streams[-1].emit(missed[0])  # the new stream also sees it: must not be handled twice
+    streams[-1].emit(line(STREAM_FORMAT, 88200))
+    time.sleep(0.6)
+    pipeline.stop()
+    print(f"{len(handled)} of 45 events reached the handler: {handled}")
+    print(f"restarts: {pipeline.restarts}, streams started: {len(streams)}")
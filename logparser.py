@@ -0,0 +1,104 @@
+import re
+import subprocess
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+LOG_PREDICATE = '(process == "Music") AND (eventMessage CONTAINS "SampleRate" OR eventMessage CONTAINS "asbdSampleRate")'
+
+RENDITION_RE = re.compile(r'\[Rendition ([^\]]+)\]')
+BITDEPTH_RE = re.compile(r'\[BitDepth (\d+)\]')
+SAMPLE_RATE_RE = re.compile(r'\[SampleRate\s+(\d+(?:\.\d+)?)\]')
+ASBD_SAMPLE_RATE_RE = re.compile(r'asbdSampleRate\s*=\s*([\d.]+)')
+
+
+class StreamFormat(NamedTuple):
+    """FigStreamPlayer line: the format that is playing now."""
+    rendition: str
+    bitdepth: Optional[int]
+    sample_rate: Optional[float]
+    timestamp: str
+
+
+class NextFormat(NamedTuple):
+    """mediaFormatinfo line: the format of what Music is preparing next."""
+    sample_rate: float
+    timestamp: str
+
+
+def _timestamp(line):
+    # syslog style lines start with "YYYY-MM-DD HH:MM:SS.ffffff+zzzz"
+    return line[:31].rstrip() if line[:4].isdigit() else ""
+
+
+def event_time(timestamp):
+    """Epoch seconds of an event timestamp, or None if the line had none."""
+    try:
+        return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f%z").timestamp()
+    except ValueError:
+        return None
+
+
+def parse_line(line):
+    """Classify one `log stream --style syslog` line. Returns a StreamFormat, NextFormat or None."""
+    # Every interesting line mentions SampleRate; this rejects the bulk of --debug noise without a regex
+    if "SampleRate" not in line:
+        return None
+    if "FigStreamPlayer" in line:
+        rendition_match = RENDITION_RE.search(line)
+        bitdepth_match = BITDEPTH_RE.search(line)
+        rate_match = SAMPLE_RATE_RE.search(line)
+        return StreamFormat(
+            rendition_match.group(1) if rendition_match else "Unknown",
+            int(bitdepth_match.group(1)) if bitdepth_match else None,
+            float(rate_match.group(1)) if rate_match else None,
+            _timestamp(line),
+        )
+    if "mediaFormatinfo" in line:
+        match = ASBD_SAMPLE_RATE_RE.search(line)
+        if match:
+            return NextFormat(float(match.group(1)), _timestamp(line))
+    return None
+
+
+def iter_events(lines):
+    for line in lines:
+        event = parse_line(line)
+        if event is not None:
+            yield event
+
+
+def log_stream_process(predicate=LOG_PREDICATE):
+    return subprocess.Popen(
+        ['log', 'stream',
+         '--predicate', predicate,
+         '--style', 'syslog', '--info', '--debug'],
+        stdout=subprocess.PIPE,
+        # Nobody reads a stderr pipe; once full it would stall the stream
+        stderr=subprocess.DEVNULL,
+        bufsize=1,
+        text=True
+    )
+
+
+def log_show_lines(start, predicate=LOG_PREDICATE, last=None):
+    """Lines `log show` has for the predicate since start, e.g. an event timestamp.
+
+    log show only takes whole seconds, so the fraction is dropped and a
+    few lines from before start may come back.
+    """
+    start = re.sub(r"\.\d+", "", start)
+    cmd = ['log', 'show',
+           '--predicate', predicate,
+           '--style', 'syslog',
+           '--start', start,
+           '--info', '--debug']
+    if last:
+        cmd += ['--last', last]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.stdout.splitlines(keepends=True)
+
+
+def file_lines(path):
+    """Replay source: a recorded `log stream`/`log show --style syslog` capture."""
+    with open(path, "r", errors="replace") as f:
+        yield from f
@@ -0,0 +1,295 @@
+import bisect
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from artwork_cache import NEGATIVE_TTL
+from metrics import LYRICS_RESOLVE_SECONDS
+
+LYRICS_DIR = "lyrics"
+LRCLIB_URL = "https://lrclib.net/api/get"
+# [mm:ss], [mm:ss.xx] or [mm:ss:xx]; a line may carry several
+TIME_TAG_RE = re.compile(r"\[(\d+):(\d{1,2})(?:[.:](\d{1,3}))?\]")
+OFFSET_RE = re.compile(r"^\[offset:\s*([+-]?\d+)\]\s*$", re.IGNORECASE)
+META_RE = re.compile(r"^\[[a-z#]+:.*\]\s*$", re.IGNORECASE)
+SOURCES = ("local", "lrclib")
+
+DEFAULT_LYRICS = {
+    "enabled": True,
+    # Tried in order; "local" reads <directory>/<track ID>.lrc or "<artist> - <title>.lrc" (or .txt)
+    "sources": ["local", "lrclib"],
+    "directory": LYRICS_DIR,
+}
+
+
+def lyrics_settings(settings):
+    return {**DEFAULT_LYRICS, **settings.get("lyrics", {})}
+
+
+class Lyrics:
+    """Lyric lines in playback order; times are empty for plain, unsynced text."""
+
+    def __init__(self, lines, times=None, source=None):
+        self.lines = lines
+        self.times = times or []
+        self.source = source
+
+    @property
+    def synced(self):
+        return bool(self.times)
+
+    def line_index(self, position):
+        """Index of the line being sung at position seconds, -1 before the first one. O(log n)."""
+        return bisect.bisect_right(self.times, position) - 1
+
+    def line(self, index):
+        return self.lines[index] if 0 <= index < len(self.lines) else None
+
+    def to_dict(self):
+        return {
+            "synced": self.synced,
+            "source": self.source,
+            "lines": [{"time": self.times[i] if self.synced else None, "text": text} for i, text in enumerate(self.lines)],
+        }
+
+
+def parse_lrc(text, source=None):
+    """Lyrics from LRC text; text without time tags becomes unsynced lines."""
+    offset = 0.0
+    timed = []
+    plain = []
+    for raw in text.splitlines():
+        line = raw.strip()
+        offset_match = OFFSET_RE.match(line)
+        if offset_match:
+            # Positive offsets make lines appear sooner
+            offset = int(offset_match.group(1)) / 1000
+            continue
+        tags = list(TIME_TAG_RE.finditer(line))
+        if not tags:
+            if line and not META_RE.match(line):
+                plain.append(line)
+            continue
+        words = line[tags[-1].end():].strip()
+        for tag in tags:
+            fraction = tag.group(3) or "0"
+            seconds = int(tag.group(1)) * 60 + int(tag.group(2)) + int(fraction) / 10 ** len(fraction)
+            timed.append((seconds, words))
+    if not timed:
+        return Lyrics(plain, source=source) if plain else None
+    # Lines sharing a timestamp keep their order in the file
+    timed.sort(key=lambda entry: entry[0])
+    return Lyrics([words for _, words in timed], [max(t - offset, 0.0) for t, _ in timed], source=source)
+
+
+def _safe_name(value):
+    return re.sub(r'[\\/:*?"<>|]', "_", value).strip()
+
+
+def local_lyrics(directory, track):
+    """Text of the first matching .lrc/.txt file in directory, or None."""
+    names = []
+    if track.get("track_id"):
+        names.append(str(track["track_id"]))
+    if track.get("artist") and track.get("title"):
+        names.append(_safe_name(f"{track['artist']} - {track['title']}"))
+    for name in names:
+        for ext in (".lrc", ".txt"):
+            path = os.path.join(directory, name + ext)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    return f.read()
+    return None
+
+
+def lrclib_lyrics(track, session=requests):
+    """Synced (or plain) lyrics text from LRCLIB, None if it has none for this track."""
+    params = {"track_name": track["title"], "artist_name": track["artist"]}
+    if track.get("album"):
+        params["album_name"] = track["album"]
+    if track.get("duration"):
+        params["duration"] = round(track["duration"])
+    resp = session.get(LRCLIB_URL, params=params, timeout=10)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("syncedLyrics") or data.get("plainLyrics") or None
+
+
+class LyricsResolver:
+    """Lyrics per track, with the same layering as the artwork resolver.
+
+    Parsed lyrics are kept in memory for the most recent max_entries
+    tracks, so replaying a track costs a dict lookup. Local files are
+    checked next (works offline), then network answers come from the
+    shared on-disk cache, and only then from LRCLIB. Tracks without lyrics
+    are negative-cached for a day, since lyrics get added over time.
+    """
+
+    def __init__(self, cache=None, session=None, directory=LYRICS_DIR, sources=SOURCES, max_entries=64):
+        self.cache = cache
+        self.session = session or requests.Session()
+        self.directory = directory
+        self.sources = tuple(sources)
+        self.max_entries = max_entries
+        self._parsed = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(track):
+        return str(track.get("track_id") or "\x1f".join([track.get("artist") or "", track.get("title") or ""]))
+
+    def _remember(self, key, lyrics):
+        with self._lock:
+            self._parsed[key] = lyrics
+            self._parsed.move_to_end(key)
+            while len(self._parsed) > self.max_entries:
+                self._parsed.popitem(last=False)
+        return lyrics
+
+    def resolve(self, track):
+        """Lyrics for a {"track_id", "title", "artist", "album", "duration"} dict, or None."""
+        start = time.perf_counter()
+        key = self.key(track)
+        with self._lock:
+            if key in self._parsed:
+                self._parsed.move_to_end(key)
+                LYRICS_RESOLVE_SECONDS.observe(time.perf_counter() - start, source="memory")
+                return self._parsed[key]
+
+        failed = False
+        for source in self.sources:
+            text = None
+            if source == "local":
+                text = local_lyrics(self.directory, track)
+            elif source == "lrclib" and track.get("title") and track.get("artist"):
+                hit = False
+                if self.cache is not None:
+                    hit, text = self.cache.get("lyrics", key)
+                if not hit:
+                    try:
+                        text = lrclib_lyrics(track, session=self.session)
+                    except Exception as e:
+                        print(f"Failed to fetch lyrics: {e}")
+                        failed = True
+                        continue
+                    if self.cache is not None:
+                        self.cache.put("lyrics", key, text, ttl=NEGATIVE_TTL if text is None else None)
+                source = "cache" if hit else source
+            if text:
+                lyrics = parse_lrc(text, source=source)
+                if lyrics is not None:
+                    LYRICS_RESOLVE_SECONDS.observe(time.perf_counter() - start, source=source)
+                    return self._remember(key, lyrics)
+        LYRICS_RESOLVE_SECONDS.observe(time.perf_counter() - start, source="none")
+        # A failed fetch is tried again next time the track plays
+        return None if failed else self._remember(key, None)
+
+
+class LyricsTracker:
+    """Follows the playback clock and reports the current line only when it changes.
+
+    Instead of polling, the tracker works out from the clock's anchor when
+    the next line starts and sleeps until then; wake() is called whenever
+    the anchor changes (seek, pause, play) so the deadline is recomputed.
+    on_line(key, lyrics, index) runs once per line boundary and once per
+    load().
+    """
+
+    def __init__(self, clock, on_line, lead=0.05):
+        self.clock = clock
+        self.on_line = on_line
+        # Publish slightly early so the line is on screen when it is sung
+        self.lead = lead
+        self.key = None
+        self.lyrics = None
+        self.published = 0
+        self._index = None
+        self._dirty = False
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def load(self, key, lyrics):
+        with self._cond:
+            self.key = key
+            self.lyrics = lyrics
+            self._index = None
+            self._dirty = True
+            self._cond.notify()
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def _next_wait(self, lyrics, index, position):
+        anchor = self.clock.anchor
+        if lyrics is None or not lyrics.synced or position is None or anchor is None or anchor["rate"] <= 0:
+            return None
+        if index + 1 >= len(lyrics.times):
+            return None
+        return max((lyrics.times[index + 1] - self.lead - position) / anchor["rate"], 0.001)
+
+    def run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                key, lyrics = self.key, self.lyrics
+                position = self.clock.position()
+                index = None
+                if lyrics is not None and lyrics.synced and position is not None:
+                    index = lyrics.line_index(position + self.lead)
+                changed = self._dirty or index != self._index
+                self._index = index
+                self._dirty = False
+            if changed:
+                self.published += 1
+                self.on_line(key, lyrics, index)
+            with self._cond:
+                if self._stopped:
+                    return
+                if not self._dirty:
+                    self._cond.wait(self._next_wait(lyrics, index if index is not None else -1, position))
+
+    def start(self):
+        threading.Thread(target=self.run, name="lyrics", daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+if __name__ == "__main__":
+    # Demo: a 60-line song played at 10x against the real playback clock
+    from playback_clock import PlaybackClock
+
+    lrc = "[ar:Demo]\n[offset:+0]\n" + "".join(f"[00:{i // 2:02d}.{(i % 2) * 50:02d}]Line {i}\n" for i in range(60))
+    start = time.perf_counter()
+    for _ in range(1000):
+        lyrics = parse_lrc(lrc)
+    print(f"parse: {(time.perf_counter() - start):.3f} ms per 60-line song")
+    start = time.perf_counter()
+    for i in range(100000):
+        lyrics.line_index(i * 0.0003)
+    print(f"lookup: {(time.perf_counter() - start) * 10:.3f} us per position")
+
+    pushes = []
+    clock = PlaybackClock()
+    tracker = LyricsTracker(clock, lambda key, lyrics, index: pushes.append((time.perf_counter(), index)))
+    clock.on_anchor = lambda anchor: tracker.wake()
+    tracker.start()
+    clock.set_anchor(0.0, 30.0, 10.0)
+    tracker.load("demo", lyrics)
+    time.sleep(1.5)
+    clock.set_anchor(5.0, 30.0, 10.0)  # seek back to 5 s
+    time.sleep(1.0)
+    tracker.stop()
+    indices = [index for _, index in pushes]
+    print(f"{len(pushes)} pushes for {len(set(indices))} distinct lines, in order after the seek: {indices[-5:]}")
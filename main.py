@@ -1,83 +1,176 @@
-import webbrowser
-import requests
-import subprocess
+from supervisor import Helper, Supervisor, StartupTimer, swift_command
+startup = StartupTimer()
 import re
 import time
 from datetime import datetime, timedelta
 import threading
-import objc
 import json
 import os
-from Foundation import NSObject
-from ScriptingBridge import SBApplication
+import sys
 from flask import Flask, render_template
 from flask import send_file
 from flask import jsonify, request
+from flask import Response, stream_with_context
+from state import StateStore
+from settings_store import SettingsService, SettingsError
+from server import run_server, server_settings
+from events import EventBroadcaster, TooManyClients
+from resolver import ArtworkResolver
+from artwork_cache import ArtworkCache
+from prefetch import ArtworkPrefetcher
+from switcher import SampleRateSwitcher, make_backend
+from rate_scheduler import SwitchScheduler
+from logparser import log_show_lines, log_stream_process, event_time, StreamFormat, NextFormat, ASBD_SAMPLE_RATE_RE
+from log_pipeline import LogPipeline
+import metrics
+from nowplaying_watcher import NowPlayingWatcher
+from music import make_music
+from playback_clock import PlaybackClock, parse_playback
+from lyrics import LyricsResolver, LyricsTracker, lyrics_settings
+from player_controller import PlayerController
+from fetch_scheduler import FetchScheduler
+startup.mark("imports")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SETTINGS_FILE = "settings.json"
 
+settings_service = SettingsService(SETTINGS_FILE)
+
 def load_settings():
-    with open(SETTINGS_FILE, "r") as f:
-        return json.load(f)
+    # Served from memory; the file is only re-read after it changes on disk
+    return settings_service.get()
 
 settings = load_settings()
 
 def save_settings(data):
-    with open(SETTINGS_FILE, "w") as f:
-        json.dump(data, f, indent=2)
-from io import BytesIO
-import base64
-import hashlib
-import subprocess
+    return settings_service.save(data)
 
 def floats_differ(a, b, epsilon=1e-3):
     return abs(a - b) > epsilon
 
 app = Flask(__name__)
 VERSION = "0.0.3"
-import logging
-werkzeug_log = logging.getLogger('werkzeug')
-werkzeug_log.setLevel(logging.DEBUG)  # Enable GET logs
-
-# To re-enable normal logging, just change the level back:
-# werkzeug_log.setLevel(logging.INFO)
 
-current_info = {"sample_rate": None, "status": "Waiting...", "artwork_version": 0}
-nowplaying_info = {}
-device_info = {}
+# Set by shutdown(); monitor loops and helper processes stop with it
+shutdown_event = threading.Event()
+
+# info (was current_info), nowplaying (was nowplaying_info) and device (was device_info)
+state = StateStore(
+    info={"sample_rate": None, "status": "Waiting...", "artwork_version": 0},
+    nowplaying={},
+    device={},
+    player={"commands": []},
+    lyrics={}
+)
 artist_art_url = None
 
 last_album_id = None
+last_artist_id = None
 last_artwork = None
 last_avc = None
 last_hevc = None
+# Album whose artwork is on screen; placeholder/variants built for any other album are dropped
+artwork_album_id = None
+
+artwork_resolver = ArtworkResolver(cache=ArtworkCache())
+
+# album ID -> original artwork URL, for the /artwork derivative endpoint
+artwork_sources = {}
+
+def artwork_source(album_id):
+    if album_id == "local":
+        # The cover nowplaying.swift writes for tracks without store artwork
+        return os.path.join(app.static_folder, "images", "cover.png")
+    if album_id in artwork_sources:
+        return artwork_sources[album_id]
+    if artwork_resolver.cache is not None:
+        hit, cached = artwork_resolver.cache.get("album", album_id)
+        if hit and cached:
+            return cached.get("artwork")
+    return None
 
-def get_current_playback_info():
-    music = SBApplication.applicationWithBundleIdentifier_("com.apple.Music")
-    if not music or not music.isRunning():
-        return None, None
-
-    current_track = music.currentTrack()
-    player_position = music.playerPosition()
+# Built on first use, so PIL and the HLS cache aren't loaded before the server is up
+_lazy_lock = threading.RLock()
+_artwork_derivatives = None
+_artwork_palettes = None
+_hls_proxy = None
+
+def artwork_derivatives():
+    global _artwork_derivatives
+    with _lazy_lock:
+        if _artwork_derivatives is None:
+            from derivatives import ArtworkDerivatives
+            _artwork_derivatives = ArtworkDerivatives(artwork_source, session=artwork_resolver.session)
+        return _artwork_derivatives
+
+def artwork_palettes():
+    global _artwork_palettes
+    with _lazy_lock:
+        if _artwork_palettes is None:
+            from palette import ArtworkPalettes
+            _artwork_palettes = ArtworkPalettes(artwork_derivatives())
+        return _artwork_palettes
+
+def hls_proxy():
+    global _hls_proxy
+    with _lazy_lock:
+        if _hls_proxy is None:
+            from hls_proxy import HlsProxy, animated_artwork_settings
+            _hls_proxy = HlsProxy(
+                max_bytes=animated_artwork_settings(settings)["cache_megabytes"] * 1024 * 1024,
+                session=artwork_resolver.session
+            )
+        return _hls_proxy
+
+# ScriptingBridge on a Mac, or the scripted fake used by replay.py
+music = make_music(settings.get("music_backend", "scriptingbridge"))
 
-    if current_track:
-        duration = current_track.duration()
-        return duration, player_position
-    else:
-        return None, None
+def get_current_playback_info():
+    return music.playback_info()
 
-# -- AppleScript to get current track info --
 def get_track_info(which='current'):
-    script = f'''
-    tell application "Music"
-        set t to {which} track
-        return (get name of t) & "¶" & (get artist of t)
-    end tell
-    '''
-    result = subprocess.run(['osascript', '-e', script], capture_output=True, text=True)
-    if result.returncode != 0:
-        return None
-    name, artist = result.stdout.strip().split("¶")
-    return {"name": name, "artist": artist}
+    return music.track_info(which)
+
+def check_playback_position():
+    # The only regular Apple Event left for position: a drift check every few seconds
+    with metrics.POLL_LOOP_SECONDS.time():
+        return get_current_playback_info()
+
+def publish_clock(anchor):
+    state.update("nowplaying", Clock=anchor, Duration=anchor["duration"], Position=anchor["position"])
+    # Seek, pause or play moves the next lyric line boundary
+    lyrics_tracker.wake()
+
+# Position is published as an anchor and extrapolated by clients and the switch scheduler
+playback_clock = PlaybackClock(drift_fn=check_playback_position, on_anchor=publish_clock)
+
+def publish_lyrics(key, lyrics, index):
+    # Runs on load and on each line boundary only; the full text is served by /lyrics
+    if lyrics is None:
+        state.replace("lyrics", {"Key": key, "Available": False})
+        return
+    current = index if index is not None and index >= 0 else None
+    following = 0 if current is None else current + 1
+    state.replace("lyrics", {
+        "Key": key,
+        "Available": True,
+        "Synced": lyrics.synced,
+        "Source": lyrics.source,
+        "Count": len(lyrics.lines),
+        "Index": current,
+        "Current": lyrics.line(current) if current is not None else None,
+        "Next": lyrics.line(following) if lyrics.synced else None,
+        "Start": lyrics.times[current] if current is not None else None,
+        "End": lyrics.times[following] if lyrics.synced and following < len(lyrics.times) else None,
+    })
+
+lyrics_prefs = lyrics_settings(settings)
+lyrics_resolver = LyricsResolver(
+    cache=artwork_resolver.cache,
+    session=artwork_resolver.session,
+    directory=lyrics_prefs["directory"],
+    sources=lyrics_prefs["sources"]
+)
+lyrics_tracker = LyricsTracker(playback_clock, publish_lyrics)
 
 # -- Use log show to look for recent sample rate info --
 def get_recent_sample_rate(seconds=5):
@@ -85,219 +178,262 @@ def get_recent_sample_rate(seconds=5):
     start_time = now - timedelta(seconds=seconds)
     start_str = start_time.strftime('%Y-%m-%d %H:%M:%S')
 
-    cmd = [
-        'log', 'show',
-        '--predicate',
+    logs = "".join(log_show_lines(
+        start_str,
         '(process == "Music") && (eventMessage CONTAINS "asbdSampleRate")',
-        '--style', 'syslog',
-        '--start', start_str,
-        '--info', '--debug', '--last', f'{seconds}s'
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    logs = result.stdout
+        last=f'{seconds}s'
+    ))
 
     # Look for lines like: "asbdSampleRate = 44100.0 kHz"
-    match = re.search(r'asbdSampleRate\s*=\s*([\d.]+)', logs)
+    match = ASBD_SAMPLE_RATE_RE.search(logs)
     if match:
         return float(match.group(1))
     return None
 
-class MusicApp(NSObject):
-    def init(self):
-        self = objc.super(MusicApp, self).init()
-        if self is None:
-            return None
-        self.music = SBApplication.applicationWithBundleIdentifier_("com.apple.Music")
-        return self
+def map_sample_rate(sample_rate):
+    # Precompiled Hz -> Hz table from settings_service, no disk access on the switch path
+    target_sample_rate, mapped = settings_service.map_rate(sample_rate)
+    if settings_service.rate_table is None:
+        print("ℹ️ Sample rate matching disabled.")
+    elif mapped:
+        print(f"✅ Sample rate matching applied: {sample_rate / 1000:g} kHz -> {target_sample_rate / 1000:g} kHz")
+    else:
+        print(f"⚠️ No mapping for {sample_rate / 1000:g} kHz found in user settings. Using original sample rate.")
+    return target_sample_rate
 
-    def pause(self):
-        self.music.pause()
+def observe_detection(event, kind):
+    metrics.LOG_EVENTS_TOTAL.inc(event=kind)
+    logged_at = event_time(event.timestamp)
+    if logged_at is not None:
+        metrics.SWITCH_STAGE_SECONDS.observe(max(time.time() - logged_at, 0.0), mode=kind, stage="detection")
 
-    def play(self):
-        self.music.playOnce_(None)
+log_pipeline = None
 
 def monitor_sample_rate():
+    global log_pipeline
     print("Monitoring sample rate logs... Press Ctrl+C to stop.")
 
-    process = subprocess.Popen(
-        ['log', 'stream',
-         '--predicate', '(process == "Music") AND (eventMessage CONTAINS "SampleRate" OR eventMessage CONTAINS "asbdSampleRate")',
-         '--style', 'syslog', '--info', '--debug'],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        bufsize=1,
-        text=True
-    )
-
     prev_sample_rate = None
     next_sample_rate = None
 
-    music_app = MusicApp.alloc().init()
+    sample_rate_switcher = SampleRateSwitcher(make_backend(settings.get("switcher_backend", "coreaudio")))
+    scheduler = SwitchScheduler(sample_rate_switcher, playback_clock.playback_info, map_sample_rate)
+
+    def handle_event(event):
+        nonlocal prev_sample_rate, next_sample_rate
+        # Determine if this is a "current" or "next" sample rate based on the log line source
+        if isinstance(event, StreamFormat):
+            observe_detection(event, "current")
+            state.update("info", rendition=event.rendition, bitdepth=event.bitdepth)
+
+            if event.sample_rate is not None:
+                sample_rate = event.sample_rate
+                if prev_sample_rate is not None:
+                    if floats_differ(sample_rate, prev_sample_rate):
+                        print(f"Sample rate changed: {prev_sample_rate} Hz -> {sample_rate} Hz")
+                    else:
+                        print(f"Sample rate unchanged: still {sample_rate} Hz")
+                if prev_sample_rate is None or floats_differ(sample_rate, prev_sample_rate):
+                    print(f"Current sample rate: {sample_rate} Hz")
+                    switch = scheduler.on_current_rate(sample_rate, music)
+                    if switch is None:
+                        status = f"Device already at target rate, no pause at {datetime.now().strftime('%H:%M:%S')}"
+                    else:
+                        print(f"Resumed after {switch['gap'] * 1000:.0f} ms")
+                        status = f"Paused and resumed at {datetime.now().strftime('%H:%M:%S')} with sample rate {sample_rate} Hz"
+                    prev_sample_rate = sample_rate
+                    next_sample_rate = None  # Reset any pending "next" value
+
+                    state.update("info", sample_rate=sample_rate, status=status, last_switch=scheduler.switches[-1])
+
+        elif isinstance(event, NextFormat):
+            observe_detection(event, "next")
+            sample_rate = event.sample_rate
+            if sample_rate != prev_sample_rate and sample_rate != next_sample_rate:
+                next_sample_rate = sample_rate
+                # Known ahead of time: switch at the track boundary instead of pausing mid-playback
+                target = scheduler.on_next_rate(sample_rate)
+                if target is not None:
+                    print(f"Next sample rate: {sample_rate} Hz, switching to {target} Hz at track boundary")
+
+    # Reading the log never waits on a switch; a dead `log stream` is restarted and catches up via `log show`
+    log_pipeline = LogPipeline(log_stream_process, handle_event, catch_up_fn=log_show_lines)
+    try:
+        log_pipeline.run(shutdown_event)
+    finally:
+        log_pipeline.stop()
+        scheduler.cancel_pending()
+        sample_rate_switcher.close()
 
+# Current-track fetches: bounded pool, one fetch per album/artist, results for skipped tracks dropped
+fetch_scheduler = FetchScheduler()
+
+def fetch_artwork(lookup_id, lookup_type):
+    if lookup_type == "album-id":
+        return artwork_resolver.resolve_album(album_id=lookup_id)
+    return artwork_resolver.resolve_album(track_id=lookup_id)
+
+def prepare_artwork_variants(album_id):
+    try:
+        placeholder = artwork_derivatives().placeholder(album_id)
+    except Exception as e:
+        print(f"⚠️ Could not build artwork placeholder for {album_id}: {e}")
+        return
+    if album_id != artwork_album_id:
+        # The track changed while the original was downloading
+        return
+    state.update("nowplaying", ArtworkPlaceholder=placeholder, ArtworkVariants=f"/artwork/{album_id}")
     try:
-        for line in process.stdout:
-            #print(f"line:{line}")
-            # Determine if this is a "current" or "next" sample rate based on the log line source
-            if "FigStreamPlayer" in line and "SampleRate" in line:
-                rendition_match = re.search(r'\[Rendition ([^\]]+)\]', line)
-                bitdepth_match = re.search(r'\[BitDepth (\d+)\]', line)
-                rendition = rendition_match.group(1) if rendition_match else "Unknown"
-                bitdepth = int(bitdepth_match.group(1)) if bitdepth_match else None
-                current_info["rendition"] = rendition
-                current_info["bitdepth"] = bitdepth
-
-                match = re.search(r'\[SampleRate\s+(\d+(?:\.\d+)?)\]', line)
-                if match:
-                    sample_rate = float(match.group(1))
-                    if prev_sample_rate is not None:
-                        if floats_differ(sample_rate, prev_sample_rate):
-                            print(f"Sample rate changed: {prev_sample_rate} kHz -> {sample_rate} kHz")
-                        else:
-                            print(f"Sample rate unchanged: still {sample_rate} kHz")
-                    if prev_sample_rate is None or floats_differ(sample_rate, prev_sample_rate):
-                        match_time = datetime.now()
-                        print(f"Current sample rate: {sample_rate} kHz")
-                        pause_start = datetime.now()
-                        music_app.pause()
-                        pause_end = datetime.now()
-                        pause_duration = (pause_end - pause_start).total_seconds()
-                        #print(f"Pause script duration: {pause_duration:.2f}s")
-                        pause_time = datetime.now()
-                        elapsed = (pause_time - match_time).total_seconds()
-                        #print(f"Paused at {pause_time.strftime('%H:%M:%S')} (elapsed {elapsed:.2f}s since detection)")
-                        print(f"Paused")
-                        # Load sample rate matching from settings
-                        sample_rate_match = settings.get("sample_rate_match", {})
-                        enabled = sample_rate_match.get("enabled", False)
-                        mappings = sample_rate_match.get("mapping", {})
-
-                        target_sample_rate = sample_rate  # Default: no remapping
-
-                        if enabled:
-                            # Normalize sample rate to kHz for mapping lookup
-                            normalized_sample_rate_khz = int(sample_rate / 1000)
-                            mapped_value = mappings.get(str(normalized_sample_rate_khz))
-                            if mapped_value is not None:
-                                target_sample_rate = mapped_value * 1000  # convert back to Hz
-                                print(f"✅ Sample rate matching applied: {normalized_sample_rate_khz} kHz -> {mapped_value} kHz")
-                            else:
-                                print(f"⚠️ No mapping for {normalized_sample_rate_khz} kHz found in user settings. Using original sample rate.")
-                        else:
-                            print("ℹ️ Sample rate matching disabled.")
-
-                        subprocess.run(['./srswitch.swift', str(target_sample_rate)])
-
-                        music_app.play()
-                        print(f"Resumed")
-                        prev_sample_rate = sample_rate
-                        next_sample_rate = None  # Reset any pending "next" value
-
-                        current_info["sample_rate"] = sample_rate
-                        current_info["status"] = f"Paused and resumed at {datetime.now().strftime('%H:%M:%S')} with sample rate {sample_rate} kHz"
-
-            elif "mediaFormatinfo" in line and "asbdSampleRate" in line:
-                match = re.search(r'asbdSampleRate\s*=\s*([\d.]+)', line)
-                if match:
-                    sample_rate = float(match.group(1))
-                    if sample_rate != prev_sample_rate and sample_rate != next_sample_rate:
-                        next_sample_rate = sample_rate
-                        #print(f"Next sample rate: {sample_rate} kHz")
-    except KeyboardInterrupt:
-        process.terminate()
-        print("\nStopped monitoring.")
+        palette = artwork_palettes().get(album_id)
+    except Exception as e:
+        print(f"⚠️ Could not extract artwork palette for {album_id}: {e}")
+        return
+    if album_id != artwork_album_id:
+        return
+    state.update("nowplaying", Palette=palette)
+
+def animated_artwork_url(result, warm=False):
+    # The stream clients should play: picked by codec/resolution settings, served through the local HLS cache
+    from hls_proxy import animated_artwork_settings, select_animated_variant
+    prefs = animated_artwork_settings(settings)
+    url = select_animated_variant(result.variants, prefs)
+    if url is None or not prefs["proxy"]:
+        return url
+    return hls_proxy().warm(url) if warm else hls_proxy().register(url)
+
+def on_next_album_ready(album):
+    state.update("info", next_artwork=album.artwork)
+    # Start caching the upcoming animated artwork so it plays from disk at the boundary
+    animated_artwork_url(album, warm=True)
+
+def apply_album_artwork(result):
+    global last_artwork, last_avc, last_hevc, artwork_album_id
+    changes = {}
+    artwork_album_id = result.album_id
+    if result.artwork and result.album_id:
+        artwork_sources[str(result.album_id)] = result.artwork
+        # Download the original and derive the inline placeholder off the watcher thread
+        threading.Thread(target=prepare_artwork_variants, args=(result.album_id,), daemon=True).start()
+    if result.artwork:
+        changes["Artwork"] = result.artwork
+        last_artwork = result.artwork
+    if result.avc:
+        changes["AVC"] = result.avc
+        last_avc = result.avc
+    if result.hevc:
+        changes["HEVC"] = result.hevc
+        last_hevc = result.hevc
+    changes["AnimatedArtwork"] = animated_artwork_url(result)
+    state.update("nowplaying", **changes)
+    if result.artwork:
+        state.update_with("info", lambda info: {**info, "artwork_version": info["artwork_version"] + 1})
+    print(result.artwork)
+
+def fetch_artist_art(artist_id):
+    return artwork_resolver.resolve_artist(artist_id)
+
+def apply_artist_art(result):
+    global artist_art_url
+    if result.url:
+        artist_art_url = result.url
+        print(f"Captured ArtistArt URL: {artist_art_url}")
+        state.update("nowplaying", ArtistArt=artist_art_url)
+
+def on_nowplaying_changed(data, previous):
+    def merge(current):
+        info = dict(data)
+        if last_artwork:
+            info["Artwork"] = last_artwork
+        if last_avc:
+            info["AVC"] = last_avc
+        if last_hevc:
+            info["HEVC"] = last_hevc
+        for key in ("ArtistArt", "Duration", "Position", "ArtworkPlaceholder", "ArtworkVariants", "AnimatedArtwork", "Palette", "Clock"):
+            if key in current:
+                info[key] = current[key]
+        return info
+    # Publishes a new Clock anchor first if playback state, position or track changed
+    playback_clock.observe(data)
+    state.update_with("nowplaying", merge)
+
+def on_track_changed(data, previous):
+    global last_album_id, last_artist_id, artwork_album_id
+    album_id = data.get("Album ID")
+    if album_id or "iTunes Track ID" in data:
+        if album_id:
+            lookup_id = album_id
+            lookup_type = "album-id"
+        else:
+            lookup_id = data["iTunes Track ID"]
+            lookup_type = "track-id"
+            if lookup_id != last_album_id:
+                print(f"No album ID found. Using track ID {lookup_id} as fallback.")
+        if lookup_id != last_album_id:
+            # Derived from the previous album's original; set again once the new one is downloaded and analysed
+            artwork_album_id = None
+            state.discard("nowplaying", "ArtworkVariants", "ArtworkPlaceholder", "Palette")
+            prefetched = artwork_prefetcher.take_album(lookup_id)
+            if prefetched:
+                # Resolved while the previous track was playing, swap in right away
+                fetch_scheduler.adopt("album", lookup_id, prefetched, apply_album_artwork)
+            else:
+                fetch_scheduler.request("album", lookup_id,
+                                        lambda: fetch_artwork(lookup_id, lookup_type), apply_album_artwork)
+            last_album_id = lookup_id
+
+    artist_id = data.get("Artist ID")
+    if artist_id and artist_id != last_artist_id:
+        state.discard("nowplaying", "ArtistArt")
+        prefetched = artwork_prefetcher.take_artist(artist_id)
+        if prefetched:
+            fetch_scheduler.adopt("artist", artist_id, prefetched, apply_artist_art)
+        else:
+            fetch_scheduler.request("artist", artist_id, lambda: fetch_artist_art(artist_id), apply_artist_art)
+        last_artist_id = artist_id
+
+    if lyrics_prefs["enabled"]:
+        playback = parse_playback(data)
+        track = {
+            "track_id": data.get("iTunes Track ID"),
+            "title": data.get("Title"),
+            "artist": data.get("Artist"),
+            "album": data.get("Album"),
+            "duration": playback[1] if playback else None,
+        }
+        lyrics_key = LyricsResolver.key(track)
+        if lyrics_key != lyrics_tracker.key:
+            # Clear the previous track's lines right away, the lookup usually hits memory or disk
+            lyrics_tracker.load(lyrics_key, None)
+            fetch_scheduler.request("lyrics", lyrics_key, lambda: lyrics_resolver.resolve(track),
+                                    lambda result: lyrics_tracker.load(lyrics_key, result))
+
+    # The old "next" track is now playing, look at the new one
+    artwork_prefetcher.wake()
+
+artwork_prefetcher = ArtworkPrefetcher(
+    artwork_resolver,
+    lambda: get_track_info('next'),
+    on_album_ready=on_next_album_ready
+)
+
+nowplaying_watcher = NowPlayingWatcher("nowplaying.json")
+nowplaying_watcher.subscribe("change", on_nowplaying_changed)
+nowplaying_watcher.subscribe("track", on_track_changed)
 
 def monitor_now_playing():
-    global last_album_id, last_artwork, last_avc, last_hevc
-    subprocess.Popen(['swift', 'nowplaying.swift'])
-    while True:
-        try:
-            with open("nowplaying.json", "r") as f:
-                data = json.load(f)
-                nowplaying_info.clear()
-                nowplaying_info.update(data)
-                album_id = data.get("Album ID")
-                if album_id or "iTunes Track ID" in data:
-                    if album_id:
-                        lookup_id = album_id
-                        lookup_type = "album-id"
-                    else:
-                        lookup_id = data["iTunes Track ID"]
-                        lookup_type = "track-id"
-                        if lookup_id != last_album_id:
-                            print(f"No album ID found. Using track ID {lookup_id} as fallback.")
-                    if lookup_id != last_album_id:
-                        def fetch_artwork(lookup_id):
-                            result = subprocess.run(
-                                ['python', 'artwork.py', f'--{lookup_type}', str(lookup_id)],
-                                capture_output=True, text=True
-                            )
-                            avc = hevc = artwork = None
-                            for line in result.stdout.splitlines():
-                                if line.startswith("AVC:"):
-                                    avc = line.split(":", 1)[1].strip()
-                                elif line.startswith("HEVC:"):
-                                    hevc = line.split(":", 1)[1].strip()
-                                elif line.startswith("Artwork:"):
-                                    artwork = line.split(":", 1)[1].strip()
-                            if artwork:
-                                nowplaying_info["Artwork"] = artwork
-                                global last_artwork
-                                last_artwork = artwork
-                                current_info["artwork_version"] += 1
-                            if avc:
-                                nowplaying_info["AVC"] = avc
-                                global last_avc
-                                last_avc = avc
-                            if hevc:
-                                nowplaying_info["HEVC"] = hevc
-                                global last_hevc
-                                last_hevc = hevc
-                            print(artwork)
-                        threading.Thread(target=fetch_artwork, args=(lookup_id,), daemon=True).start()
-                        last_album_id = lookup_id
-
-                # Only update nowplaying_info with cached values *after* checking for new artwork
-                if last_artwork:
-                    nowplaying_info["Artwork"] = last_artwork
-                if last_avc:
-                    nowplaying_info["AVC"] = last_avc
-                if last_hevc:
-                    nowplaying_info["HEVC"] = last_hevc
-
-                artist_id = data.get("Artist ID")
-                if artist_id:
-                    if artist_id != nowplaying_info.get("Artist ID"):
-                        def fetch_artist_art(artist_id):
-                            result = subprocess.run(
-                                ['python', 'artistart.py', str(artist_id)],
-                                capture_output=True, text=True
-                            )
-                            print(f"artistart.py stdout:\n{result.stdout}")
-                            print(f"artistart.py stderr:\n{result.stderr}")
-                            global artist_art_url
-                            for line in result.stdout.splitlines():
-                                if line.startswith("ArtistArt:"):
-                                    artist_art_url = line.split(":", 1)[1].strip()
-                                    print(f"Captured ArtistArt URL: {artist_art_url}")
-                                    nowplaying_info["ArtistArt"] = artist_art_url
-
-                        threading.Thread(target=fetch_artist_art, args=(artist_id,), daemon=True).start()
-            # Add duration and position to nowplaying_info
-            duration, position = get_current_playback_info()
-            if duration is not None and position is not None:
-                nowplaying_info["Duration"] = duration
-                nowplaying_info["Position"] = position
-        except Exception:
-            pass
-        time.sleep(0.1)
+    nowplaying_watcher.start()
+    artwork_prefetcher.start()
+    playback_clock.run(shutdown_event)
 
 @app.route("/")
 def index():
+    snapshot = state.snapshot
+    nowplaying_info = snapshot["nowplaying"]
     print(nowplaying_info.get("Artwork"))
     fresh_settings = load_settings()
     return render_template(
         "index.html",
-        info=current_info,
+        info=snapshot["info"],
         nowplaying=nowplaying_info,
         artwork=nowplaying_info.get("Artwork"),
         avc=nowplaying_info.get("AVC"),
@@ -308,65 +444,189 @@ def index():
 
 @app.route("/vistest")
 def vistest():
+    snapshot = state.snapshot
+    nowplaying_info = snapshot["nowplaying"]
     print(nowplaying_info.get("Artwork"))
     return render_template(
         "vistest.html",
-        info=current_info,
+        info=snapshot["info"],
         nowplaying=nowplaying_info,
         artwork=nowplaying_info.get("Artwork"),
         avc=nowplaying_info.get("AVC"),
         hevc=nowplaying_info.get("HEVC")
     )
 
-# New route for AJAX live data
-@app.route("/data")
-def data():
+def build_data(snapshot=None):
+    snapshot = snapshot or state.snapshot
     return {
-        "info": current_info,
-        "nowplaying": nowplaying_info,
-        "artwork_version": current_info["artwork_version"],
-        "device": device_info,
-        "artist_art": nowplaying_info.get("ArtistArt")
+        "info": snapshot["info"],
+        "nowplaying": snapshot["nowplaying"],
+        "artwork_version": snapshot["info"]["artwork_version"],
+        "device": snapshot["device"],
+        "artist_art": snapshot["nowplaying"].get("ArtistArt"),
+        "next_artwork": snapshot["info"].get("next_artwork"),
+        "palette": snapshot["nowplaying"].get("Palette"),
+        "player": snapshot["player"],
+        "lyrics": snapshot["lyrics"]
     }
 
+event_broadcaster = EventBroadcaster(build_data, version_fn=lambda: state.version,
+                                     max_clients=server_settings(settings)["max_streams"])
+
+# New route for AJAX live data (polling fallback for /events)
+@app.route("/data")
+def data():
+    start = time.perf_counter()
+    snapshot = state.snapshot
+    etag = state.etag(snapshot)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # Weak comparison, as for GET; the header holds tags without their quotes
+    if request.if_none_match.contains_weak(etag.strip('"')):
+        response = Response(status=304, headers=headers)
+    else:
+        # Serialised once per state version, however many clients ask
+        body = state.render_json(build_data, snapshot)
+        response = Response(body, mimetype="application/json", headers=headers)
+    metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, path="/data", status=response.status_code)
+    return response
+
+metrics.REGISTRY.gauge("spezi_event_clients", "Connected /events clients.", function=lambda: event_broadcaster.client_count)
+metrics.REGISTRY.gauge("spezi_state_version", "Version of the live state store.", function=lambda: state.version)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+# Downscaled artwork variants, e.g. /artwork/1440857781/512.webp
+@app.route("/artwork/<album_id>/<int:size>.<fmt>")
+def artwork_variant(album_id, size, fmt):
+    from derivatives import DerivativeError
+    try:
+        path, mimetype, etag = artwork_derivatives().variant(album_id, size, fmt)
+    except DerivativeError as e:
+        return {"error": str(e)}, 404
+    except Exception as e:
+        return {"error": f"Failed to build artwork: {e}"}, 502
+    # conditional=True answers If-None-Match with 304 and Range requests with 206
+    return send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=86400)
+
+# Locally cached animated artwork streams
+@app.route("/hls/<stream_id>/index.m3u8")
+def hls_playlist(stream_id):
+    try:
+        text = hls_proxy().playlist(stream_id)
+    except (KeyError, FileNotFoundError):
+        return {"error": "Unknown stream"}, 404
+    except Exception as e:
+        return {"error": f"Failed to fetch playlist: {e}"}, 502
+    return Response(text, mimetype="application/vnd.apple.mpegurl")
+
+@app.route("/hls/<stream_id>/seg/<name>")
+def hls_segment(stream_id, name):
+    try:
+        path, mimetype = hls_proxy().segment(stream_id, int(name.split(".")[0]))
+    except (KeyError, ValueError, IndexError, FileNotFoundError):
+        return {"error": "Unknown segment"}, 404
+    except Exception as e:
+        return {"error": f"Failed to fetch segment: {e}"}, 502
+    return send_file(path, mimetype=mimetype, conditional=True, max_age=86400)
+
+# Server-Sent Events: one snapshot, then only the changed keys
+@app.route("/events")
+def events():
+    try:
+        client = event_broadcaster.subscribe()
+    except TooManyClients as e:
+        # EventSource gives up on a 503, and the page falls back to polling /data
+        return {"error": str(e)}, 503, {"Retry-After": "30"}
+    response = Response(
+        stream_with_context(event_broadcaster.stream(client)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Frees the slot even if the client is gone before the stream is first read
+    response.call_on_close(lambda: event_broadcaster.unsubscribe(client))
+    return response
+
+# Binary audio feature frames (see audio_features.FRAME_HEADER), only when enabled in settings
+@app.route("/audio/features")
+def audio_features():
+    if audio_analyzer is None:
+        return {"error": "Audio features are disabled"}, 404
+    try:
+        client = audio_analyzer.subscribe()
+    except TooManyClients as e:
+        return {"error": str(e)}, 503, {"Retry-After": "30"}
+    response = Response(
+        stream_with_context(audio_analyzer.stream(client)),
+        mimetype="application/octet-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Audio-Bands": str(audio_analyzer.bands),
+            "X-Audio-Fps": str(audio_analyzer.fps),
+        }
+    )
+    response.call_on_close(lambda: audio_analyzer.unsubscribe(client))
+    return response
+
+def publish_player_result(result):
+    metrics.PLAYER_OPERATION_SECONDS.observe(result["seconds"], status=result["status"])
+    # The last few results, so clients can match their command IDs from /data or /events
+    state.update_with("player", lambda player: {**player, "commands": (list(player.get("commands", [])) + [result])[-16:]})
+
+# One long-lived worker owns Music for /player; bursts are merged while queued
+player_controller = PlayerController(music, on_complete=publish_player_result)
+
 # Flask route for player controls
 @app.route("/player/<command>")
 def player_control(command):
-    music = SBApplication.applicationWithBundleIdentifier_("com.apple.Music")
     command = command.lower()
-    if command == "play":
-        music.playOnce_(None)
-        return {"status": "playing"}
-    elif command == "pause":
-        music.pause()
-        return {"status": "paused"}
-    elif command == "next":
-        music.nextTrack()
-        return {"status": "next"}
-    elif command == "previous":
-        music.previousTrack()
-        return {"status": "previous"}
-    elif command == "shuffle_on":
-        music.setShuffleEnabled_(True)
-        return {"status": "shuffle_on"}
-    elif command == "shuffle_off":
-        music.setShuffleEnabled_(False)
-        return {"status": "shuffle_off"}
-    else:
+    try:
+        command_id = player_controller.submit(command)
+    except ValueError:
         return {"error": "Invalid command"}, 400
-
-# Function to periodically load device.json
-def monitor_device_info():
-    global device_info
-    while True:
-        try:
-            with open("device.json", "r") as f:
-                data = json.load(f)
-                device_info.clear()
-                device_info.update(data)
-        except Exception:
-            pass
-        time.sleep(0.1)
+    metrics.PLAYER_COMMANDS_TOTAL.inc(command=command)
+    return {"status": "queued", "id": command_id, "command": command}, 202
+
+# Full text of the current track's lyrics; /events only carries the current and next line
+@app.route("/lyrics")
+def current_lyrics():
+    lyrics = lyrics_tracker.lyrics
+    if lyrics is None:
+        return {"error": "No lyrics for the current track"}, 404
+    return {"key": lyrics_tracker.key, **lyrics.to_dict()}
+
+@app.route("/player/commands/<int:command_id>")
+def player_command_status(command_id):
+    result = player_controller.status(command_id)
+    if result is None:
+        return {"error": "Unknown command"}, 404
+    return result
+
+# device.py publishes one JSON line per change of output device, rate or bit depth
+def on_device_line(line):
+    try:
+        state.replace("device", json.loads(line))
+    except ValueError:
+        pass
+
+def nowplaying_written(helper):
+    # Ready once the helper has written nowplaying.json since it was launched
+    return os.path.getmtime("nowplaying.json") >= helper.started_at
+
+# Started in parallel from __main__, restarted with backoff if they crash, stopped by shutdown()
+supervisor = Supervisor()
+supervisor.add(Helper(
+    "nowplaying",
+    lambda: swift_command(os.path.join(BASE_DIR, "nowplaying.swift")),
+    ready=nowplaying_written
+))
+supervisor.add(Helper(
+    "device",
+    [sys.executable, os.path.join(BASE_DIR, "device.py"), "--backend", settings.get("device_backend", "coreaudio")],
+    on_line=on_device_line
+))
 
 @app.route("/visualizers")
 def list_visualizers():
@@ -402,21 +662,74 @@ def get_settings():
 @app.route('/settings', methods=['POST'])
 def update_settings():
     global settings
-    new_settings = request.json
-    save_settings(new_settings)
-    settings = load_settings()
+    # The settings dialog only posts the keys it shows; keep the rest (e.g. "server")
+    new_settings = {**load_settings(), **(request.json or {})}
+    try:
+        settings = save_settings(new_settings)
+    except SettingsError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
     print("✅ Settings reloaded:", settings)
     return jsonify({"status": "success"})
 
+audio_analyzer = None
+
+def start_audio_analyzer():
+    # Off by default; only then is numpy (and sounddevice) imported
+    if not settings.get("audio_features", {}).get("enabled", False):
+        return None
+    from audio_features import AudioAnalyzer, audio_feature_settings, make_source as make_audio_source
+    prefs = audio_feature_settings(settings)
+    try:
+        analyzer = AudioAnalyzer(make_audio_source(prefs), bands=prefs["bands"], fps=prefs["fps"],
+                                 max_clients=prefs["max_clients"])
+    except Exception as e:
+        print(f"⚠️ Audio features unavailable: {e}")
+        return None
+    analyzer.start()
+    return analyzer
+
+def stop_streams():
+    # Runs before the server drains its threads, each open stream holds one
+    event_broadcaster.close()
+    if audio_analyzer is not None:
+        audio_analyzer.stop()
+
+def shutdown():
+    shutdown_event.set()
+    nowplaying_watcher.stop()
+    player_controller.stop()
+    lyrics_tracker.stop()
+    supervisor.stop()
+    if log_pipeline is not None:
+        log_pipeline.stop()
+    fetch_scheduler.close()
+    if _hls_proxy is not None:
+        _hls_proxy.close()
+    artwork_resolver.close()
+
+def report_startup(timeout=30):
+    supervisor.wait_ready(timeout)
+    startup.mark("helpers")
+    print(startup.report(supervisor))
+
+startup.mark("init")
+
 if __name__ == "__main__":
-    subprocess.Popen(["python3", "device.py"])
+    supervisor.start()
     threading.Thread(target=monitor_sample_rate, daemon=True).start()
     threading.Thread(target=monitor_now_playing, daemon=True).start()
-    threading.Thread(target=monitor_device_info, daemon=True).start()
+    event_broadcaster.start()
+    player_controller.start()
+    if lyrics_prefs["enabled"]:
+        lyrics_tracker.start()
+    audio_analyzer = start_audio_analyzer()
+    threading.Thread(target=report_startup, daemon=True).start()
     def open_browser_when_ready(url, timeout=10):
+        import webbrowser
+        import requests
         for _ in range(timeout * 10):
             try:
-                r = requests.get(url)
+                r = requests.get(url, timeout=1)
                 if r.status_code == 200:
                     webbrowser.get("safari").open(url)
                     return
@@ -431,4 +744,5 @@ if __name__ == "__main__":
     if settings.get("open_browser", True):  # default True for safety
         threading.Thread(target=open_browser_when_ready, args=(url,), daemon=True).start()
 
-    app.run(debug=True, use_reloader=False, host="0.0.0.0", port=port)
+    stream_slots = event_broadcaster.max_clients + (audio_analyzer.max_clients if audio_analyzer is not None else 0)
+    run_server(app, "0.0.0.0", port, settings, on_shutdown=shutdown, stream_slots=stream_slots, on_stopping=stop_streams)
@@ -0,0 +1,229 @@
+import bisect
+import threading
+import time
+
+# Seconds; covers sub-millisecond CoreAudio calls up to multi-second artwork fetches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        # Unlabelled gauges can be read on scrape instead of being kept up to date
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def render(self):
+        if self.function is not None:
+            try:
+                self.set(self.function())
+            except Exception:
+                pass
+        return super().render()
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram. observe() is one bisect and a few additions under a lock."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [per-bucket counts..., +Inf count, sum]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time of its block."""
+        return _Timer(self, labels)
+
+    def _render_series(self, key, series):
+        lines = []
+        cumulative = 0
+        bounds = self.buckets + (float("inf"),)
+        for bound, count in zip(bounds, series[:-1]):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Sample-rate switching: detection is log line timestamp -> handled; pause/switch/resume/total come from the switcher
+SWITCH_STAGE_SECONDS = REGISTRY.histogram(
+    "spezi_switch_stage_seconds", "Duration of each sample-rate switch stage.", ("mode", "stage"))
+SWITCHES_TOTAL = REGISTRY.counter(
+    "spezi_switches_total", "Sample-rate switch decisions by mode (pause, boundary, skipped).", ("mode",))
+SWITCH_FAILURES_TOTAL = REGISTRY.counter(
+    "spezi_switch_failures_total", "Switches the device did not confirm.", ("mode",))
+
+# Artwork: one observation per network fetch, plus whole resolves split by cache outcome
+ARTWORK_FETCH_SECONDS = REGISTRY.histogram(
+    "spezi_artwork_fetch_seconds", "Duration of artwork and artist-art network fetches.", ("stage",))
+ARTWORK_RESOLVE_SECONDS = REGISTRY.histogram(
+    "spezi_artwork_resolve_seconds", "Duration of album/artist artwork resolves.", ("kind", "cache"))
+ARTWORK_FETCH_ERRORS_TOTAL = REGISTRY.counter(
+    "spezi_artwork_fetch_errors_total", "Failed artwork and artist-art fetches.", ("stage",))
+ARTWORK_FETCH_QUEUE_DEPTH = REGISTRY.gauge(
+    "spezi_artwork_fetch_queue_depth", "Current-track artwork fetches waiting for a worker.")
+ARTWORK_FETCHES_DROPPED_TOTAL = REGISTRY.counter(
+    "spezi_artwork_fetches_dropped_total", "Superseded artwork fetches, cancelled before starting or with results discarded.", ("kind", "reason"))
+ARTWORK_FETCHES_DEDUPLICATED_TOTAL = REGISTRY.counter(
+    "spezi_artwork_fetches_deduplicated_total", "Artwork requests that joined a fetch already in flight.", ("kind",))
+
+ARTWORK_PREFETCHES_TOTAL = REGISTRY.counter(
+    "spezi_artwork_prefetches_total", "Upcoming-track prefetches started (one per change of the next track).")
+ARTWORK_PREFETCHES_CANCELLED_TOTAL = REGISTRY.counter(
+    "spezi_artwork_prefetches_cancelled_total", "Prefetches cancelled before starting because the next track changed again.")
+
+POLL_LOOP_SECONDS = REGISTRY.histogram(
+    "spezi_poll_loop_seconds", "Duration of one playback drift check against Music.")
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "spezi_http_request_seconds", "Latency of selected HTTP endpoints.", ("path", "status"))
+LYRICS_RESOLVE_SECONDS = REGISTRY.histogram(
+    "spezi_lyrics_resolve_seconds", "Duration of lyrics lookups by where the answer came from.", ("source",))
+PLAYER_COMMANDS_TOTAL = REGISTRY.counter(
+    "spezi_player_commands_total", "Player commands received on /player.", ("command",))
+PLAYER_OPERATION_SECONDS = REGISTRY.histogram(
+    "spezi_player_operation_seconds", "Duration of coalesced player operations against Music.", ("status",))
+LOG_LINES_TOTAL = REGISTRY.counter(
+    "spezi_log_lines_total", "Lines read from the log stream.")
+LOG_EVENTS_TOTAL = REGISTRY.counter(
+    "spezi_log_events_total", "Sample-rate events parsed from the log stream.", ("event",))
+LOG_QUEUE_DEPTH = REGISTRY.gauge(
+    "spezi_log_queue_depth", "Parsed log events waiting for the switch handler.")
+LOG_QUEUE_LAG_SECONDS = REGISTRY.histogram(
+    "spezi_log_queue_lag_seconds", "Time a log event waited between being read and being handled.")
+LOG_EVENTS_COALESCED_TOTAL = REGISTRY.counter(
+    "spezi_log_events_coalesced_total", "Queued log events merged into a newer one before handling.")
+LOG_EVENTS_DROPPED_TOTAL = REGISTRY.counter(
+    "spezi_log_events_dropped_total", "Log events dropped because the queue was full.")
+LOG_STREAM_RESTARTS_TOTAL = REGISTRY.counter(
+    "spezi_log_stream_restarts_total", "Times the log stream process exited and was restarted.")
+HELPER_UP = REGISTRY.gauge(
+    "spezi_helper_up", "1 while a supervised helper process is running and ready.", ("helper",))
+HELPER_RESTARTS_TOTAL = REGISTRY.counter(
+    "spezi_helper_restarts_total", "Helper processes restarted after exiting.", ("helper",))
+STARTUP_PHASE_SECONDS = REGISTRY.gauge(
+    "spezi_startup_phase_seconds", "Wall time of each startup phase.", ("phase",))
@@ -0,0 +1,151 @@
+import subprocess
+import threading
+import time
+
+BUNDLE_ID = "com.apple.Music"
+
+
+class ScriptingBridgeMusic:
+    """Apple Music via ScriptingBridge, with osascript for the current/next track's tags.
+
+    pyobjc is imported here rather than at module level so everything else
+    can be imported (and replayed) on machines without it.
+    """
+
+    name = "scriptingbridge"
+
+    def __init__(self):
+        from ScriptingBridge import SBApplication
+        self.app = SBApplication.applicationWithBundleIdentifier_(BUNDLE_ID)
+
+    def playback_info(self):
+        """(duration, position) in seconds, or (None, None) when Music isn't playing anything."""
+        if not self.app or not self.app.isRunning():
+            return None, None
+        current_track = self.app.currentTrack()
+        player_position = self.app.playerPosition()
+        if current_track:
+            return current_track.duration(), player_position
+        return None, None
+
+    def track_info(self, which="current"):
+        script = f'''
+        tell application "Music"
+            set t to {which} track
+            return (get name of t) & "¶" & (get artist of t) & "¶" & (get album of t)
+        end tell
+        '''
+        result = subprocess.run(['osascript', '-e', script], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        name, artist, album = result.stdout.strip().split("¶")
+        return {"name": name, "artist": artist, "album": album}
+
+    def pause(self):
+        self.app.pause()
+
+    def play(self):
+        self.app.playOnce_(None)
+
+    def next_track(self):
+        self.app.nextTrack()
+
+    def previous_track(self):
+        self.app.previousTrack()
+
+    def set_shuffle(self, enabled):
+        self.app.setShuffleEnabled_(enabled)
+
+
+class FakeMusic:
+    """Scripted Music for Linux and the replay harness.
+
+    load() sets the queue, start_track() makes one track current with its
+    clock at 0. The position advances in real time while playing. Every
+    transport call is recorded as (name, time.monotonic()).
+    """
+
+    name = "fake"
+
+    def __init__(self, command_delay=0.0):
+        self.command_delay = command_delay
+        self.tracks = []
+        self.index = None
+        self.playing = False
+        self.shuffle = False
+        self.calls = []
+        self._position = 0.0
+        self._since = None
+        self._lock = threading.Lock()
+
+    def load(self, tracks):
+        """tracks: dicts with name, artist, album and duration."""
+        with self._lock:
+            self.tracks = list(tracks)
+            self.index = None
+
+    def _elapsed(self):
+        if self.playing and self._since is not None:
+            return self._position + time.monotonic() - self._since
+        return self._position
+
+    def start_track(self, index):
+        with self._lock:
+            self.index = index
+            self._position = 0.0
+            self._since = time.monotonic()
+            self.playing = True
+
+    def playback_info(self):
+        with self._lock:
+            if self.index is None:
+                return None, None
+            duration = self.tracks[self.index]["duration"]
+            return duration, min(self._elapsed(), duration)
+
+    def track_info(self, which="current"):
+        with self._lock:
+            if self.index is None:
+                return None
+            index = self.index + (1 if which == "next" else 0)
+            if index >= len(self.tracks):
+                return None
+            track = self.tracks[index]
+            return {"name": track["name"], "artist": track["artist"], "album": track["album"]}
+
+    def _command(self, name):
+        if self.command_delay:
+            time.sleep(self.command_delay)
+        self.calls.append((name, time.monotonic()))
+
+    def pause(self):
+        self._command("pause")
+        with self._lock:
+            self._position = self._elapsed()
+            self.playing = False
+
+    def play(self):
+        self._command("play")
+        with self._lock:
+            self._since = time.monotonic()
+            self.playing = True
+
+    def next_track(self):
+        self._command("next")
+
+    def previous_track(self):
+        self._command("previous")
+
+    def set_shuffle(self, enabled):
+        self._command("shuffle_on" if enabled else "shuffle_off")
+        self.shuffle = enabled
+
+
+BACKENDS = {
+    "scriptingbridge": ScriptingBridgeMusic,
+    "fake": FakeMusic,
+}
+
+
+def make_music(name="scriptingbridge"):
+    return BACKENDS[name]()
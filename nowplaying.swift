@@ -145,13 +145,15 @@ func printNowPlayingInfo(_ info: [String: AnyObject]) {
     }
     if let timestamp = info["kMRMediaRemoteNowPlayingInfoTimestamp"] as? Date {
         let formatter = ISO8601DateFormatter()
+        // Sub-second precision: clients extrapolate the position from this anchor
+        formatter.formatOptions = [.withInternetDateTime, .withFractionalSeconds]
         metadata["Timestamp"] = formatter.string(from: timestamp)
     }
 
     if let jsonData = try? JSONSerialization.data(withJSONObject: metadata, options: [.prettyPrinted]) {
         let fileURL = URL(fileURLWithPath: FileManager.default.currentDirectoryPath).appendingPathComponent("nowplaying.json")
         do {
-            try jsonData.write(to: fileURL)
+            try jsonData.write(to: fileURL, options: .atomic)
         } catch {
             print("❌ Failed to write JSON to file: \(error)")
         }
@@ -0,0 +1,231 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+# Keys that identify the track itself; a change in any of them is a "track" event
+TRACK_KEYS = ("Title", "Artist", "Album", "Album ID", "Artist ID", "iTunes Track ID")
+# Keys that only move while the same track keeps playing
+POSITION_KEYS = ("Playback", "Playback State", "Timestamp")
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class NowPlayingWatcher:
+    """Watches nowplaying.json and dispatches events only when its contents change.
+
+    Uses inotify on Linux and a cheap stat()/mtime check everywhere else. Each
+    accepted change replaces the whole snapshot dict, so readers never see a
+    half-updated one.
+    """
+
+    def __init__(self, path="nowplaying.json", poll_interval=0.25, use_inotify=True):
+        self.path = os.path.abspath(path)
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.snapshot = {}
+        self.parse_count = 0
+        self._last_raw = None
+        self._last_stat = None
+        self._subscribers = {"change": [], "track": [], "position": []}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, event, callback):
+        if event not in self._subscribers:
+            raise ValueError(f"Unknown event: {event}")
+        self._subscribers[event].append(callback)
+
+    def check(self):
+        """Re-read the file if it changed on disk. Returns True if a new snapshot was published."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat_key == self._last_stat:
+            return False
+        self._last_stat = stat_key
+
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return False
+        if raw == self._last_raw:
+            return False
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            # Caught the writer mid-write; the next event or poll picks up the full file
+            self._last_stat = None
+            return False
+        self._last_raw = raw
+        self.parse_count += 1
+
+        previous = self.snapshot
+        self.snapshot = data
+        self._dispatch("change", data, previous)
+        if any(data.get(k) != previous.get(k) for k in TRACK_KEYS):
+            self._dispatch("track", data, previous)
+        elif any(data.get(k) != previous.get(k) for k in POSITION_KEYS):
+            self._dispatch("position", data, previous)
+        return True
+
+    def _dispatch(self, event, data, previous):
+        for callback in self._subscribers[event]:
+            try:
+                callback(data, previous)
+            except Exception as e:
+                print(f"❌ nowplaying {event} subscriber failed: {e}")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def run(self):
+        self.check()
+        libc = _load_inotify() if self.use_inotify else None
+        if libc is not None and self._run_inotify(libc):
+            return
+        self._run_polling()
+
+    def _run_polling(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.poll_interval)
+
+    def _run_inotify(self, libc):
+        fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if fd < 0:
+            return False
+        directory, filename = os.path.split(self.path)
+        # Watch the directory so atomic rename-into-place writes are seen too
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            os.close(fd)
+            return False
+        name = os.fsencode(filename)
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 1.0)
+                if not ready:
+                    continue
+                try:
+                    buf = os.read(fd, 4096)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                touched = False
+                while offset < len(buf):
+                    _, _, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+                    start = offset + _EVENT_HEADER.size
+                    if buf[start:start + length].rstrip(b"\0") == name:
+                        touched = True
+                    offset = start + length
+                if touched:
+                    self.check()
+        finally:
+            os.close(fd)
+        return True
+
+
+def _now():
+    # The anchor nowplaying.swift writes: when MediaRemote sampled the elapsed time
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+class FakeNowPlayingWriter:
+    """Stand-in for nowplaying.swift, writes the same JSON layout atomically."""
+
+    def __init__(self, path="nowplaying.json"):
+        self.path = os.path.abspath(path)
+        self.data = {}
+
+    def write(self, data):
+        self.data = dict(data)
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".nowplaying.", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def play(self, title, artist, album, album_id=None, artist_id=None, track_id=None, duration=180.0):
+        data = {
+            "Title": title,
+            "Artist": artist,
+            "Album": album,
+            "Playback": f"0.0/{duration} seconds",
+            "Playback State": "Playing",
+            "Timestamp": _now(),
+        }
+        if album_id is not None:
+            data["Album ID"] = album_id
+        if artist_id is not None:
+            data["Artist ID"] = artist_id
+        if track_id is not None:
+            data["iTunes Track ID"] = track_id
+        self.write(data)
+
+    def seek(self, elapsed):
+        duration = self.data.get("Playback", "0/0 seconds").split("/")[1].split()[0]
+        self.write({**self.data, "Playback": f"{elapsed}/{duration} seconds", "Timestamp": _now()})
+
+    def pause(self):
+        self.write({**self.data, "Playback State": "Paused", "Timestamp": _now()})
+
+
+if __name__ == "__main__":
+    # Demo: drive the watcher with the fake writer (works on Linux without the Swift helper)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nowplaying.json")
+        watcher = NowPlayingWatcher(path)
+        watcher.subscribe("track", lambda d, p: print(f"track: {d.get('Title')} - {d.get('Artist')}"))
+        watcher.subscribe("position", lambda d, p: print(f"position: {d.get('Playback')} ({d.get('Playback State')})"))
+        watcher.start()
+
+        writer = FakeNowPlayingWriter(path)
+        writer.play("Song A", "Artist A", "Album A", album_id=1, artist_id=10, duration=200.0)
+        time.sleep(0.3)
+        writer.write(writer.data)  # identical contents, must not dispatch
+        time.sleep(0.3)
+        writer.seek(42.0)
+        time.sleep(0.3)
+        writer.pause()
+        time.sleep(0.3)
+        writer.play("Song B", "Artist B", "Album B", album_id=2, artist_id=20, duration=150.0)
+        time.sleep(0.3)
+        watcher.stop()
+        print(f"parsed {watcher.parse_count} times")
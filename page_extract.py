@@ -0,0 +1,107 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 16 * 1024
+# (connect, read) seconds; a stalled host must not hold a resolver worker forever
+TIMEOUT = (5, 15)
+
+
+class _StartTag(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tag = None
+        self.attrs = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.tag is None:
+            self.tag = tag
+            self.attrs = {name: value for name, value in attrs}
+
+    handle_startendtag = handle_starttag
+
+
+def parse_start_tag(text):
+    """(tag, attrs) of a single start tag like '<meta property="og:image" ...>'."""
+    parser = _StartTag()
+    parser.feed(text)
+    parser.close()
+    return parser.tag, parser.attrs
+
+
+class TagScanner:
+    """Finds the first <tag> with matching attributes in text fed chunk by chunk.
+
+    Only the bytes up to the wanted tag are ever looked at: feed() does a
+    plain substring search for "<tag", and just that one tag is handed to
+    html.parser to decode its attributes. Nothing before the match is kept
+    around, so memory stays at roughly one chunk no matter how big the page
+    is. Tag names are matched as written in the page (lower case for Apple's).
+    """
+
+    def __init__(self, tag, attrs=None):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.result = None
+        self.bytes_seen = 0
+        self._needle = "<" + tag
+        # A start tag up to its closing '>', skipping over quoted attribute values
+        self._pattern = re.compile(re.escape(self._needle) + r"""(?=[\s/>])(?:[^>"']|"[^"]*"|'[^']*')*>""")
+        self._buffer = ""
+
+    def _matches(self, attrs):
+        return all(attrs.get(name) == value for name, value in self.attrs.items())
+
+    def feed(self, text, size=None):
+        """Add the next chunk. Returns the tag's attributes once found, else None."""
+        if self.result is not None:
+            return self.result
+        self.bytes_seen += len(text) if size is None else size
+        buffer = self._buffer + text
+        pos = 0
+        while True:
+            start = buffer.find(self._needle, pos)
+            if start < 0:
+                # Keep just enough of the tail to catch a needle split across chunks
+                self._buffer = buffer[max(pos, len(buffer) - len(self._needle)):]
+                return None
+            match = self._pattern.match(buffer, start)
+            if match is None:
+                end = start + len(self._needle)
+                if end >= len(buffer) or buffer[end] in " \t\r\n\f/>":
+                    # Our tag, cut off at the end of this chunk
+                    self._buffer = buffer[start:]
+                    return None
+                # A longer tag name that merely starts with ours
+                pos = end
+                continue
+            tag, attrs = parse_start_tag(match.group(0))
+            if tag == self.tag and self._matches(attrs):
+                self.result = attrs
+                self._buffer = ""
+                return attrs
+            pos = match.end()
+
+
+def iter_text(response, chunk_size=CHUNK_SIZE):
+    """(text, raw byte count) chunks of a streamed requests response, decoded incrementally."""
+    # requests assumes ISO-8859-1 for text/* without a charset; pages without one are UTF-8 in practice
+    has_charset = "charset" in response.headers.get("Content-Type", "").lower()
+    decoder = codecs.getincrementaldecoder(response.encoding if has_charset else "utf-8")(errors="replace")
+    for chunk in response.iter_content(chunk_size):
+        yield decoder.decode(chunk), len(chunk)
+    yield decoder.decode(b"", final=True), 0
+
+
+def fetch_tag(session, url, tag, attrs=None, headers=None, chunk_size=CHUNK_SIZE, timeout=TIMEOUT):
+    """Stream `url` and return (attrs of the first matching tag or None, bytes read).
+
+    The response is closed as soon as the tag has been seen, so the rest of
+    the page is never downloaded or decoded.
+    """
+    scanner = TagScanner(tag, attrs)
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        for text, size in iter_text(response, chunk_size):
+            if scanner.feed(text, size) is not None:
+                break
+    return scanner.result, scanner.bytes_seen
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from derivatives import downscale
+
+# numpy is imported on first use, it is the slowest import on main.py's startup path
+
+SAMPLE_SIZE = 64
+PALETTE_SIZE = 5
+# Palette entries closer than this (0-255 RGB distance) are treated as the same colour
+MIN_DISTANCE = 48
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+
+
+def _hex(rgb):
+    return "#{:02x}{:02x}{:02x}".format(*(int(round(c)) for c in rgb))
+
+
+def relative_luminance(rgb):
+    """WCAG relative luminance of 0-255 sRGB values; works on (..., 3) arrays too."""
+    import numpy as np
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def contrast_ratio(l1, l2):
+    hi, lo = max(l1, l2), min(l1, l2)
+    return (hi + 0.05) / (lo + 0.05)
+
+
+def text_color(luminance):
+    """Black or white, whichever reads better on a background of this luminance."""
+    if contrast_ratio(luminance, 0.0) >= contrast_ratio(luminance, 1.0):
+        return _hex(BLACK)
+    return _hex(WHITE)
+
+
+def extract_palette(image, count=PALETTE_SIZE, sample_size=SAMPLE_SIZE):
+    """Dominant colours, average luminance and readable text colours for an image.
+
+    The image is downsampled to sample_size, every pixel is dropped into a
+    4-bit-per-channel bin, and bin populations and colour sums come from
+    one bincount each, so the work is a handful of array passes regardless
+    of how many colours the artwork has.
+    """
+    import numpy as np
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as opened:
+            return extract_palette(opened, count, sample_size)
+    small = downscale(image, sample_size, Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.uint8).reshape(-1, 3)
+
+    q = pixels >> 4
+    bins = (q[:, 0].astype(np.int32) << 8) | (q[:, 1].astype(np.int32) << 4) | q[:, 2]
+    counts = np.bincount(bins, minlength=4096)
+    sums = np.stack([np.bincount(bins, weights=pixels[:, i], minlength=4096) for i in range(3)], axis=1)
+    occupied = np.flatnonzero(counts)
+    means = sums[occupied] / counts[occupied, None]
+    order = np.argsort(counts[occupied])[::-1]
+
+    colors, shares = [], []
+    for i in order:
+        rgb = means[i]
+        if colors and np.min(np.linalg.norm(np.asarray(colors) - rgb, axis=1)) < MIN_DISTANCE:
+            continue
+        colors.append(rgb)
+        shares.append(counts[occupied[i]] / len(pixels))
+        if len(colors) == count:
+            break
+
+    colors = np.asarray(colors)
+    luminances = relative_luminance(colors)
+    average = float(relative_luminance(pixels).mean())
+    return {
+        "colors": [
+            {"hex": _hex(rgb), "share": round(float(share), 4),
+             "luminance": round(float(lum), 4), "text": text_color(lum)}
+            for rgb, share, lum in zip(colors, shares, luminances)
+        ],
+        "dominant": _hex(colors[0]),
+        "average_luminance": round(average, 4),
+        "dark": average < 0.18,
+        "text": text_color(average),
+    }
+
+
+class ArtworkPalettes:
+    """extract_palette() results per artwork, keyed by the derivative store's content hash.
+
+    Keying by hash rather than album ID means the local cover.png is
+    recomputed when it changes, and albums sharing artwork share an entry.
+    """
+
+    def __init__(self, derivatives, max_entries=256):
+        self.derivatives = derivatives
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, album_id):
+        digest, path = self.derivatives.original(album_id)
+        with self._lock:
+            palette = self._cache.get(digest)
+            if palette is not None:
+                self._cache.move_to_end(digest)
+                return palette
+        palette = extract_palette(path)
+        with self._lock:
+            self._cache[digest] = palette
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return palette
@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import datetime
+
+
+def parse_playback(data):
+    """(position, duration, rate, timestamp) from a nowplaying.json dict, or None.
+
+    "Playback" is "<elapsed>/<duration> seconds" and "Timestamp" is when
+    MediaRemote sampled that elapsed time; timestamp is None if missing.
+    """
+    playback = data.get("Playback")
+    if not playback:
+        return None
+    try:
+        elapsed, duration = playback.split()[0].split("/")
+        position, duration = float(elapsed), float(duration)
+    except ValueError:
+        return None
+    rate = 1.0 if data.get("Playback State") == "Playing" else 0.0
+    timestamp = None
+    if data.get("Timestamp"):
+        try:
+            timestamp = datetime.fromisoformat(data["Timestamp"].replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return position, duration, rate, timestamp
+
+
+class PlaybackClock:
+    """Track position as an anchor (position at timestamp, rate, duration) instead of polling.
+
+    The anchor only changes on play, pause, seek or track change, which all
+    show up in nowplaying.json, so clients and the switch scheduler
+    extrapolate the position themselves. drift_fn (Music's own
+    (duration, position)) is only asked every drift_interval seconds to catch
+    anything the file missed. Timestamps are epoch seconds so browsers can
+    use them directly.
+    """
+
+    def __init__(self, drift_fn=None, drift_interval=10.0, tolerance=0.5, on_anchor=None):
+        self.drift_fn = drift_fn
+        self.drift_interval = drift_interval
+        self.tolerance = tolerance
+        self.on_anchor = on_anchor
+        self.anchor = None
+        self.anchor_count = 0
+        self.drift_checks = 0
+        self._last_sample = None
+        self._lock = threading.Lock()
+
+    def position(self, now=None):
+        anchor = self.anchor
+        if anchor is None:
+            return None
+        now = time.time() if now is None else now
+        position = anchor["position"] + (now - anchor["timestamp"]) * anchor["rate"]
+        return min(max(position, 0.0), anchor["duration"])
+
+    def playback_info(self):
+        """(duration, position) like Music's, without asking Music."""
+        anchor = self.anchor
+        if anchor is None:
+            return None, None
+        return anchor["duration"], self.position()
+
+    def set_anchor(self, position, duration, rate, timestamp=None):
+        """Publish a new anchor unless it agrees with the current one. Returns the anchor or None."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            current = self.anchor
+            if current is not None and current["rate"] == rate and current["duration"] == duration:
+                predicted = current["position"] + (timestamp - current["timestamp"]) * current["rate"]
+                if abs(predicted - position) <= self.tolerance:
+                    return None
+            self.anchor = {"position": position, "timestamp": timestamp, "rate": rate, "duration": duration}
+            self.anchor_count += 1
+            anchor = self.anchor
+        if self.on_anchor is not None:
+            self.on_anchor(anchor)
+        return anchor
+
+    def observe(self, data):
+        """Re-anchor from a nowplaying.json snapshot. Returns the new anchor or None."""
+        parsed = parse_playback(data)
+        if parsed is None:
+            return None
+        position, duration, rate, timestamp = parsed
+        return self.set_anchor(position, duration, rate, timestamp)
+
+    def check_drift(self):
+        """Compare against Music once; re-anchor if the extrapolation is off by more than tolerance."""
+        if self.drift_fn is None:
+            return None
+        self.drift_checks += 1
+        duration, position = self.drift_fn()
+        now = time.time()
+        if duration is None or position is None:
+            return None
+        # Music doesn't say whether it's playing; infer it from how far the position moved since last time
+        rate = self.anchor["rate"] if self.anchor else 1.0
+        if self._last_sample is not None:
+            last_position, last_time = self._last_sample
+            moved = (position - last_position) / max(now - last_time, 1e-6)
+            # Going backwards is a new track or a seek, which says nothing about the rate
+            if moved >= 0:
+                rate = 1.0 if moved > 0.5 else 0.0
+        self._last_sample = (position, now)
+        return self.set_anchor(position, duration, rate, now)
+
+    def run(self, stop_event):
+        while not stop_event.wait(self.drift_interval):
+            try:
+                self.check_drift()
+            except Exception as e:
+                print(f"⚠️ Playback drift check failed: {e}")
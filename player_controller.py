@@ -0,0 +1,156 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+# command -> (kind, value). Consecutive commands of the same kind are merged while queued.
+COMMANDS = {
+    "play": ("transport", "play"),
+    "pause": ("transport", "pause"),
+    "next": ("skip", 1),
+    "previous": ("skip", -1),
+    "shuffle_on": ("shuffle", True),
+    "shuffle_off": ("shuffle", False),
+}
+
+
+class _Operation:
+    __slots__ = ("kind", "value", "ids", "commands")
+
+    def __init__(self, kind, value, command_id, command):
+        self.kind = kind
+        self.value = value
+        self.ids = [command_id]
+        self.commands = [command]
+
+    def merge(self, value, command_id, command):
+        if self.kind == "skip":
+            self.value += value
+        else:
+            # play/pause and shuffle only care about the final state
+            self.value = value
+        self.ids.append(command_id)
+        self.commands.append(command)
+
+
+class PlayerController:
+    """The one place that talks to Music for /player commands.
+
+    submit() queues a command and returns its ID right away; a single worker
+    thread runs them in order against a long-lived backend (music.py). While
+    a command waits, later ones of the same kind are folded into it: n× next
+    becomes one skip of n, next+previous cancel out, and play/pause or
+    shuffle bursts collapse to the last requested state. on_complete(result)
+    is called once per executed operation with every command ID it covered.
+    """
+
+    def __init__(self, music, on_complete=None, history=256):
+        self.music = music
+        self.on_complete = on_complete
+        self.history = history
+        self.results = OrderedDict()
+        self.executed = 0
+        self.submitted = 0
+        self._ids = itertools.count(1)
+        self._queue = []
+        self._cond = threading.Condition()
+        self._stopped = False
+
+    def submit(self, command):
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command {command!r}")
+        kind, value = COMMANDS[command]
+        with self._cond:
+            command_id = next(self._ids)
+            self.submitted += 1
+            if self._queue and self._queue[-1].kind == kind:
+                self._queue[-1].merge(value, command_id, command)
+            else:
+                self._queue.append(_Operation(kind, value, command_id, command))
+            self._remember(command_id, {"id": command_id, "command": command, "status": "queued"})
+            self._cond.notify()
+        return command_id
+
+    def _remember(self, command_id, result):
+        self.results[command_id] = result
+        while len(self.results) > self.history:
+            self.results.popitem(last=False)
+
+    def status(self, command_id):
+        with self._cond:
+            return self.results.get(command_id)
+
+    @property
+    def pending(self):
+        with self._cond:
+            return sum(len(op.ids) for op in self._queue)
+
+    def _execute(self, op):
+        if op.kind == "transport":
+            if op.value == "play":
+                self.music.play()
+            else:
+                self.music.pause()
+            return op.value
+        if op.kind == "skip":
+            step = self.music.next_track if op.value > 0 else self.music.previous_track
+            for _ in range(abs(op.value)):
+                step()
+            return f"skip {op.value:+d}" if op.value else "skip 0"
+        self.music.set_shuffle(op.value)
+        return "shuffle_on" if op.value else "shuffle_off"
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                op = self._queue.pop(0)
+            start = time.perf_counter()
+            try:
+                executed = self._execute(op)
+                result = {"status": "done", "executed": executed}
+            except Exception as e:
+                print(f"❌ Player command {op.commands} failed: {e}")
+                result = {"status": "error", "error": str(e)}
+            result.update({
+                "ids": op.ids,
+                "commands": op.commands,
+                "seconds": round(time.perf_counter() - start, 4),
+                "finished": time.time(),
+            })
+            with self._cond:
+                self.executed += 1
+                for command_id, command in zip(op.ids, op.commands):
+                    self._remember(command_id, {"id": command_id, "command": command, **result})
+            if self.on_complete is not None:
+                self.on_complete(result)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+if __name__ == "__main__":
+    # Burst commands at the fake player the way a quick tapper would
+    from music import FakeMusic
+
+    music = FakeMusic(command_delay=0.05)
+    controller = PlayerController(music, on_complete=lambda r: print(f"done {r['ids']}: {r['executed']} ({r['seconds'] * 1000:.0f} ms)"))
+    controller.start()
+    start = time.perf_counter()
+    for command in ["next"] * 5 + ["previous"] + ["pause", "play", "pause"] + ["next"] * 3:
+        controller.submit(command)
+        time.sleep(0.01)
+    print(f"submitted {controller.submitted} commands in {(time.perf_counter() - start) * 1000:.0f} ms")
+    while controller.pending:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    print(f"{controller.submitted} commands -> {controller.executed} operations, player calls: {[c for c, _ in music.calls]}")
@@ -0,0 +1,129 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import ARTWORK_PREFETCHES_CANCELLED_TOTAL, ARTWORK_PREFETCHES_TOTAL
+
+
+class ArtworkPrefetcher:
+    """Resolves artwork and artist art for the upcoming track while the current one plays.
+
+    next_track_fn returns {"name", "artist", "album"} for the next track (or
+    None). Results are kept in memory until the track actually starts and
+    the resolver's cache is warmed as a side effect. Whenever the upcoming
+    track changes (skip, queue edit), the generation is bumped: pending jobs
+    are cancelled and results of jobs already running are dropped. Failed
+    resolves are not kept, so the track's own fetch runs when it starts.
+    """
+
+    def __init__(self, resolver, next_track_fn, max_concurrent=2, interval=15.0, max_ready=8, on_album_ready=None):
+        self.resolver = resolver
+        self.on_album_ready = on_album_ready
+        self.next_track_fn = next_track_fn
+        self.interval = interval
+        self.max_ready = max_ready
+        self.generation = 0
+        self.upcoming = None
+        self._ready_albums = {}
+        # track ID -> album ID, so a track-ID lookup finds the album entry without storing it twice
+        self._track_albums = {}
+        self._ready_artists = {}
+        self._futures = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="prefetch")
+        self._thread = None
+
+    def _track_key(self, track):
+        return (track.get("name"), track.get("artist"), track.get("album"))
+
+    def refresh(self):
+        """Check the upcoming track and start prefetching it if it changed."""
+        track = self.next_track_fn()
+        if not track:
+            return
+        key = self._track_key(track)
+        with self._lock:
+            if key == self.upcoming:
+                return
+            self.upcoming = key
+            self.generation += 1
+            generation = self.generation
+            for future in self._futures:
+                if future.cancel():
+                    ARTWORK_PREFETCHES_CANCELLED_TOTAL.inc()
+            ARTWORK_PREFETCHES_TOTAL.inc()
+            self._futures = [self._executor.submit(self._prefetch, track, generation)]
+
+    def _is_current(self, generation):
+        return generation == self.generation
+
+    def _prefetch(self, track, generation):
+        try:
+            ids = self.resolver.search(track["name"], track["artist"], track.get("album"))
+        except Exception as e:
+            print(f"Prefetch lookup failed for {track.get('name')}: {e}")
+            return
+        if not ids or not self._is_current(generation):
+            return
+        print(f"Prefetching artwork for next track: {track['name']} - {track['artist']}")
+        if ids.get("album_id"):
+            album = self.resolver.resolve_album(album_id=str(ids["album_id"]))
+            with self._lock:
+                if album.artwork and self._is_current(generation):
+                    self._store_album(album, ids.get("track_id"))
+                else:
+                    album = None
+            if album is not None and self.on_album_ready is not None:
+                self.on_album_ready(album)
+        if ids.get("artist_id") and self._is_current(generation):
+            artist = self.resolver.resolve_artist(str(ids["artist_id"]))
+            with self._lock:
+                if artist.url and self._is_current(generation):
+                    self._store(self._ready_artists, artist.artist_id, artist)
+
+    def _store(self, ready, key, value):
+        ready[key] = value
+        evicted = []
+        while len(ready) > self.max_ready:
+            evicted.append(ready.pop(next(iter(ready))))
+        return evicted
+
+    def _store_album(self, album, track_id=None):
+        album_id = str(album.album_id)
+        if track_id:
+            self._track_albums[str(track_id)] = album_id
+        for evicted in self._store(self._ready_albums, album_id, album):
+            self._drop_aliases(str(evicted.album_id))
+
+    def _drop_aliases(self, album_id):
+        for track_id in [t for t, a in self._track_albums.items() if a == album_id]:
+            del self._track_albums[track_id]
+
+    def take_album(self, lookup_id):
+        """Prefetched AlbumArtwork for an album or track ID, or None."""
+        with self._lock:
+            album_id = self._track_albums.get(str(lookup_id), str(lookup_id))
+            album = self._ready_albums.pop(album_id, None)
+            self._drop_aliases(album_id)
+            return album
+
+    def take_artist(self, artist_id):
+        with self._lock:
+            return self._ready_artists.pop(str(artist_id), None)
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Prefetch refresh failed: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
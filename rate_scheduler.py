@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+
+from metrics import SWITCH_FAILURES_TOTAL, SWITCH_STAGE_SECONDS, SWITCHES_TOTAL
+
+
+def rates_match(a, b, epsilon=0.5):
+    return a is not None and b is not None and abs(a - b) <= epsilon
+
+
+class SwitchScheduler:
+    """Decides when and how the output device follows the track's sample rate.
+
+    - on_next_rate(): Music announced the format of the upcoming track
+      (mediaFormatinfo). The switch is scheduled for the track boundary,
+      using the current track's duration/position, and happens without
+      pausing.
+    - on_current_rate(): FigStreamPlayer reports what is playing now. If the
+      device is already at the mapped target (boundary switch done, or
+      the mapping folds both rates together) nothing is paused; otherwise
+      the old pause -> switch -> resume path runs.
+
+    Every switch is recorded with its mode and gap so the pause-always
+    behaviour can be compared against this one. device_rate is only read
+    and written under _lock, and _switch_lock makes the check and the
+    switch one step, so a boundary switch in flight finishes before
+    on_current_rate decides whether it still has to pause.
+    """
+
+    def __init__(self, switcher, playback_info_fn, map_fn, lead=0.15, history=200):
+        self.switcher = switcher
+        self.playback_info_fn = playback_info_fn
+        self.map_fn = map_fn
+        self.lead = lead
+        self.device_rate = None
+        self.switches = deque(maxlen=history)
+        self._pending = None
+        self._lock = threading.Lock()
+        # Held around check-and-switch; always taken before _lock
+        self._switch_lock = threading.Lock()
+
+    def _record(self, mode, rate, gap):
+        entry = {"mode": mode, "rate": rate, "gap": gap, "time": time.time()}
+        self.switches.append(entry)
+        SWITCHES_TOTAL.inc(mode=mode)
+        return entry
+
+    def cancel_pending(self):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.set()
+                self._pending = None
+
+    def on_next_rate(self, sample_rate):
+        target = self.map_fn(sample_rate)
+        cancel = threading.Event()
+        with self._lock:
+            if rates_match(target, self.device_rate):
+                return None
+            if self._pending is not None:
+                self._pending.set()
+            self._pending = cancel
+        threading.Thread(target=self._switch_at_boundary, args=(target, cancel), daemon=True).start()
+        return target
+
+    def _switch_at_boundary(self, target, cancel):
+        while not cancel.is_set():
+            duration, position = self.playback_info_fn()
+            if duration is None or position is None:
+                return
+            remaining = duration - position
+            if remaining <= self.lead:
+                break
+            # Re-check at least once a second so seeks and pauses move the deadline
+            cancel.wait(min(remaining - self.lead, 1.0))
+        with self._switch_lock:
+            with self._lock:
+                if cancel.is_set() or rates_match(target, self.device_rate):
+                    return
+                self._pending = None
+            start = time.perf_counter()
+            confirmed = self.switcher.switch(target)
+            gap = time.perf_counter() - start
+            if confirmed is not None:
+                with self._lock:
+                    self.device_rate = target
+        SWITCH_STAGE_SECONDS.observe(gap, mode="boundary", stage="switch")
+        if confirmed is not None:
+            print(f"✅ Switched to {target} Hz at track boundary ({gap * 1000:.0f} ms, no pause)")
+            self._record("boundary", target, gap)
+        else:
+            print(f"⚠️ Boundary switch to {target} Hz was not confirmed")
+            SWITCH_FAILURES_TOTAL.inc(mode="boundary")
+
+    def on_current_rate(self, sample_rate, player):
+        """Returns the switch record, or None if the device was already at the target."""
+        self.cancel_pending()
+        target = self.map_fn(sample_rate)
+        with self._switch_lock:
+            with self._lock:
+                skip = rates_match(target, self.device_rate)
+            if not skip:
+                confirmed, timings = self.switcher.pause_switch_resume(player, target)
+                if confirmed is not None:
+                    with self._lock:
+                        self.device_rate = target
+        if skip:
+            self._record("skipped", target, 0.0)
+            return None
+        for stage, seconds in timings.items():
+            SWITCH_STAGE_SECONDS.observe(seconds, mode="pause", stage=stage)
+        if confirmed is None:
+            print(f"⚠️ Device did not confirm {target} Hz")
+            SWITCH_FAILURES_TOTAL.inc(mode="pause")
+        return self._record("pause", target, timings["total"])
+
+    def stats(self):
+        summary = {}
+        for entry in self.switches:
+            mode = summary.setdefault(entry["mode"], {"count": 0, "total_gap": 0.0, "max_gap": 0.0})
+            mode["count"] += 1
+            mode["total_gap"] += entry["gap"]
+            mode["max_gap"] = max(mode["max_gap"], entry["gap"])
+        for mode in summary.values():
+            mode["mean_gap"] = mode["total_gap"] / mode["count"]
+        return summary
@@ -0,0 +1,475 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import queue
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from requests.adapters import HTTPAdapter
+from PIL import Image
+
+from bench_logparser import NEXT_FORMAT, STREAM_FORMAT
+from nowplaying_watcher import FakeNowPlayingWriter
+from switcher import FakeBackend
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RATES = [44100, 48000, 96000, 192000]
+
+
+def synthetic_session(tracks=8, duration=4.0, seed=1):
+    """A listening session touching every path: rate changes announced ahead and not,
+    repeated albums, albums without animated artwork, and a track known only by track ID."""
+    rng = random.Random(seed)
+    session = []
+    album = None
+    for i in range(tracks):
+        if album is None or rng.random() < 0.6:
+            n = len({t["album_id"] for t in session}) + 1
+            album = {
+                "album": f"Album {n}",
+                "album_id": 1000 + n,
+                "artist": f"Artist {n}",
+                "artist_id": 5000 + n,
+                "animated": rng.random() < 0.7,
+                "sample_rate": rng.choice(RATES),
+            }
+        session.append({
+            **album,
+            "name": f"Song {i + 1}",
+            "track_id": 90000 + i,
+            "duration": duration,
+            "bitdepth": 24 if album["sample_rate"] > 48000 else 16,
+            "announce": rng.random() < 0.7,
+            "use_track_id": rng.random() < 0.15,
+        })
+    return session
+
+
+def artwork_url(album_id):
+    return f"https://a1.mzstatic.com/us/r1000/{album_id}/source.jpg"
+
+
+def artist_url(artist_id):
+    return f"https://is1-ssl.mzstatic.com/image/thumb/{artist_id}/3000x3000cc.jpg"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves what the Apple and bendodson endpoints would, for the albums in the session.
+
+    Requests arrive as /<original host>/<original path> through FixtureAdapter.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type="application/json", status=200):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        time.sleep(self.server.delay)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        return host, "/" + path, parse_qs(parts.query)
+
+    def do_GET(self):
+        host, path, query = self._route()
+        albums = self.server.albums
+        segments = path.strip("/").split("/")
+        if host == "music.apple.com" and "/album/" in path:
+            album = albums.get(int(segments[-1]))
+            video = f'<amp-ambient-video src="https://mvod.itunes.apple.com/{album["album_id"]}/master.m3u8">' \
+                if album and album["animated"] else ""
+            return self._send(f"<html><body>{video}</body></html>", "text/html")
+        if host == "music.apple.com" and "/artist/" in path:
+            image = f"https://is1-ssl.mzstatic.com/image/thumb/{segments[-1]}/600x600bb.jpg"
+            return self._send(f'<html><head><meta property="og:image" content="{image}"></head></html>', "text/html")
+        if host == "mvod.itunes.apple.com":
+            return self._video(segments[0], segments[-1])
+        if host == "itunesartwork.bendodson.com":
+            album_id = query["query"][0]
+            return self._send(json.dumps({"url": f"https://itunes.apple.com/lookup?id={album_id}&entity=album&callback=callback"}))
+        if host == "itunes.apple.com" and path == "/lookup":
+            key = int(query["id"][0])
+            album = albums.get(key) or self.server.tracks.get(key)
+            body = json.dumps({"resultCount": 1 if album else 0,
+                               "results": [{"collectionId": album["album_id"]}] if album else []})
+            return self._send(f"callback({body})" if "callback" in query else body)
+        if host == "itunes.apple.com" and path == "/search":
+            term = query["term"][0]
+            results = [{
+                "trackName": t["name"], "artistName": t["artist"], "collectionName": t["album"],
+                "trackId": t["track_id"], "collectionId": t["album_id"], "artistId": t["artist_id"],
+            } for t in self.server.tracks.values() if term == f"{t['artist']} {t['name']}"]
+            return self._send(json.dumps({"resultCount": len(results), "results": results}))
+        if host == "a1.mzstatic.com":
+            return self._send(self.server.image(int(segments[-2])), "image/jpeg")
+        self._send(json.dumps({"error": "no fixture"}), status=404)
+
+    def do_POST(self):
+        host, path, query = self._route()
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        album_id = json.loads(form["json"][0])["results"][0]["collectionId"]
+        self._send(json.dumps([
+            {"uncompressed": f"https://a1.mzstatic.com/us/r1000/{album_id}/source-longer-name.jpg"},
+            {"uncompressed": artwork_url(album_id)},
+        ]))
+
+    def _video(self, album_id, name):
+        if name == "master.m3u8":
+            base = f"https://mvod.itunes.apple.com/{album_id}"
+            return self._send(
+                "#EXTM3U\n"
+                '#EXT-X-STREAM-INF:BANDWIDTH=4000000,RESOLUTION=1080x1080,CODECS="avc1.640028"\n'
+                f"{base}/avc.m3u8\n"
+                '#EXT-X-STREAM-INF:BANDWIDTH=9000000,RESOLUTION=2160x2160,CODECS="hvc1.2.4.L153.B0"\n'
+                f"{base}/hevc.m3u8\n",
+                "application/vnd.apple.mpegurl")
+        if name.endswith(".m3u8"):
+            return self._send(
+                "#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-TARGETDURATION:4\n#EXT-X-PLAYLIST-TYPE:VOD\n"
+                '#EXT-X-MAP:URI="init.mp4"\n'
+                + "".join(f"#EXTINF:4.0,\nseg{i}.m4s\n" for i in range(3))
+                + "#EXT-X-ENDLIST\n",
+                "application/vnd.apple.mpegurl")
+        return self._send(b"\0" * self.server.segment_bytes, "video/mp4")
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, session, delay=0.0, segment_bytes=256 * 1024):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.albums = {t["album_id"]: t for t in session}
+        self.tracks = {t["track_id"]: t for t in session}
+        self.delay = delay
+        self.segment_bytes = segment_bytes
+        self._images = {}
+
+    def image(self, album_id):
+        if album_id not in self._images:
+            rng = random.Random(album_id)
+            out = io.BytesIO()
+            Image.new("RGB", (1400, 1400), tuple(rng.randrange(256) for _ in range(3))).save(out, "JPEG")
+            self._images[album_id] = out.getvalue()
+        return self._images[album_id]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FixtureAdapter(HTTPAdapter):
+    """Sends https://<host>/<path> to the local fixture server as /<host>/<path>."""
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request = request.copy()
+        request.url = f"{self.base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+class ScriptedLogStream:
+    """Popen-like stand-in for `log stream`: stdout yields lines as the harness emits them."""
+
+    def __init__(self):
+        self._lines = queue.Queue()
+        self.returncode = None
+        self.stdout = iter(self._lines.get, None)
+
+    def emit(self, line):
+        self._lines.put(line + "\n")
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        if self.returncode is None:
+            self.returncode = -15
+            self._lines.put(None)
+
+    kill = terminate
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+class RecordingBackend(FakeBackend):
+    def __init__(self, switch_delay):
+        super().__init__(switch_delay=switch_delay)
+        self.switched = []
+
+    def set_rate(self, sample_rate, timeout=1.0):
+        confirmed = super().set_rate(sample_rate, timeout)
+        self.switched.append((sample_rate, time.monotonic()))
+        return confirmed
+
+
+def log_timestamp():
+    return datetime.now().astimezone().strftime("%Y-%m-%d %H:%M:%S.%f%z")
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class Expectations:
+    """Polls the live state and records how long each expected value took to appear."""
+
+    def __init__(self, state, interval=0.001):
+        self.state = state
+        self.interval = interval
+        self.pending = []
+        self.latencies = {}
+        self.missed = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def expect(self, name, check, timeout=10.0):
+        now = time.monotonic()
+        with self._lock:
+            self.pending.append((name, check, now, now + timeout))
+
+    def run(self):
+        while not self._stopped.is_set():
+            nowplaying = self.state.snapshot["nowplaying"]
+            now = time.monotonic()
+            with self._lock:
+                remaining = []
+                for name, check, start, deadline in self.pending:
+                    if check(nowplaying):
+                        self.latencies.setdefault(name, []).append(now - start)
+                    elif now > deadline:
+                        self.missed[name] = self.missed.get(name, 0) + 1
+                    else:
+                        remaining.append((name, check, start, deadline))
+                self.pending = remaining
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for name, *_ in self.pending:
+                self.missed[name] = self.missed.get(name, 0) + 1
+            self.pending = []
+
+
+def replay(session, args):
+    """Run the session through main's monitor loops. Returns the report dict."""
+    workdir = tempfile.mkdtemp(prefix="spezi-replay-")
+    with open(os.path.join(BASE_DIR, "settings.json")) as f:
+        settings = json.load(f)
+    settings.update({
+        "open_browser": False,
+        "music_backend": "fake",
+        "switcher_backend": "fake",
+        "device_backend": "mock",
+    })
+    settings.setdefault("sample_rate_match", {})["enabled"] = False
+    with open(os.path.join(workdir, "settings.json"), "w") as f:
+        json.dump(settings, f)
+
+    fixtures = FixtureServer(session, delay=args.network_delay / 1000)
+    fixture_url = fixtures.start()
+    log_stream = ScriptedLogStream()
+    backend = RecordingBackend(args.switch_delay / 1000)
+
+    os.chdir(workdir)
+    sys.path.insert(0, BASE_DIR)
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    import main
+
+    adapter = FixtureAdapter(fixture_url, pool_connections=10, pool_maxsize=10)
+    main.artwork_resolver.session.mount("https://", adapter)
+    # The system boundaries replay.py stands in for
+    main.log_stream_process = lambda: log_stream
+    del main.supervisor.helpers["nowplaying"]
+    main.make_backend = lambda name: backend
+    music = main.music
+    music.command_delay = args.command_delay / 1000
+    music.load(session)
+    writer = FakeNowPlayingWriter(os.path.join(workdir, "nowplaying.json"))
+
+    main.supervisor.start()
+    for target in (main.monitor_sample_rate, main.monitor_now_playing):
+        threading.Thread(target=target, daemon=True).start()
+    main.event_broadcaster.start()
+    expectations = Expectations(main.state)
+    threading.Thread(target=expectations.run, daemon=True).start()
+    time.sleep(0.3)
+
+    format_lines = []
+    boundaries = []
+    previous = None
+    for index, track in enumerate(session):
+        boundaries.append(time.monotonic())
+        music.start_track(index)
+        writer.play(track["name"], track["artist"], track["album"],
+                    album_id=None if track["use_track_id"] else track["album_id"],
+                    artist_id=track["artist_id"], track_id=track["track_id"], duration=track["duration"])
+        if previous is None or previous["album_id"] != track["album_id"]:
+            album_id = track["album_id"]
+            expectations.expect("track → artwork", lambda np, a=album_id: np.get("Artwork") == artwork_url(a))
+            expectations.expect("track → placeholder",
+                                lambda np, a=album_id: np.get("ArtworkVariants") == f"/artwork/{a}")
+            if track["animated"]:
+                expectations.expect("track → animated artwork",
+                                    lambda np, a=album_id: str(a) in str(np.get("HEVC")) and bool(np.get("AnimatedArtwork")))
+        if previous is None or previous["artist_id"] != track["artist_id"]:
+            expectations.expect("track → artist art", lambda np, a=track["artist_id"]: np.get("ArtistArt") == artist_url(a))
+
+        time.sleep(args.log_delay / 1000)
+        format_lines.append(time.monotonic())
+        log_stream.emit(STREAM_FORMAT.format(ts=log_timestamp(), rendition="HiResLossless",
+                                             bitdepth=track["bitdepth"], rate=track["sample_rate"]))
+
+        following = session[index + 1] if index + 1 < len(session) else None
+        announced = False
+        while True:
+            duration, position = music.playback_info()
+            remaining = duration - position
+            if following and following["announce"] and not announced and remaining <= args.announce_lead:
+                log_stream.emit(NEXT_FORMAT.format(ts=log_timestamp(), rate=following["sample_rate"]))
+                announced = True
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.01))
+        previous = track
+
+    time.sleep(1.0)
+    expectations.stop()
+    wall = time.monotonic() - wall_start
+    cpu = time.process_time() - cpu_start
+    main.shutdown()
+
+    # Pause path: from the format line that triggered the pause to the play() that ended it
+    resumes = []
+    pauses = [t for name, t in music.calls if name == "pause"]
+    plays = [t for name, t in music.calls if name == "play"]
+    for paused in pauses:
+        emitted = max((t for t in format_lines if t <= paused), default=None)
+        resumed = next((t for t in plays if t >= paused), None)
+        if emitted is not None and resumed is not None:
+            resumes.append(resumed - emitted)
+    # Boundary path: when the device changed relative to the track change (negative = before it)
+    offsets = []
+    for rate, switched in backend.switched:
+        if any(switched - 1.0 <= p <= switched for p in pauses):
+            continue
+        boundary = min(boundaries, key=lambda b: abs(b - switched))
+        offsets.append(switched - boundary)
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak_mb = peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+    latencies = dict(expectations.latencies)
+    latencies["rate change → playback resumed"] = resumes
+    latencies["boundary switch − track change"] = offsets
+    return {
+        "tracks": len(session),
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "child_cpu_seconds": children.ru_utime + children.ru_stime,
+        "peak_rss_mb": peak_mb,
+        "pauses": len(pauses),
+        "switches": len(backend.switched),
+        "missed": expectations.missed,
+        "latencies": {
+            name: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+                   "max": max(values) if values else None}
+            for name, values in latencies.items()
+        },
+    }
+
+
+def print_report(report, baseline=None):
+    def ms(value):
+        return "     -" if value is None else f"{value * 1000:6.1f}"
+
+    def delta(name, key):
+        if not baseline:
+            return ""
+        before = baseline["latencies"].get(name, {}).get(key)
+        after = report["latencies"][name][key]
+        if before is None or after is None:
+            return ""
+        return f"  ({(after - before) * 1000:+.1f} ms vs baseline)"
+
+    print(f"Replayed {report['tracks']} tracks in {report['wall_seconds']:.1f} s: "
+          f"{report['switches']} device switches, {report['pauses']} pauses")
+    print(f"{'':34} {'n':>3} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7}")
+    for name, stats in report["latencies"].items():
+        print(f"{name:34} {stats['count']:3d} {ms(stats['p50'])}  {ms(stats['p95'])}  {ms(stats['max'])}"
+              + delta(name, "p50"))
+    for name, count in report["missed"].items():
+        print(f"⚠️ {name}: {count} never appeared")
+    cpu_line = f"CPU {report['cpu_seconds']:.2f} s (+{report['child_cpu_seconds']:.2f} s in helpers), peak RSS {report['peak_rss_mb']:.0f} MB"
+    if baseline:
+        cpu_line += f" (baseline CPU {baseline['cpu_seconds']:.2f} s, RSS {baseline['peak_rss_mb']:.0f} MB)"
+    print(cpu_line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a listening session through the real monitor loops with fake Music, CoreAudio and network.")
+    parser.add_argument("--session", help="JSON list of tracks (see synthetic_session) instead of a synthetic session.")
+    parser.add_argument("--tracks", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=4.0, help="Seconds per synthetic track.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--network-delay", type=float, default=30, help="Milliseconds added to every fixture response.")
+    parser.add_argument("--switch-delay", type=float, default=50, help="Milliseconds per fake device switch.")
+    parser.add_argument("--command-delay", type=float, default=20, help="Milliseconds per fake pause/play.")
+    parser.add_argument("--log-delay", type=float, default=50, help="Milliseconds from track start to its format log line.")
+    parser.add_argument("--announce-lead", type=float, default=1.5, help="Seconds before the boundary the next format is logged.")
+    parser.add_argument("--save", help="Write the report as JSON, e.g. to use as a baseline.")
+    parser.add_argument("--baseline", help="Compare against a report saved with --save.")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output.")
+    args = parser.parse_args()
+
+    if args.session:
+        with open(args.session) as f:
+            session = json.load(f)
+    else:
+        session = synthetic_session(args.tracks, args.duration, args.seed)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        report = replay(session, args)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from artwork_cache import NEGATIVE_TTL
+from artwork import HEADERS, get_album_video_playlist, get_uncompressed_artwork, lookup_album_id, search_track
+from artistart import get_apple_artist_image
+from hls import Variant, best_variant, variant_from_dict
+from metrics import ARTWORK_FETCH_ERRORS_TOTAL, ARTWORK_FETCH_SECONDS, ARTWORK_RESOLVE_SECONDS
+
+
+def _timed(stage, fn, *args, **kwargs):
+    try:
+        with ARTWORK_FETCH_SECONDS.time(stage=stage):
+            return fn(*args, **kwargs)
+    except Exception:
+        ARTWORK_FETCH_ERRORS_TOTAL.inc(stage=stage)
+        raise
+
+
+@dataclass(frozen=True)
+class AlbumArtwork:
+    album_id: Optional[str]
+    avc: Optional[str] = None
+    hevc: Optional[str] = None
+    artwork: Optional[str] = None
+    # Every variant of the master playlist, so the one to play follows the current settings
+    variants: Tuple[Variant, ...] = ()
+
+
+@dataclass(frozen=True)
+class ArtistArtwork:
+    artist_id: str
+    url: Optional[str] = None
+
+
+class ArtworkResolver:
+    """In-process replacement for running artwork.py / artistart.py as subprocesses.
+
+    All lookups share one keep-alive session pool, and the two independent
+    album chains (album page -> m3u8, and the three-step bendodson chain) run
+    concurrently. With a cache, repeat albums, artists and track lookups are
+    answered without any network calls.
+    """
+
+    def __init__(self, max_workers=6, pool_size=10, cache=None):
+        self.cache = cache
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Only used for the fan-out inside resolve_album, callers bring their own threads
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+
+    def resolve_album_id(self, track_id):
+        if self.cache is not None:
+            hit, album_id = self.cache.get("track", track_id)
+            if hit:
+                return album_id
+        album_id = _timed("track", lookup_album_id, track_id, session=self.session)
+        if self.cache is not None and album_id is not None:
+            self.cache.put("track", track_id, album_id)
+        return album_id
+
+    def search(self, name, artist, album=None):
+        """Store IDs ({"track_id", "album_id", "artist_id"}) for a track known only by name."""
+        key = "\x1f".join([name, artist, album or ""])
+        if self.cache is not None:
+            hit, ids = self.cache.get("search", key)
+            if hit:
+                return ids
+        ids = _timed("search", search_track, name, artist, album, session=self.session)
+        if self.cache is not None and ids is not None:
+            self.cache.put("search", key, ids)
+        return ids
+
+    def resolve_album(self, album_id=None, track_id=None):
+        start = time.perf_counter()
+        if album_id is None and track_id is not None:
+            try:
+                album_id = self.resolve_album_id(track_id)
+            except Exception as e:
+                print(f"Failed to resolve track ID {track_id}: {e}")
+                album_id = None
+            if album_id is None:
+                print(f"No album found for track ID {track_id}.")
+                return AlbumArtwork(album_id=None)
+            print(f"Resolved track ID {track_id} to album ID {album_id}")
+
+        if self.cache is not None:
+            hit, cached = self.cache.get("album", album_id)
+            # Entries cached before variants were stored are fetched again
+            if hit and ("variants" in cached or (cached["avc"] is None and cached["hevc"] is None)):
+                ARTWORK_RESOLVE_SECONDS.observe(time.perf_counter() - start, kind="album", cache="hit")
+                variants = tuple(variant_from_dict(v) for v in cached.get("variants", ()))
+                return AlbumArtwork(album_id=album_id, avc=cached["avc"], hevc=cached["hevc"],
+                                    artwork=cached["artwork"], variants=variants)
+
+        video_future = self.executor.submit(_timed, "video", get_album_video_playlist, album_id, self.session)
+        artwork_future = self.executor.submit(_timed, "artwork", get_uncompressed_artwork, album_id, self.session)
+        video_failed = False
+        try:
+            variants = tuple(video_future.result())
+        except Exception as e:
+            print(f"Failed to fetch animated artwork: {e}")
+            variants = ()
+            video_failed = True
+        avc, hevc = best_variant(variants, "avc"), best_variant(variants, "hevc")
+        artwork = artwork_future.result()
+        # A missing static artwork is almost always a failed fetch, so only cache complete answers
+        if self.cache is not None and artwork is not None and not video_failed:
+            value = {"avc": avc, "hevc": hevc, "artwork": artwork, "variants": [v.to_dict() for v in variants]}
+            # Albums without animated artwork are negative-cached for a shorter time
+            ttl = NEGATIVE_TTL if avc is None and hevc is None else None
+            self.cache.put("album", album_id, value, ttl=ttl)
+        ARTWORK_RESOLVE_SECONDS.observe(time.perf_counter() - start, kind="album", cache="miss")
+        return AlbumArtwork(album_id=album_id, avc=avc, hevc=hevc, artwork=artwork, variants=variants)
+
+    def resolve_artist(self, artist_id):
+        start = time.perf_counter()
+        if self.cache is not None:
+            hit, url = self.cache.get("artist", artist_id)
+            if hit:
+                ARTWORK_RESOLVE_SECONDS.observe(time.perf_counter() - start, kind="artist", cache="hit")
+                return ArtistArtwork(artist_id=artist_id, url=url)
+        try:
+            url = _timed("artist", get_apple_artist_image, artist_id, session=self.session)
+        except Exception as e:
+            print(f"Failed to fetch artist art: {e}")
+            return ArtistArtwork(artist_id=artist_id)
+        if self.cache is not None:
+            self.cache.put("artist", artist_id, url)
+        ARTWORK_RESOLVE_SECONDS.observe(time.perf_counter() - start, kind="artist", cache="miss")
+        return ArtistArtwork(artist_id=artist_id, url=url)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
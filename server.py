@@ -0,0 +1,79 @@
+import logging
+import signal
+import threading
+
+# Threads kept free for /data, artwork and player requests however many streams are open
+RESERVED_THREADS = 8
+
+DEFAULT_SERVER_SETTINGS = {
+    "mode": "development",
+    # Every open /events stream holds one thread, so leave room for several displays plus polling clients
+    "threads": 32,
+    # Open /events streams allowed at once; further clients get a 503 and poll /data instead
+    "max_streams": 16,
+    "connection_limit": 200,
+    "keepalive_timeout": 120,
+}
+
+
+def server_settings(settings):
+    return {**DEFAULT_SERVER_SETTINGS, **settings.get("server", {})}
+
+
+def run_server(app, host, port, settings, on_shutdown=None, stream_slots=0, on_stopping=None):
+    """Serve `app` in the mode chosen under "server" in settings.json.
+
+    "development" is the previous Flask debug server. "production" runs
+    waitress with a fixed thread pool, keep-alive and quiet logging, and
+    calls on_shutdown() on Ctrl+C or SIGTERM so the monitor threads and
+    helper processes stop with it. stream_slots is how many long-lived
+    streams may be open at once; the pool always has RESERVED_THREADS more.
+
+    on_stopping() runs first, straight from the signal handler: waitress
+    waits for its worker threads before run() returns, so open streams
+    have to end before that or every shutdown stalls on them.
+    """
+    config = server_settings(settings)
+    threads = max(config["threads"], stream_slots + RESERVED_THREADS)
+    stopping = threading.Event()
+
+    def stop_streams():
+        if on_stopping is not None and not stopping.is_set():
+            stopping.set()
+            on_stopping()
+
+    def interrupt(signum, frame):
+        stop_streams()
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, interrupt)
+    signal.signal(signal.SIGINT, interrupt)
+    try:
+        if config["mode"] != "production":
+            werkzeug_log = logging.getLogger('werkzeug')
+            werkzeug_log.setLevel(logging.DEBUG)  # Enable GET logs
+            app.run(debug=True, use_reloader=False, host=host, port=port, threaded=True)
+            return
+
+        from waitress import create_server
+        # waitress writes no per-request access log; keep its own chatter to warnings
+        logging.getLogger('waitress').setLevel(logging.WARNING)
+        server = create_server(
+            app,
+            host=host,
+            port=port,
+            threads=threads,
+            connection_limit=config["connection_limit"],
+            channel_timeout=config["keepalive_timeout"],
+            ident="spezi",
+        )
+        print(f"🚀 Serving on http://{host}:{port} ({threads} threads)")
+        # waitress handles KeyboardInterrupt itself and returns from run()
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("\n👋 Shutting down")
+        stop_streams()
+        if on_shutdown is not None:
+            on_shutdown()
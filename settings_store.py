@@ -0,0 +1,185 @@
+import json
+import os
+import tempfile
+import threading
+
+
+class SettingsError(ValueError):
+    pass
+
+
+SERVER_MODES = ("development", "production")
+SWITCHER_BACKENDS = ("coreaudio", "helper", "fake")
+DEVICE_BACKENDS = ("coreaudio", "poll", "mock")
+ANIMATED_CODECS = ("auto", "avc", "hevc")
+AUDIO_SOURCES = ("sounddevice", "synthetic")
+LYRICS_SOURCES = ("local", "lrclib")
+MUSIC_BACKENDS = ("scriptingbridge", "fake")
+
+
+def _check(condition, message):
+    if not condition:
+        raise SettingsError(message)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_settings(data):
+    """Raises SettingsError if `data` doesn't match what the app expects in settings.json."""
+    _check(isinstance(data, dict), "settings must be an object")
+    if "port" in data:
+        _check(isinstance(data["port"], int) and 0 < data["port"] < 65536, "port must be an integer between 1 and 65535")
+    if "default_visualizer" in data:
+        _check(isinstance(data["default_visualizer"], str) and data["default_visualizer"].endswith(".js"),
+               "default_visualizer must be a .js file name")
+    if "open_browser" in data:
+        _check(isinstance(data["open_browser"], bool), "open_browser must be true or false")
+    if "sample_rate_match" in data:
+        match = data["sample_rate_match"]
+        _check(isinstance(match, dict), "sample_rate_match must be an object")
+        _check(isinstance(match.get("enabled", False), bool), "sample_rate_match.enabled must be true or false")
+        mapping = match.get("mapping", {})
+        _check(isinstance(mapping, dict), "sample_rate_match.mapping must be an object")
+        for source, target in mapping.items():
+            try:
+                source_khz = float(source)
+            except ValueError:
+                raise SettingsError(f"sample_rate_match.mapping key {source!r} is not a rate in kHz")
+            _check(source_khz > 0, f"sample_rate_match.mapping key {source!r} must be positive")
+            _check(_is_number(target) and target > 0,
+                   f"sample_rate_match.mapping[{source!r}] must be a positive rate in kHz")
+    if "server" in data:
+        server = data["server"]
+        _check(isinstance(server, dict), "server must be an object")
+        _check(server.get("mode", "development") in SERVER_MODES, f"server.mode must be one of {SERVER_MODES}")
+        for key in ("threads", "max_streams", "connection_limit", "keepalive_timeout"):
+            if key in server:
+                _check(isinstance(server[key], int) and server[key] > 0, f"server.{key} must be a positive integer")
+    if "animated_artwork" in data:
+        animated = data["animated_artwork"]
+        _check(isinstance(animated, dict), "animated_artwork must be an object")
+        _check(animated.get("codec", "auto") in ANIMATED_CODECS, f"animated_artwork.codec must be one of {ANIMATED_CODECS}")
+        for key in ("max_resolution", "cache_megabytes"):
+            if key in animated:
+                _check(isinstance(animated[key], int) and animated[key] > 0,
+                       f"animated_artwork.{key} must be a positive integer")
+        _check(isinstance(animated.get("proxy", True), bool), "animated_artwork.proxy must be true or false")
+    if "audio_features" in data:
+        audio = data["audio_features"]
+        _check(isinstance(audio, dict), "audio_features must be an object")
+        _check(isinstance(audio.get("enabled", False), bool), "audio_features.enabled must be true or false")
+        _check(audio.get("source", "sounddevice") in AUDIO_SOURCES, f"audio_features.source must be one of {AUDIO_SOURCES}")
+        device = audio.get("device")
+        _check(device is None or isinstance(device, (str, int)), "audio_features.device must be a device name, index or null")
+        if "max_clients" in audio:
+            _check(isinstance(audio["max_clients"], int) and audio["max_clients"] > 0,
+                   "audio_features.max_clients must be a positive integer")
+        for key in ("bands", "fps"):
+            if key in audio:
+                _check(isinstance(audio[key], int) and 0 < audio[key] <= 256, f"audio_features.{key} must be an integer from 1 to 256")
+    if "lyrics" in data:
+        lyrics = data["lyrics"]
+        _check(isinstance(lyrics, dict), "lyrics must be an object")
+        _check(isinstance(lyrics.get("enabled", True), bool), "lyrics.enabled must be true or false")
+        sources = lyrics.get("sources", list(LYRICS_SOURCES))
+        _check(isinstance(sources, list) and all(s in LYRICS_SOURCES for s in sources),
+               f"lyrics.sources must be a list of {LYRICS_SOURCES}")
+        _check(isinstance(lyrics.get("directory", "lyrics"), str), "lyrics.directory must be a path")
+    if "switcher_backend" in data:
+        _check(data["switcher_backend"] in SWITCHER_BACKENDS, f"switcher_backend must be one of {SWITCHER_BACKENDS}")
+    if "music_backend" in data:
+        _check(data["music_backend"] in MUSIC_BACKENDS, f"music_backend must be one of {MUSIC_BACKENDS}")
+    if "device_backend" in data:
+        _check(data["device_backend"] in DEVICE_BACKENDS, f"device_backend must be one of {DEVICE_BACKENDS}")
+
+
+def compile_rate_mapping(data):
+    """Builds {source Hz: target Hz} from sample_rate_match, or None if matching is disabled.
+
+    Keys are kHz strings ("44.1", "96"), so they are converted once here
+    rather than on every switch.
+    """
+    match = data.get("sample_rate_match", {})
+    if not match.get("enabled", False):
+        return None
+    return {
+        round(float(source) * 1000): round(target * 1000)
+        for source, target in match.get("mapping", {}).items()
+    }
+
+
+class SettingsService:
+    """settings.json cached in memory.
+
+    get() re-reads the file only when its mtime changes. save() validates,
+    writes a temp file and renames it over settings.json, so readers never
+    see a truncated file. The sample-rate mapping is compiled on every
+    load, and map_rate() only uses that table, never the disk.
+    """
+
+    def __init__(self, path="settings.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = {}
+        self.rate_table = None
+        self.get()
+
+    def _load(self, mtime):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        validate_settings(data)
+        self._data = data
+        self.rate_table = compile_rate_mapping(data)
+        self._mtime = mtime
+
+    def get(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self._data
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self._load(mtime)
+                    except (ValueError, OSError) as e:
+                        # Keep serving the last good settings if the file was edited into a broken state
+                        print(f"⚠️ Ignoring invalid {self.path}: {e}")
+                        self._mtime = mtime
+        return self._data
+
+    def save(self, data):
+        validate_settings(data)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".settings.", suffix=".tmp")
+            try:
+                # mkstemp creates 0600; keep the mode settings.json already had
+                try:
+                    mode = os.stat(self.path).st_mode & 0o777
+                except FileNotFoundError:
+                    mode = 0o644
+                os.fchmod(fd, mode)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._data = data
+            self.rate_table = compile_rate_mapping(data)
+            self._mtime = os.stat(self.path).st_mtime_ns
+        return data
+
+    def map_rate(self, sample_rate):
+        """Returns (target Hz, mapped) for a source rate in Hz."""
+        table = self.rate_table
+        if table is None:
+            return sample_rate, False
+        target = table.get(round(sample_rate))
+        if target is None:
+            return sample_rate, False
+        return target, True
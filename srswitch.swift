@@ -4,13 +4,14 @@ import Foundation
 import CoreAudio
 
 // MARK: - Parse Command-Line Argument
-guard CommandLine.arguments.count > 1,
-      let argRate = Double(CommandLine.arguments[1]) else {
-    print("Usage: ./test.swift <sampleRate>   (e.g. 44100, 96000)")
+// ./srswitch.swift <sampleRate>   switch once and exit
+// ./srswitch.swift --serve        read one rate per line from stdin, answer "OK <rate>" or "ERR <reason>"
+guard CommandLine.arguments.count > 1 else {
+    print("Usage: ./test.swift <sampleRate>   (e.g. 44100, 96000) | --serve")
     exit(1)
 }
 
-let desiredSampleRate: Float64 = argRate
+let serveMode = CommandLine.arguments[1] == "--serve"
 
 // MARK: - Helpers
 
@@ -80,8 +81,47 @@ func getCurrentSampleRate(deviceID: AudioDeviceID) -> Float64? {
     return status == noErr ? rate : nil
 }
 
+// Wait until the device reports the requested rate
+func waitForSampleRate(deviceID: AudioDeviceID, sampleRate: Float64, timeout: TimeInterval = 1.0) -> Float64? {
+    let deadline = Date().addingTimeInterval(timeout)
+    var current = getCurrentSampleRate(deviceID: deviceID)
+    while let rate = current, abs(rate - sampleRate) > 0.5, Date() < deadline {
+        usleep(5_000)
+        current = getCurrentSampleRate(deviceID: deviceID)
+    }
+    return current
+}
+
 // MARK: - Execution
 
+if serveMode {
+    while let line = readLine() {
+        guard let rate = Double(line.trimmingCharacters(in: .whitespaces)) else {
+            print("ERR bad rate \(line)")
+            fflush(stdout)
+            continue
+        }
+        if let deviceID = getDefaultOutputDeviceID() {
+            if setSampleRate(deviceID: deviceID, sampleRate: rate),
+               let confirmed = waitForSampleRate(deviceID: deviceID, sampleRate: rate),
+               abs(confirmed - rate) <= 0.5 {
+                print("OK \(confirmed)")
+            } else {
+                print("ERR failed to set \(rate)")
+            }
+        } else {
+            print("ERR no default output device")
+        }
+        fflush(stdout)
+    }
+    exit(0)
+}
+
+guard let desiredSampleRate = Double(CommandLine.arguments[1]) else {
+    print("Usage: ./test.swift <sampleRate>   (e.g. 44100, 96000) | --serve")
+    exit(1)
+}
+
 if let deviceID = getDefaultOutputDeviceID() {
     let success = setSampleRate(deviceID: deviceID, sampleRate: desiredSampleRate)
     if success {
@@ -91,4 +131,4 @@ if let deviceID = getDefaultOutputDeviceID() {
     }
 } else {
     print("❌ Could not get default output device ID")
-}
\ No newline at end of file
+}
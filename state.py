@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+from types import MappingProxyType
+
+
+class Snapshot:
+    """One immutable version of the app state. Sections are read-only mappings."""
+
+    __slots__ = ("version", "sections", "_rendered")
+
+    def __init__(self, version, sections):
+        self.version = version
+        self.sections = sections
+        self._rendered = {}
+
+    def __getitem__(self, section):
+        return self.sections[section]
+
+    def get(self, section, default=None):
+        return self.sections.get(section, default)
+
+
+class StateStore:
+    """Copy-on-write store for current_info / nowplaying_info / device_info.
+
+    Writers copy the section they touch, build a new Snapshot and publish it
+    with a single attribute assignment, so readers just grab `store.snapshot`
+    and never lock or see a half-updated dict. Each write bumps the version,
+    which doubles as the /data ETag. Serialised JSON is cached per snapshot.
+    """
+
+    def __init__(self, **sections):
+        # Versions restart at 0 on every launch; the boot id keeps old ETags from matching
+        self.boot_id = os.urandom(4).hex()
+        self._write_lock = threading.Lock()
+        self.snapshot = Snapshot(0, {name: MappingProxyType(dict(data)) for name, data in sections.items()})
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def etag(self, snapshot=None):
+        snapshot = snapshot or self.snapshot
+        return f'"{self.boot_id}-{snapshot.version}"'
+
+    def _commit(self, changes):
+        # changes: section -> new plain dict
+        current = self.snapshot
+        if all(dict(current.sections.get(name, {})) == data for name, data in changes.items()):
+            return current
+        sections = dict(current.sections)
+        for name, data in changes.items():
+            sections[name] = MappingProxyType(data)
+        self.snapshot = Snapshot(current.version + 1, sections)
+        return self.snapshot
+
+    def update(self, section, **values):
+        """Set keys in one section."""
+        with self._write_lock:
+            data = dict(self.snapshot.sections.get(section, {}))
+            data.update(values)
+            return self._commit({section: data})
+
+    def update_with(self, section, fn):
+        """Apply fn(dict) -> dict to a copy of one section, for read-modify-write changes."""
+        with self._write_lock:
+            data = fn(dict(self.snapshot.sections.get(section, {})))
+            return self._commit({section: data})
+
+    def replace(self, section, data):
+        with self._write_lock:
+            return self._commit({section: dict(data)})
+
+    def discard(self, section, *keys):
+        with self._write_lock:
+            data = dict(self.snapshot.sections.get(section, {}))
+            for key in keys:
+                data.pop(key, None)
+            return self._commit({section: data})
+
+    def render_json(self, build_fn, snapshot=None):
+        """json.dumps(build_fn(snapshot)), computed once per snapshot version."""
+        snapshot = snapshot or self.snapshot
+        body = snapshot._rendered.get(build_fn)
+        if body is None:
+            body = json.dumps(build_fn(snapshot), default=_plain)
+            snapshot._rendered[build_fn] = body
+        return body
+
+
+def _plain(value):
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,316 @@
+import hashlib
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from metrics import HELPER_RESTARTS_TOTAL, HELPER_UP, STARTUP_PHASE_SECONDS
+
+HELPER_CACHE_DIR = "helper_cache"
+
+
+def swift_command(source, cache_dir=HELPER_CACHE_DIR, compiler=("swiftc", "-O")):
+    """Command that runs a Swift script, compiled once and cached by content hash.
+
+    `swift script.swift` recompiles on every launch; this runs
+    `swiftc -O` once per version of the source (and CPU architecture) and
+    reuses the binary until the script changes. Falls back to the
+    interpreter when there is no compiler or the build fails.
+    """
+    with open(source, "rb") as f:
+        digest = hashlib.sha256(f.read() + platform.machine().encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(source))[0]
+    binary = os.path.join(os.path.abspath(cache_dir), f"{name}-{digest}")
+    if os.path.exists(binary):
+        return [binary]
+    if shutil.which(compiler[0]) is None:
+        return ["swift", source]
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{binary}.{os.getpid()}.tmp"
+    start = time.perf_counter()
+    result = subprocess.run([*compiler, source, "-o", tmp_path], capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.exists(tmp_path):
+        print(f"⚠️ Compiling {os.path.basename(source)} failed, running it with swift: {result.stderr.strip()[:300]}")
+        return ["swift", source]
+    os.replace(tmp_path, binary)
+    # Older builds of the same helper are never used again
+    for entry in os.listdir(cache_dir):
+        if entry.startswith(name + "-") and entry != os.path.basename(binary):
+            try:
+                os.unlink(os.path.join(cache_dir, entry))
+            except OSError:
+                pass
+    print(f"🔨 Compiled {os.path.basename(source)} in {time.perf_counter() - start:.1f} s")
+    return [binary]
+
+
+class Helper:
+    """One supervised helper process.
+
+    command is a list or a callable returning one (e.g. swift_command, so
+    compiling happens on the supervisor's thread). With on_line, stdout is
+    read line by line and the first line counts as ready; otherwise ready
+    is a probe polled until it returns True, or the helper is ready as soon
+    as it has been spawned.
+    """
+
+    def __init__(self, name, command, on_line=None, ready=None, ready_timeout=10.0):
+        self.name = name
+        self.command = command
+        self.on_line = on_line
+        self.ready = ready
+        self.ready_timeout = ready_timeout
+        self.process = None
+        self.state = "stopped"
+        self.starts = 0
+        self.last_exit = None
+        # Epoch seconds of the latest launch, comparable with file mtimes in ready probes
+        self.started_at = None
+        self.prepare_seconds = None
+        self.ready_seconds = None
+        self.ready_event = threading.Event()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "pid": self.process.pid if self.process is not None and self.process.poll() is None else None,
+            "starts": self.starts,
+            "restarts": max(self.starts - 1, 0),
+            "last_exit": self.last_exit,
+            "prepare_seconds": self.prepare_seconds,
+            "ready_seconds": self.ready_seconds,
+        }
+
+
+class Supervisor:
+    """Starts helpers in parallel, restarts crashed ones with exponential backoff, stops them all on exit.
+
+    The delay before a restart doubles with every crash (backoff ..
+    max_backoff) and resets once a helper has stayed up for stable_after
+    seconds, so a helper that dies at launch doesn't spin while one that
+    crashes once a day restarts right away.
+    """
+
+    def __init__(self, backoff=0.5, max_backoff=30.0, stable_after=30.0, grace=2.0):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.grace = grace
+        self.helpers = {}
+        self.started_at = None
+        self._stopping = threading.Event()
+
+    def add(self, helper):
+        self.helpers[helper.name] = helper
+        return helper
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for helper in self.helpers.values():
+            threading.Thread(target=self._supervise, args=(helper,), name=f"helper-{helper.name}", daemon=True).start()
+        return self
+
+    def wait_ready(self, timeout=None):
+        """True once every helper has become ready (at least once) within timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for helper in self.helpers.values():
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not helper.ready_event.wait(remaining):
+                return False
+        return True
+
+    def _mark_ready(self, helper):
+        if helper.state == "starting":
+            helper.state = "ready"
+            HELPER_UP.set(1, helper=helper.name)
+        if not helper.ready_event.is_set():
+            helper.ready_seconds = time.monotonic() - self.started_at
+            helper.ready_event.set()
+
+    def _probe(self, helper, process):
+        deadline = time.monotonic() + helper.ready_timeout
+        while process.poll() is None and not self._stopping.is_set():
+            try:
+                if helper.ready is None or helper.ready(helper):
+                    self._mark_ready(helper)
+                    return
+            except Exception:
+                pass
+            if time.monotonic() >= deadline:
+                print(f"⚠️ {helper.name} helper not ready after {helper.ready_timeout:g} s")
+                return
+            time.sleep(0.05)
+
+    def _launch(self, helper):
+        if callable(helper.command):
+            start = time.perf_counter()
+            command = helper.command()
+            if helper.prepare_seconds is None:
+                helper.prepare_seconds = time.perf_counter() - start
+        else:
+            command = helper.command
+        return subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE if helper.on_line else None,
+            bufsize=1,
+            text=True,
+            # Out of the terminal's process group: Ctrl+C reaches main.py, which stops helpers in order
+            start_new_session=True
+        )
+
+    def _supervise(self, helper):
+        failures = 0
+        while not self._stopping.is_set():
+            helper.state = "starting"
+            started = time.monotonic()
+            try:
+                process = self._launch(helper)
+            except Exception as e:
+                print(f"❌ Could not start {helper.name} helper: {e}")
+                process = None
+            if process is not None:
+                if self._stopping.is_set():
+                    # stop() ran while this helper was still compiling or spawning
+                    process.terminate()
+                helper.process = process
+                helper.started_at = time.time()
+                helper.starts += 1
+                if helper.on_line is None:
+                    self._probe(helper, process)
+                    process.wait()
+                else:
+                    for line in process.stdout:
+                        self._mark_ready(helper)
+                        try:
+                            helper.on_line(line)
+                        except Exception as e:
+                            print(f"⚠️ {helper.name} helper output not handled: {e}")
+                    process.wait()
+                helper.last_exit = process.returncode
+            HELPER_UP.set(0, helper=helper.name)
+            if self._stopping.is_set():
+                break
+            if time.monotonic() - started >= self.stable_after:
+                failures = 0
+            delay = min(self.backoff * 2 ** failures, self.max_backoff)
+            failures += 1
+            helper.state = "backoff"
+            HELPER_RESTARTS_TOTAL.inc(helper=helper.name)
+            reason = "failed to start" if process is None else f"exited with {helper.last_exit}"
+            print(f"⚠️ {helper.name} helper {reason}, restarting in {delay:g} s")
+            self._stopping.wait(delay)
+        helper.state = "stopped"
+
+    def status(self):
+        return {name: helper.status() for name, helper in self.helpers.items()}
+
+    def stop(self):
+        self._stopping.set()
+        running = [h.process for h in self.helpers.values() if h.process is not None and h.process.poll() is None]
+        for process in running:
+            process.terminate()
+        for process in running:
+            try:
+                process.wait(timeout=self.grace)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class StartupTimer:
+    """Wall time of each startup phase, measured from one mark() to the next."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        seconds = now - self._last
+        self._last = now
+        self.phases.append((phase, seconds))
+        STARTUP_PHASE_SECONDS.set(seconds, phase=phase)
+        return seconds
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def report(self, supervisor=None):
+        parts = [f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases]
+        lines = [f"⏱️ Startup took {self.total * 1000:.0f} ms: " + ", ".join(parts)]
+        if supervisor is not None:
+            for name, status in supervisor.status().items():
+                ready = "not ready" if status["ready_seconds"] is None else f"ready after {status['ready_seconds'] * 1000:.0f} ms"
+                prepare = "" if not status["prepare_seconds"] else f" (build {status['prepare_seconds'] * 1000:.0f} ms)"
+                lines.append(f"   {name}: {ready}{prepare}")
+        return "\n".join(lines)
+
+
+def _stand_in(args):
+    # Behaves like device.py: optional startup delay, then one line per tick, optionally crashing
+    import argparse
+    parser = argparse.ArgumentParser(description="Stand-in helper process for supervisor tests.")
+    parser.add_argument("--ready-after", type=float, default=0.0)
+    parser.add_argument("--crash-after", type=float, default=None)
+    parser.add_argument("--interval", type=float, default=0.2)
+    options = parser.parse_args(args)
+    time.sleep(options.ready_after)
+    start = time.monotonic()
+    while True:
+        print(f'{{"pid": {os.getpid()}, "uptime": {time.monotonic() - start:.2f}}}', flush=True)
+        if options.crash_after is not None and time.monotonic() - start >= options.crash_after:
+            sys.exit(3)
+        time.sleep(options.interval)
+
+
+def _stand_in_compiler(args):
+    # Accepts swiftc's "<source> -o <binary>" and writes a binary that runs the stand-in helper
+    output = args[args.index("-o") + 1]
+    time.sleep(0.3)
+    with open(output, "w") as f:
+        f.write(f"#!/bin/sh\nexec {sys.executable} {os.path.abspath(__file__)} --stand-in \"$@\"\n")
+    os.chmod(output, 0o755)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--stand-in"]:
+        _stand_in(sys.argv[2:])
+        sys.exit(0)
+    if sys.argv[1:2] == ["--stand-in-compiler"]:
+        _stand_in_compiler(sys.argv[2:])
+        sys.exit(0)
+
+    # Demo: supervise stand-ins on any OS, including a "Swift" helper built by a stand-in compiler
+    import tempfile
+    timer = StartupTimer()
+    workdir = tempfile.mkdtemp(prefix="spezi-supervisor-")
+    source = os.path.join(workdir, "helper.swift")
+    with open(source, "w") as f:
+        f.write("print(\"hello\")\n")
+    compiler = (sys.executable, os.path.abspath(__file__), "--stand-in-compiler")
+    stand_in = [sys.executable, os.path.abspath(__file__), "--stand-in"]
+    cache_dir = os.path.join(workdir, "cache")
+
+    supervisor = Supervisor(backoff=0.2, stable_after=2.0)
+    supervisor.add(Helper("compiled", lambda: swift_command(source, cache_dir, compiler) + ["--ready-after", "0.1"],
+                          on_line=lambda line: None))
+    supervisor.add(Helper("slow", stand_in + ["--ready-after", "0.5"], on_line=lambda line: None))
+    supervisor.add(Helper("crashy", stand_in + ["--crash-after", "0.1"], on_line=lambda line: None))
+    timer.mark("setup")
+    supervisor.start()
+    print(f"all ready: {supervisor.wait_ready(timeout=5)}")
+    timer.mark("helpers")
+    print(timer.report(supervisor))
+    time.sleep(3)
+    supervisor.stop()
+    for name, status in supervisor.status().items():
+        print(f"{name}: {status['starts']} starts, last exit {status['last_exit']}")
+    cached = swift_command(source, cache_dir, compiler)
+    start = time.perf_counter()
+    swift_command(source, cache_dir, compiler)
+    print(f"cached binary {os.path.basename(cached[0])}, lookup {(time.perf_counter() - start) * 1e6:.0f} us")
+    shutil.rmtree(workdir)
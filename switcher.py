@@ -0,0 +1,224 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from supervisor import swift_command
+
+# Time the helper gets on top of the switch timeout to answer before it counts as hung
+HELPER_REPLY_SLACK = 0.5
+
+
+class CoreAudioBackend:
+    """Switches the default output device in-process through the ctypes bindings in device.py."""
+
+    name = "coreaudio"
+
+    def __init__(self):
+        # Imported here so the rest of the switcher stays importable off macOS
+        import device
+        if device.core_audio is None or device.CoreAudio is None:
+            raise RuntimeError("CoreAudio is not available")
+        self._device = device
+
+    def set_rate(self, sample_rate, timeout=1.0):
+        device_id = self._device.get_default_output_device_id()
+        if not self._device.set_nominal_sample_rate(device_id, sample_rate):
+            return None
+        # The property set returns before the hardware has switched; wait for it to report the new rate
+        deadline = time.monotonic() + timeout
+        while True:
+            current = self._device.get_nominal_sample_rate(device_id)
+            if current is not None and abs(current - sample_rate) <= 0.5:
+                return current
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.005)
+
+    def close(self):
+        pass
+
+
+class SwiftHelperBackend:
+    """Keeps one `srswitch.swift --serve` process alive and talks to it over its stdin/stdout pipe.
+
+    Replies are read on a separate thread, so a hung helper costs at most
+    timeout + HELPER_REPLY_SLACK; it is then killed and started again.
+    """
+
+    name = "helper"
+
+    def __init__(self, command=None):
+        # Compiled once and cached instead of recompiling the script on every launch
+        self.command = list(command) if command else swift_command(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "srswitch.swift")) + ["--serve"]
+        self._process = None
+        self._replies = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                bufsize=1,
+                text=True
+            )
+            # One queue per process, so a late reply from a killed helper can't answer a later request
+            self._replies = queue.Queue()
+            threading.Thread(target=self._read_replies, args=(self._process, self._replies),
+                             name="srswitch-reader", daemon=True).start()
+
+    @staticmethod
+    def _read_replies(process, replies):
+        for line in process.stdout:
+            replies.put(line.strip())
+        replies.put(None)
+
+    def _kill(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+        self._process = None
+
+    def set_rate(self, sample_rate, timeout=1.0):
+        with self._lock:
+            try:
+                self._ensure_running()
+                self._process.stdin.write(f"{sample_rate}\n")
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                self._kill()
+                return None
+            try:
+                reply = self._replies.get(timeout=timeout + HELPER_REPLY_SLACK)
+            except queue.Empty:
+                print(f"❌ srswitch helper did not answer within {timeout + HELPER_REPLY_SLACK:g} s, restarting it")
+                self._kill()
+                try:
+                    self._ensure_running()
+                except OSError as e:
+                    print(f"❌ Could not restart srswitch helper: {e}")
+                return None
+            if reply is None:
+                # Exited mid-request; started again on the next switch
+                self._process = None
+                reply = ""
+        if reply.startswith("OK"):
+            return float(reply.split()[1])
+        print(f"❌ srswitch helper: {reply or 'no reply'}")
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.stdin.close()
+                self._process.terminate()
+            self._process = None
+
+
+class FakeBackend:
+    """Stand-in device for Linux: records every switch and takes switch_delay seconds per change."""
+
+    name = "fake"
+
+    def __init__(self, sample_rate=44100.0, switch_delay=0.0):
+        self.sample_rate = sample_rate
+        self.switch_delay = switch_delay
+        self.calls = []
+
+    def set_rate(self, sample_rate, timeout=1.0):
+        self.calls.append(sample_rate)
+        if self.switch_delay:
+            time.sleep(self.switch_delay)
+        self.sample_rate = float(sample_rate)
+        return self.sample_rate
+
+    def close(self):
+        pass
+
+
+class FakePlayer:
+    """Pause/play recorder with the same transport interface as music.py's backends."""
+
+    def __init__(self, command_delay=0.0):
+        self.command_delay = command_delay
+        self.state = "playing"
+        self.calls = []
+
+    def pause(self):
+        if self.command_delay:
+            time.sleep(self.command_delay)
+        self.calls.append("pause")
+        self.state = "paused"
+
+    def play(self):
+        if self.command_delay:
+            time.sleep(self.command_delay)
+        self.calls.append("play")
+        self.state = "playing"
+
+
+BACKENDS = {
+    "coreaudio": CoreAudioBackend,
+    "helper": SwiftHelperBackend,
+    "fake": FakeBackend,
+}
+
+
+def make_backend(name="coreaudio"):
+    try:
+        return BACKENDS[name]()
+    except Exception as e:
+        if name == "helper":
+            raise
+        # No CoreAudio bindings available (or not on a Mac): fall back to the helper process
+        print(f"⚠️ {name} switcher unavailable ({e}), using srswitch helper")
+        return SwiftHelperBackend()
+
+
+class SampleRateSwitcher:
+    """Long-lived switcher: pause -> switch (confirmed) -> resume, with per-stage timings."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.last_timings = None
+
+    def switch(self, sample_rate, timeout=1.0):
+        return self.backend.set_rate(sample_rate, timeout=timeout)
+
+    def pause_switch_resume(self, player, sample_rate, timeout=1.0):
+        """Returns (confirmed_rate or None, timings in seconds)."""
+        start = time.perf_counter()
+        player.pause()
+        paused = time.perf_counter()
+        confirmed = None
+        try:
+            confirmed = self.backend.set_rate(sample_rate, timeout=timeout)
+        finally:
+            switched = time.perf_counter()
+            # Resume even if the switch wasn't confirmed (or failed), silence is worse than a wrong rate
+            player.play()
+            resumed = time.perf_counter()
+        self.last_timings = {
+            "pause": paused - start,
+            "switch": switched - paused,
+            "resume": resumed - switched,
+            "total": resumed - start,
+        }
+        return confirmed, self.last_timings
+
+    def close(self):
+        self.backend.close()
+
+
+if __name__ == "__main__":
+    # Time the pause -> switch -> resume sequence against the fake backend
+    player = FakePlayer(command_delay=0.01)
+    switcher = SampleRateSwitcher(FakeBackend(switch_delay=0.02))
+    for rate in (44100, 96000, 48000, 192000):
+        confirmed, timings = switcher.pause_switch_resume(player, rate)
+        print(f"{rate} Hz -> confirmed {confirmed} Hz: " +
+              ", ".join(f"{k} {v * 1000:.1f} ms" for k, v in timings.items()))
+    print(f"player calls: {player.calls}")